@@ -44,7 +44,7 @@ CORS(app, resources={
     r"/api/*": {
         "origins": default_cors_origins,
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
     }
 })
 
@@ -83,11 +83,17 @@ app.register_blueprint(insights_bp, url_prefix='/api/insights')
 app.register_blueprint(meetings_bp, url_prefix='/api/meetings')
 app.register_blueprint(storage_bp, url_prefix='/api/storage')
 
+# Keep per-org emission coefficient profiles (settings collection) in memory
+if db is not None:
+    from utils.coefficient_profiles import start_profile_listener
+    start_profile_listener()
+
 # Background Gmail poller (short-term fix for delayed inbound tracking)
 def start_gmail_poller(poll_interval_seconds: int = 60):
     """Start a background thread that polls Gmail for new messages for
     all users with stored Google tokens. This is a short-term measure to
-    reduce inbound tracking delay. For production, prefer Gmail push/history.
+    reduce inbound tracking delay. Each pass reads only the Gmail history
+    since the user's last checkpoint (see utils.gmail_sync).
     """
     import threading
     import time
@@ -103,11 +109,9 @@ def start_gmail_poller(poll_interval_seconds: int = 60):
                     try:
                         user_id = doc.id
                         # Import here to avoid circular import at module load
-                        from routes.oauth_google import sync_gmail_for_user
-                        # Poll recent messages (last ~15 minutes) with small page
-                        # days_back accepts fractional days (0.011 ~= 15.8 minutes)
-                        result = sync_gmail_for_user(user_id, days_back=0.011, max_results=50)
-                        print(f"[Gmail Poller] Synced {user_id}: {result.get('processed',0)} processed")
+                        from utils.gmail_sync import sync_gmail_incremental
+                        result = sync_gmail_incremental(user_id)
+                        print(f"[Gmail Poller] Synced {user_id} ({result.get('mode')}): {result.get('processed',0)} processed, {result.get('failed',0)} failed")
                     except Exception as e:
                         print(f"[Gmail Poller] Error syncing user {doc.id}: {e}")
             except Exception as e:
@@ -169,6 +173,13 @@ def debug_activities_count():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Debug endpoint for sync dedupe filter effectiveness
+@app.route('/api/debug/seen-filters', methods=['GET'])
+def debug_seen_filters():
+    """Per-provider seen-filter lookups, observed false-positive rate and reads saved"""
+    from utils.seen_filter import seen_filter_metrics
+    return jsonify({'providers': seen_filter_metrics()}), 200
+
 # Root endpoint
 @app.route('/', methods=['GET'])
 def root():
@@ -0,0 +1,282 @@
+"""
+Benchmark activity payload validation.
+
+Compares the compiled validator (validate_activity_payload / validate_many)
+with the previous implementation, kept below as ``legacy_validate``: first
+checks both produce identical results (or identical errors) for a corpus of
+valid, edge-case and invalid payloads, then reports the per-payload cost.
+
+    python -m benchmarks.activity_validation --payloads 100000
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from utils.activity_validator import (
+    ALLOWED_ACTIVITY_TYPES,
+    ALLOWED_PROVIDERS,
+    DEFAULT_EXTENSION_VERSION,
+    DEFAULT_MODE,
+    ActivityValidationError,
+    validate_activity_payload,
+    validate_many,
+)
+
+USER = {'id': 'u-1', 'email': 'Alice@Example.com'}
+
+CASES: List[Any] = [
+    {'activityType': 'email', 'provider': 'gmail', 'timestamp': '2024-05-01T10:15:30.123Z', 'user': USER,
+     'subject': ' Weekly update ', 'recipients': ['a@x.com', ' b@x.com ', ''], 'attachmentCount': 2,
+     'attachmentBytes': 2_500_000, 'direction': 'Outbound', 'sender': 'alice@example.com', 'metadata': {'k': 1}},
+    {'activityType': ' EMAIL ', 'timestamp': '2024-05-01T10:15:30+02:00', 'user_email': 'bob@example.com',
+     'recipients': 'a@x.com, b@x.com,,', 'attachmentBytes': '1200', 'direction': ''},
+    {'activityType': 'email', 'timestamp': '2024-05-01T10:15:30', 'metadata': {'account_email': ' carol@example.com '},
+     'attachmentCount': 'x', 'attachmentBytes': 3.9, 'direction': 5, 'recipients': 7, 'subject': 12},
+    {'activityType': 'email', 'timestamp': '2024-05-01 10:15:30Z', 'user': {'id': 5, 'email': ''}, 'user_email': 'd@e.com'},
+    {'activityType': 'email', 'timestamp': '2024-05-01T10Z', 'attachmentCount': True},
+    {'activityType': 'meeting', 'provider': 'GOOGLE_MEET', 'timestamp': '2024-05-01T09:00:00.000Z', 'user': USER,
+     'title': 'Standup', 'durationMinutes': 15, 'participantsCount': 8, 'hasVideo': False},
+    {'activityType': 'meeting', 'timestamp': '2024-05-01T09:00:00Z', 'durationMinutes': '45', 'participantsCount': None,
+     'hasVideo': None, 'platform': 'microsoft_teams'},
+    {'activityType': 'meeting', 'timestamp': '2024-05-01T09:00:00Z', 'durationMinutes': 12.7, 'platform': ''},
+    {'activityType': 'storage', 'provider': 'onedrive', 'timestamp': '2024-05-01T08:00:00Z', 'action': 'upload',
+     'sizeMb': 12, 'totalStorageGb': '40.5', 'daysStored': '30', 'mode': ' sync ', 'extensionVersion': '1.2.3'},
+    {'activityType': 'storage', 'timestamp': '2024-05-01T08:00:00Z', 'sizeMb': 'big', 'totalStorageGb': [], 'daysStored': 1.5},
+    {'activityType': 'browsing', 'timestamp': '2024-05-01T07:30:00-05:00', 'site': 'example.com', 'category': 'news',
+     'durationMinutes': 30, 'metadata': 'not a dict', 'mode': 3},
+    {'activityType': 'browsing', 'timestamp': ' 2024-05-01T07:30:00Z ', 'platform': 'custom-platform'},
+    # Invalid payloads: both implementations must raise the same error
+    [],
+    {},
+    {'activityType': ''},
+    {'activityType': 'fax', 'timestamp': '2024-05-01T07:30:00Z'},
+    {'activityType': 'email', 'provider': 'yahoo'},
+    {'activityType': 'email', 'timestamp': 'yesterday'},
+    {'activityType': 'email', 'timestamp': 'Z'},
+    {'activityType': 'email', 'timestamp': '2024-13-01T00:00:00Z'},
+    {'activityType': 'email', 'timestamp': '2024-05-01T10:00:00+01:00Z'},
+]
+
+
+def _outcome(validate, payload):
+    try:
+        return 'ok', validate(payload)
+    except ActivityValidationError as exc:
+        return 'error', str(exc)
+
+
+def check_equivalence() -> int:
+    mismatches = 0
+    batch = validate_many(CASES)
+    for index, payload in enumerate(CASES):
+        expected = _outcome(legacy_validate, payload)
+        actual = _outcome(lambda item: validate_activity_payload(item).to_dict(), payload)
+        record, error = batch[index]
+        batched = ('ok', record.to_dict()) if record is not None else ('error', str(error))
+        if actual != expected or batched != expected:
+            mismatches += 1
+            print(f"MISMATCH case {index}:\n  legacy:   {expected}\n  compiled: {actual}\n  batch:    {batched}")
+    return mismatches
+
+
+def per_payload_us(func, payloads, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(payloads)
+        best = min(best, time.perf_counter() - started)
+    return best / len(payloads) * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Activity validation benchmark.')
+    parser.add_argument('--payloads', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    mismatches = check_equivalence()
+    print(f"equivalence: {len(CASES) - mismatches}/{len(CASES)} cases identical")
+
+    # Extension traffic (UTC 'Z' timestamps) and the full mix of valid edge cases
+    mixes = {'typical': [CASES[0], CASES[5], CASES[8], CASES[11]], 'edge cases': CASES[:12]}
+    for label, mix in mixes.items():
+        payloads = [mix[index % len(mix)] for index in range(args.payloads)]
+        legacy_us = per_payload_us(lambda items: [legacy_validate(item) for item in items], payloads, args.repeat)
+        compiled_us = per_payload_us(lambda items: [validate_activity_payload(item) for item in items], payloads, args.repeat)
+        many_us = per_payload_us(validate_many, payloads, args.repeat)
+        print(f"{label}:")
+        print(f"  legacy validate_activity_payload:   {legacy_us:.2f} us/payload")
+        print(f"  compiled validate_activity_payload: {compiled_us:.2f} us/payload ({legacy_us / compiled_us:.1f}x)")
+        print(f"  validate_many:                      {many_us:.2f} us/payload ({legacy_us / many_us:.1f}x)")
+    return 1 if mismatches else 0
+
+
+# --- Previous implementation, for comparison ---------------------------------
+
+def legacy_validate(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """validate_activity_payload() before the compiled validator, returning to_dict()."""
+    if not isinstance(payload, dict):
+        raise ActivityValidationError('Payload must be a JSON object')
+
+    activity_type = _require_string(payload, 'activityType').lower()
+    if activity_type not in ALLOWED_ACTIVITY_TYPES:
+        raise ActivityValidationError(f'Unsupported activityType: {activity_type}')
+
+    provider = _optional_string(payload, 'provider', '').lower()
+    if provider and provider not in ALLOWED_PROVIDERS:
+        raise ActivityValidationError(f'Unsupported provider: {provider}')
+    elif not provider:
+        provider = _infer_provider(activity_type, payload)
+
+    platform = _optional_string(payload, 'platform', provider)
+    mode = _optional_string(payload, 'mode', DEFAULT_MODE)
+    extension_version = _optional_string(payload, 'extensionVersion', DEFAULT_EXTENSION_VERSION)
+
+    timestamp = _parse_timestamp(_optional_string(payload, 'timestamp', ''))
+
+    user_info = payload.get('user')
+    user_id: Optional[str] = None
+    user_email: Optional[str] = None
+    if isinstance(user_info, dict):
+        user_id = _optional_string(user_info, 'id', None)
+        user_email = _optional_string(user_info, 'email', None)
+    # Also check for top-level user_email (from extension)
+    if not user_email:
+        user_email = _optional_string(payload, 'user_email', None)
+    # Also check metadata for account_email
+    if not user_email:
+        metadata_temp = payload.get('metadata')
+        if isinstance(metadata_temp, dict):
+            user_email = _optional_string(metadata_temp, 'account_email', None)
+
+    metadata = payload.get('metadata') if isinstance(payload.get('metadata'), dict) else {}
+    normalized_payload = _normalize_activity_details(activity_type, payload)
+
+    return dict(
+        activity_type=activity_type,
+        provider=provider,
+        timestamp=timestamp,
+        platform=platform,
+        mode=mode,
+        extension_version=extension_version,
+        user_id=user_id,
+        user_email=user_email,
+        payload=normalized_payload,
+        metadata=metadata,
+    )
+
+
+def _normalize_activity_details(activity_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    if activity_type == 'email':
+        direction = _optional_string(payload, 'direction', 'outbound')
+        direction = direction.lower() if direction else 'outbound'
+        return {
+            'subject': _optional_string(payload, 'subject', ''),
+            'recipients': _normalize_recipients(payload.get('recipients')),
+            'body_preview': _optional_string(payload, 'bodyPreview', ''),
+            'attachment_count': _optional_int(payload, 'attachmentCount', 0),
+            'attachment_bytes': _optional_int(payload, 'attachmentBytes', 0),
+            'direction': direction,
+            'sender': _optional_string(payload, 'sender', ''),
+        }
+
+    if activity_type == 'meeting':
+        return {
+            'title': _optional_string(payload, 'title', ''),
+            'duration_minutes': _optional_int(payload, 'durationMinutes', 0),
+            'participants_count': _optional_int(payload, 'participantsCount', 1),
+            'has_video': bool(payload.get('hasVideo', True)),
+        }
+
+    if activity_type == 'storage':
+        return {
+            'action': _optional_string(payload, 'action', ''),
+            'size_mb': _optional_float(payload, 'sizeMb', 0.0),
+            'total_storage_gb': _optional_float(payload, 'totalStorageGb', 0.0),
+            'days_stored': _optional_int(payload, 'daysStored', 0),
+        }
+
+    if activity_type == 'browsing':
+        return {
+            'site': _optional_string(payload, 'site', ''),
+            'category': _optional_string(payload, 'category', ''),
+            'duration_minutes': _optional_int(payload, 'durationMinutes', 0),
+        }
+
+    return {}
+
+
+def _normalize_recipients(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    if isinstance(value, str):
+        return [entry.strip() for entry in value.split(',') if entry.strip()]
+    return []
+
+
+def _parse_timestamp(value: str) -> datetime:
+    if not value:
+        return datetime.utcnow()
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            return dt
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    except ValueError as exc:
+        raise ActivityValidationError('timestamp must be in ISO 8601 format') from exc
+
+
+def _require_string(container: Dict[str, Any], key: str) -> str:
+    value = container.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise ActivityValidationError(f'Missing or invalid {key}')
+    return value.strip()
+
+
+def _optional_string(container: Dict[str, Any], key: str, default: Optional[str]) -> Optional[str]:
+    value = container.get(key)
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip()
+    return default
+
+
+def _optional_int(container: Dict[str, Any], key: str, default: int) -> int:
+    value = container.get(key)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _optional_float(container: Dict[str, Any], key: str, default: float) -> float:
+    value = container.get(key)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _infer_provider(activity_type: str, payload: Dict[str, Any]) -> str:
+    platform = _optional_string(payload, 'platform', '')
+    if platform:
+        return platform
+    if activity_type == 'email':
+        return 'gmail'
+    if activity_type == 'meeting':
+        return 'google_meet'
+    if activity_type == 'storage':
+        return 'google_drive'
+    return 'web'
+
+
+if __name__ == '__main__':
+    sys.exit(main())
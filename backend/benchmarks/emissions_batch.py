@@ -0,0 +1,93 @@
+"""
+Benchmark calculate_emissions_batch() against the scalar calculate_activity_emission().
+
+Generates a synthetic mix of activities, computes every row both ways,
+checks they agree to 6 decimal places and reports rows/second.
+
+    python -m benchmarks.emissions_batch --rows 1000000
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from utils.emissions import ACTIVITY_TYPE_CODES, calculate_activity_emission, calculate_emissions_batch
+
+TYPES = ('email', 'meeting', 'storage', 'browsing', 'pdf_reading', 'streaming')
+
+
+def synthetic_columns(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    names = rng.choice(TYPES, size=rows, p=[0.55, 0.15, 0.1, 0.1, 0.05, 0.05])
+    return {
+        'type_codes': np.array([ACTIVITY_TYPE_CODES[name] for name in names], dtype=np.int8),
+        'attachment_mb': np.round(rng.exponential(0.8, rows) * (rng.random(rows) < 0.3), 3),
+        'recipients': rng.integers(1, 12, rows).astype(np.float64),
+        'minutes': rng.integers(0, 180, rows).astype(np.float64),
+        'has_video': rng.random(rows) < 0.7,
+        'participants': rng.integers(1, 25, rows).astype(np.float64),
+        'storage_gb': np.round(rng.random(rows) * 40, 2),
+        'days': rng.integers(0, 365, rows).astype(np.float64),
+        'upload_mb': np.round(rng.exponential(5, rows), 2),
+    }, names
+
+
+def scalar_emissions(columns, names):
+    out = np.empty(len(names))
+    for row, name in enumerate(names):
+        if name == 'email':
+            value = calculate_activity_emission(
+                'email',
+                attachment_size_mb=float(columns['attachment_mb'][row]),
+                recipients_count=float(columns['recipients'][row]),
+            )
+        elif name == 'meeting':
+            value = calculate_activity_emission(
+                'meeting',
+                duration_minutes=float(columns['minutes'][row]),
+                has_video=bool(columns['has_video'][row]),
+                participants_count=float(columns['participants'][row]),
+            )
+        elif name == 'storage':
+            value = calculate_activity_emission(
+                'storage',
+                upload_size_mb=float(columns['upload_mb'][row]),
+                storage_gb=float(columns['storage_gb'][row]),
+                days_stored=float(columns['days'][row]),
+            )
+        else:
+            value = calculate_activity_emission(name, duration_minutes=float(columns['minutes'][row]))
+        out[row] = value
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Scalar vs NumPy emission calculation benchmark.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    columns, names = synthetic_columns(args.rows, args.seed)
+
+    started = time.perf_counter()
+    batch = calculate_emissions_batch(**columns)
+    batch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scalar = scalar_emissions(columns, names)
+    scalar_seconds = time.perf_counter() - started
+
+    max_diff = float(np.max(np.abs(batch - scalar))) if args.rows else 0.0
+    print(f"rows:   {args.rows:,}")
+    print(f"scalar: {scalar_seconds:.3f}s ({args.rows / scalar_seconds:,.0f} rows/s)")
+    print(f"batch:  {batch_seconds:.3f}s ({args.rows / batch_seconds:,.0f} rows/s)")
+    print(f"speedup: {scalar_seconds / batch_seconds:.1f}x, max abs difference: {max_diff:.2e}")
+
+    np.testing.assert_almost_equal(batch, scalar, decimal=6)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
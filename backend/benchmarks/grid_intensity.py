@@ -0,0 +1,86 @@
+"""
+Benchmark grid carbon-intensity lookups.
+
+Builds a synthetic (region × hour-of-year) table, reports the cost of one
+scalar lookup and of calculate_activity_emission() with and without the
+grid factor, then checks the batch calculator matches the scalar one with
+factors applied.
+
+    python -m benchmarks.grid_intensity --regions 60 --lookups 200000
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.emissions_batch import scalar_emissions, synthetic_columns
+from utils.emissions import calculate_activity_emission, calculate_emissions_batch
+from utils.grid_intensity import HOURS_PER_YEAR, GridIntensityTable, hour_of_year, set_grid_table
+
+
+def synthetic_table(regions, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(HOURS_PER_YEAR)
+    base = rng.uniform(30, 900, size=(regions, 1))
+    daily = 1 + 0.25 * np.sin(2 * np.pi * (hours % 24) / 24)
+    intensities = base * daily * rng.uniform(0.9, 1.1, size=(regions, HOURS_PER_YEAR))
+    return GridIntensityTable([f'R{code:03d}' for code in range(regions)], intensities, version='synthetic')
+
+
+def per_call_us(func, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Grid carbon-intensity lookup benchmark.')
+    parser.add_argument('--regions', type=int, default=60)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    table = synthetic_table(args.regions, args.seed)
+    timestamp = datetime(2024, 7, 14, 15, 30)
+    region = table.regions[-1]
+
+    lookup_us = per_call_us(lambda: table.factor(region, timestamp), args.lookups)
+    set_grid_table(None)
+    flat_us = per_call_us(lambda: calculate_activity_emission('email', attachment_size_mb=1.5, recipients_count=3), args.lookups)
+    set_grid_table(table)
+    scaled_us = per_call_us(
+        lambda: calculate_activity_emission('email', timestamp=timestamp, region=region, attachment_size_mb=1.5, recipients_count=3),
+        args.lookups,
+    )
+
+    # Batch vs scalar agreement with per-row factors
+    columns, names = synthetic_columns(args.rows, args.seed)
+    rng = np.random.default_rng(args.seed)
+    region_codes = rng.integers(0, args.regions, args.rows)
+    start = datetime(2024, 1, 1)
+    timestamps = [start + timedelta(hours=int(hour)) for hour in rng.integers(0, HOURS_PER_YEAR, args.rows)]
+    hours = np.array([hour_of_year(ts) for ts in timestamps])
+    factors = table.factors(region_codes, hours)
+    started = time.perf_counter()
+    batch = calculate_emissions_batch(**columns, grid_factors=factors)
+    batch_seconds = time.perf_counter() - started
+    set_grid_table(None)
+    scalar = np.round(scalar_emissions(columns, names) * factors, 6)
+
+    print(f"regions: {args.regions}, table size: {len(table.regions) * HOURS_PER_YEAR * 8 / 1e6:.1f} MB")
+    print(f"factor lookup:                {lookup_us:.2f} us")
+    print(f"email emission (flat):        {flat_us:.2f} us")
+    print(f"email emission (grid factor): {scaled_us:.2f} us (+{scaled_us - flat_us:.2f} us)")
+    print(f"batch with factors: {args.rows:,} rows in {batch_seconds:.3f}s")
+
+    np.testing.assert_almost_equal(batch, scalar, decimal=6)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Benchmark the what-if simulation behind POST /api/insights/simulate.
+
+Generates a year of synthetic activities for one user, builds the emission
+columns once and times simulate_scenarios() with the maximum number of
+scenarios (the interactive budget is 200 ms).
+
+    python -m benchmarks.simulate --per-day 150
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils.emissions import activity_emission_columns
+from utils.scenarios import MAX_SCENARIOS, SCENARIO_TYPES, parse_scenarios, simulate_scenarios
+
+
+def synthetic_year(per_day, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = per_day * 365
+    start = datetime(2024, 1, 1)
+    types = rng.choice(['email', 'meeting', 'storage', 'browsing'], size=rows, p=[0.6, 0.15, 0.1, 0.15])
+    activities = []
+    for row, activity_type in enumerate(types):
+        if activity_type == 'email':
+            payload = {
+                'recipients': ['x'] * int(rng.integers(1, 12)),
+                'attachment_bytes': int(rng.exponential(2_000_000)) if rng.random() < 0.3 else 0,
+            }
+        elif activity_type == 'meeting':
+            payload = {
+                'duration_minutes': int(rng.integers(5, 120)),
+                'has_video': bool(rng.random() < 0.7),
+                'participants_count': int(rng.integers(2, 20)),
+            }
+        elif activity_type == 'storage':
+            payload = {'size_mb': float(rng.exponential(10)), 'total_storage_gb': float(rng.random() * 40), 'days_stored': 30}
+        else:
+            payload = {'duration_minutes': int(rng.integers(1, 90))}
+        activities.append({
+            'activity_type': activity_type,
+            'timestamp': start + timedelta(minutes=row * 1440 // per_day),
+            'payload': payload,
+        })
+    return activities
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='What-if simulation benchmark.')
+    parser.add_argument('--per-day', type=int, default=150)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    activities = synthetic_year(args.per_day)
+    started = time.perf_counter()
+    columns = activity_emission_columns(activities)
+    columns_seconds = time.perf_counter() - started
+
+    types = list(SCENARIO_TYPES)
+    raw = [{'type': types[index % len(types)]} for index in range(MAX_SCENARIOS - 1)]
+    raw.append({'name': 'all', 'changes': [{'type': scenario_type} for scenario_type in types]})
+    scenarios = parse_scenarios(raw)
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = simulate_scenarios(columns, scenarios)
+        timings.append(time.perf_counter() - started)
+
+    print(f"activities: {len(activities):,} (one year), scenarios: {len(scenarios)}")
+    print(f"column build (once per load): {columns_seconds * 1000:.1f} ms")
+    print(f"simulation: best {min(timings) * 1000:.1f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms")
+    best = max(result['scenarios'], key=lambda scenario: scenario['savingsKg'])
+    print(f"baseline {result['baselineEmissionKg']:.1f} kg, best scenario '{best['name']}' saves {best['savingsPct']}%")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Benchmark the staged sync pipeline (utils.pipeline) against the sequential
+list -> fetch -> write loop it replaced, with simulated API latencies.
+
+Each chunk is one Gmail batch request (--fetch-ms) and one BulkWriter flush
+(--write-ms); each direction lists --pages pages (--list-ms each). Reports
+wall time and the peak number of chunks held in memory.
+
+    python -m benchmarks.sync_pipeline --pages 20 --fetch-workers 2
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from utils.pipeline import run_pipeline
+
+DIRECTIONS = ('outbound', 'inbound')
+
+
+class _Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.written = 0
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.written += 1
+
+
+def sequential(args, tracker):
+    for _ in DIRECTIONS:
+        chunks = []
+        for page in range(args.pages):
+            time.sleep(args.list_ms / 1000)
+            chunks.append(page)
+            tracker.enter()
+        for _ in chunks:
+            time.sleep(args.fetch_ms / 1000)
+            time.sleep(args.build_ms / 1000)
+            time.sleep(args.write_ms / 1000)
+            tracker.leave()
+
+
+def staged(args, tracker):
+    def source(emit):
+        for page in range(args.pages):
+            time.sleep(args.list_ms / 1000)
+            tracker.enter()
+            emit(page)
+
+    def stage(delay_ms, last=False):
+        def work(chunk):
+            time.sleep(delay_ms / 1000)
+            if last:
+                tracker.leave()
+                return None
+            return chunk
+        return lambda: work
+
+    run_pipeline(
+        [source for _ in DIRECTIONS],
+        [
+            (stage(args.fetch_ms), args.fetch_workers),
+            (stage(args.build_ms), args.build_workers),
+            (stage(args.write_ms, last=True), args.write_workers),
+        ],
+        queue_size=args.queue_chunks,
+        name='Benchmark',
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Staged vs sequential sync pipeline benchmark.')
+    parser.add_argument('--pages', type=int, default=20, help='100-message chunks listed per direction')
+    parser.add_argument('--list-ms', type=float, default=150)
+    parser.add_argument('--fetch-ms', type=float, default=400)
+    parser.add_argument('--build-ms', type=float, default=30)
+    parser.add_argument('--write-ms', type=float, default=250)
+    parser.add_argument('--fetch-workers', type=int, default=2)
+    parser.add_argument('--build-workers', type=int, default=1)
+    parser.add_argument('--write-workers', type=int, default=2)
+    parser.add_argument('--queue-chunks', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    for name, runner in (('sequential', sequential), ('staged', staged)):
+        tracker = _Tracker()
+        started = time.perf_counter()
+        runner(args, tracker)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>10}: {elapsed:.2f}s for {tracker.written} chunks, peak {tracker.peak} chunks in memory")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Offline maintenance jobs.
+Run from the backend directory, e.g. ``python -m jobs.rebuild_rollups --help``.
+"""
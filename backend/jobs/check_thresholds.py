@@ -0,0 +1,43 @@
+"""
+Fleet-wide threshold evaluation.
+
+Streams the period's daily rollups once, computes team and org averages and
+distribution sketches (stored in ``teams``) and writes every user's alerts
+to ``alerts/{user}_{period}``. Meant to run on a schedule (e.g. nightly cron).
+
+    python -m jobs.check_thresholds --period weekly
+"""
+
+import argparse
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from utils.firebase_config import initialize_firebase
+from utils.insights import PERIOD_DAYS
+from utils.thresholds import run_threshold_job
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Evaluate insight thresholds for every active user.')
+    parser.add_argument('--period', choices=sorted(PERIOD_DAYS), default='weekly', help='Evaluation window')
+    parser.add_argument('--dry-run', action='store_true', help='Evaluate without writing alerts or team averages')
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    initialize_firebase()
+
+    started = time.time()
+    stats = run_threshold_job(args.period, dry_run=args.dry_run)
+    print(
+        f"[Thresholds] {args.period}: {stats['users']} users from {stats['rollups']} rollups, "
+        f"{stats['alerts']} alerts for {stats['users_alerted']} users, "
+        f"{stats['teams']} teams, {stats['orgs']} orgs in {time.time() - started:.1f}s"
+        + (' (dry run)' if args.dry_run else '')
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
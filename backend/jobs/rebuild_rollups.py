@@ -0,0 +1,57 @@
+"""
+Rebuild daily rollups from raw activities.
+
+Backfills rollups for activities stored before rollups existed and repairs
+drift. Rebuilt days are overwritten and rollups left without activities in
+the range are deleted.
+
+    python -m jobs.rebuild_rollups --user alice@example.com --since 2024-01-01
+"""
+
+import argparse
+import sys
+from datetime import date
+
+from dotenv import load_dotenv
+
+from utils.firebase_config import initialize_firebase
+from utils.rollups import rebuild_rollups
+
+
+def _parse_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f'Invalid date (expected YYYY-MM-DD): {value}') from exc
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Rebuild daily_rollups from the activities collection.')
+    parser.add_argument('--user', dest='user_email', help='Only rebuild this user email')
+    parser.add_argument('--user-id', dest='user_id', help='Only rebuild this user ID')
+    parser.add_argument('--since', type=_parse_day, help='First UTC day to rebuild (YYYY-MM-DD)')
+    parser.add_argument('--until', type=_parse_day, help='Last UTC day to rebuild (YYYY-MM-DD)')
+    parser.add_argument('--page-size', type=int, default=500, help='Activities read per request')
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    initialize_firebase()
+
+    scope = args.user_email or args.user_id or 'all users'
+    print(f"[Rollups] Rebuilding daily rollups for {scope} ({args.since or 'beginning'} .. {args.until or 'now'})")
+    stats = rebuild_rollups(
+        user_email=args.user_email,
+        user_id=args.user_id,
+        since=args.since,
+        until=args.until,
+        page_size=max(1, args.page_size),
+    )
+    print(
+        f"[Rollups] Done: {stats['activities']} activities, "
+        f"{stats['rollups_written']} rollups written, {stats['rollups_deleted']} stale rollups deleted"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
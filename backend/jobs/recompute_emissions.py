@@ -0,0 +1,59 @@
+"""
+Recompute stored activity emissions with a coefficient version.
+
+Pages through ``activities`` in document-ID order, recomputes emissions in
+bulk and rewrites changed documents together with their user-totals and
+daily-rollup corrections. Progress is checkpointed in
+``job_checkpoints/emission_recompute_{version}``, so an interrupted run
+resumes where it stopped.
+
+    python -m jobs.recompute_emissions --version v1 --rate 200
+"""
+
+import argparse
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from utils.emission_recompute import recompute_emissions
+from utils.emissions import EMISSION_COEFFICIENT_VERSIONS, EMISSION_VERSION
+from utils.firebase_config import initialize_firebase
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Recompute activity emissions with a coefficient version.')
+    parser.add_argument('--version', choices=sorted(EMISSION_COEFFICIENT_VERSIONS), default=EMISSION_VERSION,
+                        help='Coefficient set to apply (default: current)')
+    parser.add_argument('--page-size', type=int, default=500, help='Activities read per request')
+    parser.add_argument('--rate', type=float, default=200.0, help='Max activities per second (0 = unthrottled)')
+    parser.add_argument('--max-docs', type=int, default=None, help='Stop after about this many activities')
+    parser.add_argument('--include-client', action='store_true', help='Also recompute client-computed emissions')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the beginning')
+    parser.add_argument('--dry-run', action='store_true', help='Compute without writing anything')
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    initialize_firebase()
+
+    started = time.time()
+    stats = recompute_emissions(
+        version=args.version,
+        page_size=max(1, args.page_size),
+        max_docs_per_second=args.rate,
+        include_client=args.include_client,
+        restart=args.restart,
+        max_docs=args.max_docs,
+        dry_run=args.dry_run,
+    )
+    print(
+        f"[Emission Recompute] {args.version}: {stats['scanned']} scanned, {stats['updated']} updated, "
+        f"{stats['restamped']} restamped, {stats['skipped']} skipped in {time.time() - started:.1f}s"
+        + ('' if stats['completed'] else ' (incomplete, rerun to resume)')
+        + (' (dry run)' if args.dry_run else '')
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,22 +5,89 @@ Handles activity ingestion, validation, emission calculation, and retrieval.
 
 from __future__ import annotations
 
+import atexit
+import csv
+import io
+import json
+import os
+import threading
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
 
-from flask import Blueprint, jsonify, request
-from google.cloud import firestore
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from google.api_core.exceptions import AlreadyExists
 
+from utils.activity_queries import (
+    apply_page_token,
+    build_activities_query,
+    encode_page_token,
+    parse_field_projection,
+    stream_query_pages,
+)
+from utils.activity_summary import SUMMARY_FIELDS, ActivitySummaryBuilder, activity_day
 from utils.activity_validator import (
     ActivityValidationError,
     NormalizedActivity,
     validate_activity_payload,
+    validate_many,
+)
+from utils.coefficient_profiles import coefficients_for, grid_region_for
+from utils.emissions import (
+    CLIENT_EMISSION_VERSION,
+    EMISSION_VERSION,
+    activity_emission_columns,
+    calculate_activity_emission,
+    calculate_emissions_batch,
 )
-from utils.emissions import calculate_activity_emission
 from utils.firebase_config import get_collection, get_db
+from utils.idempotency import (
+    IDEMPOTENCY_HEADER,
+    LRUCache,
+    activity_document_id,
+    normalize_idempotency_key,
+    payload_fingerprint,
+)
+from utils.ingest_queue import IngestQueue, IngestQueueFull
+from utils.rollups import iter_rollup_days, record_rollups, rollup_last_activity, rollups_query
+from utils.user_totals import apply_user_totals, fold_user_totals, read_user_totals
 
 activities_bp = Blueprint('activities', __name__)
 
+# Upper bound for POST /log/batch; one Firestore commit holds at most 500 writes
+MAX_BATCH_SIZE = 500
+FIRESTORE_MAX_BATCH_WRITES = 500
+# Largest page GET /api/activities returns; longer histories are paged with pageToken
+MAX_PAGE_SIZE = 2000
+# Firestore page size used while streaming exports
+EXPORT_PAGE_SIZE = 500
+# Columns of a CSV export when no fields= projection is given
+DEFAULT_EXPORT_COLUMNS = [
+    'timestamp',
+    'activity_type',
+    'provider',
+    'user_email',
+    'emission_kg',
+    'payload.direction',
+    'payload.recipients',
+    'payload.attachment_count',
+    'payload.attachment_bytes',
+    'payload.duration_minutes',
+    'payload.participants_count',
+    'payload.has_video',
+    'payload.action',
+    'payload.size_mb',
+    'payload.total_storage_gb',
+]
+
+# Opt-in write-behind mode: /log answers 202 and background workers persist in batches
+ASYNC_INGEST = os.getenv('ASYNC_INGEST', 'False').lower() in ('1', 'true', 'yes')
+
+_ingest_queue: Optional[IngestQueue] = None
+_ingest_queue_lock = threading.Lock()
+
+# activity document ID -> (response body, status) for recently ingested activities
+_recent_ingest_responses = LRUCache(int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000)))
+
 
 @activities_bp.route('/log', methods=['POST', 'OPTIONS'])
 def log_activity():
@@ -49,44 +116,39 @@ def log_activity():
         return _error(str(exc)), 400
 
     try:
-        # Prefer client-provided emission when available (extension pre-computes on hover/send)
-        emission_kg = None
-        try:
-            # Accept various possible keys from client
-            if raw_payload.get('emission_kg') is not None:
-                emission_kg = float(raw_payload.get('emission_kg'))
-                print(f"[Activities API] Using client-provided emission_kg: {emission_kg} kg")
-            elif raw_payload.get('emissionKg') is not None:
-                emission_kg = float(raw_payload.get('emissionKg'))
-                print(f"[Activities API] Using client-provided emissionKg: {emission_kg} kg")
-            elif raw_payload.get('emission_g') is not None:
-                emission_kg = float(raw_payload.get('emission_g')) / 1000.0
-                print(f"[Activities API] Using client-provided emission_g: {raw_payload.get('emission_g')} g -> {emission_kg} kg")
-            elif raw_payload.get('emissionG') is not None:
-                emission_kg = float(raw_payload.get('emissionG')) / 1000.0
-                print(f"[Activities API] Using client-provided emissionG: {raw_payload.get('emissionG')} g -> {emission_kg} kg")
-        except Exception as e:
-            print(f"[Activities API] Warning: could not parse client emission value: {e}")
-
-        if emission_kg is None or emission_kg == 0:
-            emission_kg = _calculate_emission(normalized)
-            print(f"[Activities API] Emission calculated: {emission_kg}kg")
-        else:
-            # ensure numeric float
-            emission_kg = float(emission_kg)
-        
-        activity_doc = _build_activity_document(normalized, emission_kg, raw_payload)
+        idempotency_key = normalize_idempotency_key(request.headers.get(IDEMPOTENCY_HEADER)) or payload_fingerprint(normalized)
+    except ActivityValidationError as exc:
+        return _error(str(exc)), 400
+    activity_id = activity_document_id(normalized, idempotency_key)
+
+    # Retries of a recently seen request get the original response without touching Firestore
+    cached = _recent_ingest_responses.get(activity_id)
+    if cached:
+        print(f"[Activities API] Duplicate activity short-circuited: {activity_id}")
+        body, status = cached
+        return jsonify(body), status
+
+    try:
+        emission_kg, emission_version = _resolve_emission_kg(normalized, raw_payload)
+
+        activity_doc = _build_activity_document(normalized, emission_kg, raw_payload, emission_version)
         print(f"[Activities API] Activity document built: activity_type={activity_doc.get('activity_type')}, user_email={activity_doc.get('user_email')}, timestamp={activity_doc.get('timestamp')}")
-        
-        activity_id = _persist_activity(activity_doc)
-        print(f"[Activities API] Activity persisted to Firebase: {activity_id}")
-        
-        # Update user totals (non-blocking - errors are logged but don't fail the request)
-        try:
-            _update_user_totals(activity_doc)
-        except Exception as totals_exc:
-            print(f"[Activities API] Warning: Failed to update user totals (non-fatal): {totals_exc}")
-        
+
+        if ASYNC_INGEST:
+            return _enqueue_activity(activity_id, activity_doc)
+
+        created = _create_activities([activity_id], [activity_doc])[0]
+        if isinstance(created, Exception):
+            raise created
+        if created:
+            print(f"[Activities API] Activity persisted to Firebase: {activity_id}")
+            # Update user totals and daily rollups (errors are logged but don't fail the request)
+            _record_aggregates([activity_doc])
+        else:
+            # Already stored by an earlier attempt: answer with what that attempt stored
+            emission_kg = _stored_emissions([activity_id]).get(activity_id, emission_kg)
+            print(f"[Activities API] Duplicate activity ignored: {activity_id}")
+
         print(f"[Activities API] Activity logged successfully: {activity_id}, email: {normalized.user_email}, emission: {emission_kg}kg")
     except Exception as exc:  # pylint: disable=broad-except
         print(f"[Activities API] ERROR storing activity: {exc}")
@@ -96,17 +158,210 @@ def log_activity():
         traceback.print_exc()
         return _error('Failed to store activity', details=f"{type(exc).__name__}: {str(exc)}"), 500
 
-    return jsonify({
+    body = {
         'success': True,
         'activityId': activity_id,
         'emissionKg': emission_kg,
         'message': 'Activity logged successfully',
-    }), 201
+    }
+    _recent_ingest_responses.put(activity_id, (body, 201))
+    return jsonify(body), 201
+
+
+@activities_bp.route('/log/batch', methods=['POST', 'OPTIONS'])
+def log_activity_batch():
+    """Ingest many activities in one request (e.g. a drained extension queue).
+
+    Accepts either a JSON array of activity payloads or an object with an
+    ``activities`` array. Valid items are written with Firestore write
+    batches and user totals are folded into a single update per user.
+    Every item gets its own entry in ``results`` (matched by ``index``).
+    """
+    if request.method == 'OPTIONS':
+        return _cors_preflight_response()
+
+    body = request.get_json(silent=True)
+    raw_payloads = body.get('activities') if isinstance(body, dict) else body
+    if not isinstance(raw_payloads, list):
+        return _error('Request body must be a JSON array of activities'), 400
+    if not raw_payloads:
+        return _error('No activities provided'), 400
+    if len(raw_payloads) > MAX_BATCH_SIZE:
+        return _error(f'Too many activities in one batch (max {MAX_BATCH_SIZE})'), 413
+
+    print(f"[Activities API] Received batch log request: {len(raw_payloads)} activities")
+
+    request_key = request.headers.get(IDEMPOTENCY_HEADER)
+    results: List[Dict[str, Any]] = [{} for _ in raw_payloads]
+    pending: Dict[str, List[int]] = {}
+    pending_items: Dict[str, tuple] = {}
+    for index, (raw_payload, (normalized, validation_error)) in enumerate(zip(raw_payloads, validate_many(raw_payloads))):
+        if isinstance(validation_error, ActivityValidationError):
+            results[index] = {'index': index, 'success': False, 'error': str(validation_error)}
+            continue
+        if validation_error is not None:
+            print(f"[Activities API] Error preparing batch item {index}: {validation_error}")
+            results[index] = {'index': index, 'success': False, 'error': f"{type(validation_error).__name__}: {str(validation_error)}"}
+            continue
+        try:
+            # Per-item key, else the request key scoped by position, else a content fingerprint
+            item_key = normalize_idempotency_key(raw_payload.get('idempotencyKey'))
+            if not item_key and request_key:
+                item_key = f'{normalize_idempotency_key(request_key)}:{index}'
+            activity_id = activity_document_id(normalized, item_key or payload_fingerprint(normalized))
+
+            cached = _recent_ingest_responses.get(activity_id)
+            if cached:
+                cached_body, _ = cached
+                results[index] = {'index': index, 'success': True, 'activityId': activity_id, 'emissionKg': cached_body['emissionKg']}
+                continue
+            if activity_id not in pending_items:
+                pending_items[activity_id] = (normalized, raw_payload, _client_emission_kg(raw_payload))
+        except ActivityValidationError as exc:
+            results[index] = {'index': index, 'success': False, 'error': str(exc)}
+            continue
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[Activities API] Error preparing batch item {index}: {exc}")
+            results[index] = {'index': index, 'success': False, 'error': f"{type(exc).__name__}: {str(exc)}"}
+            continue
+        pending.setdefault(activity_id, []).append(index)
+
+    # Emissions for every item without a client-provided value, one vectorized pass per coefficient profile
+    def fail_item(activity_id: str, exc: Exception) -> None:
+        for index in pending.pop(activity_id, []):
+            results[index] = {'index': index, 'success': False, 'error': f"{type(exc).__name__}: {str(exc)}"}
+
+    by_profile: Dict[str, Tuple[Any, List[str]]] = {}
+    for activity_id, (normalized, _, client_kg) in pending_items.items():
+        if not client_kg:
+            try:
+                coefficients, stamp = coefficients_for(normalized.user_email)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[Activities API] Error loading coefficients for batch item {activity_id}: {exc}")
+                fail_item(activity_id, exc)
+                continue
+            by_profile.setdefault(stamp, (coefficients, []))[1].append(activity_id)
+    calculated: Dict[str, Tuple[float, str]] = {}
+    for stamp, (coefficients, activity_ids) in by_profile.items():
+        try:
+            emissions = _batch_emissions(pending_items, activity_ids, coefficients)
+        except Exception as exc:  # pylint: disable=broad-except
+            # One bad item fails the vectorized pass; isolate it by calculating items one by one
+            print(f"[Activities API] Batch emission pass failed ({exc}), calculating {len(activity_ids)} items individually")
+            emissions = []
+            for activity_id in activity_ids:
+                try:
+                    emissions.extend(_batch_emissions(pending_items, [activity_id], coefficients))
+                except Exception as item_exc:  # pylint: disable=broad-except
+                    fail_item(activity_id, item_exc)
+                    emissions.append(None)
+        calculated.update(
+            (activity_id, (emission_kg, stamp))
+            for activity_id, emission_kg in zip(activity_ids, emissions)
+            if emission_kg is not None
+        )
+    pending_docs = {}
+    for activity_id, (normalized, raw_payload, client_kg) in pending_items.items():
+        if activity_id not in pending:
+            continue
+        try:
+            emission_kg, emission_version = (float(client_kg), CLIENT_EMISSION_VERSION) if client_kg else calculated[activity_id]
+            pending_docs[activity_id] = _build_activity_document(normalized, emission_kg, raw_payload, emission_version)
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[Activities API] Error building batch item {activity_id}: {exc}")
+            fail_item(activity_id, exc)
+
+    stored_docs = []
+    if pending_docs:
+        activity_ids = list(pending_docs)
+        created_flags = _create_activities(activity_ids, [pending_docs[activity_id] for activity_id in activity_ids])
+
+        existing_ids = [activity_id for activity_id, created in zip(activity_ids, created_flags) if created is False]
+        stored_emissions = _stored_emissions(existing_ids) if existing_ids else {}
+        for activity_id, created in zip(activity_ids, created_flags):
+            if isinstance(created, Exception):
+                # Not stored: the client retries these items, nothing is cached
+                fail_item(activity_id, created)
+                continue
+            activity_doc = pending_docs[activity_id]
+            if created:
+                stored_docs.append(activity_doc)
+            emission_kg = activity_doc['emission_kg'] if created else stored_emissions.get(activity_id, activity_doc['emission_kg'])
+            _recent_ingest_responses.put(activity_id, ({
+                'success': True,
+                'activityId': activity_id,
+                'emissionKg': emission_kg,
+                'message': 'Activity logged successfully',
+            }, 201))
+            for index in pending[activity_id]:
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'activityId': activity_id,
+                    'emissionKg': emission_kg,
+                }
+
+        # Everything created so far, even when a later chunk failed
+        _record_aggregates(stored_docs)
+
+    failed = sum(1 for result in results if not result.get('success'))
+    stored = len(raw_payloads) - failed
+    print(f"[Activities API] Batch logged: stored={stored}, new={len(stored_docs)}, failed={failed}")
+
+    if not stored:
+        status = 500 if pending_items else 400
+    elif failed:
+        status = 207
+    else:
+        status = 201
+    return jsonify({
+        'success': bool(stored),
+        'count': stored,
+        'failed': failed,
+        'results': results,
+    }), status
+
+
+@activities_bp.route('/totals', methods=['GET', 'OPTIONS'])
+def get_user_totals():
+    """Return a user's running totals with per-type and per-provider breakdowns."""
+    if request.method == 'OPTIONS':
+        return _cors_preflight_response()
+
+    doc_id = request.args.get('userId') or request.args.get('userEmail')
+    if not doc_id:
+        return _error('userEmail or userId required'), 400
+
+    try:
+        totals = read_user_totals(doc_id)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[Activities API] Error loading user totals: {exc}")
+        return _error('Failed to load user totals', details=str(exc)), 500
+
+    last_activity_at = totals.get('last_activity_at')
+    if isinstance(last_activity_at, datetime):
+        totals['last_activity_at'] = last_activity_at.isoformat()
+    return jsonify({'success': True, 'totals': totals}), 200
+
+
+@activities_bp.route('/ingest/metrics', methods=['GET'])
+def ingest_metrics():
+    """Expose write-behind queue depth and flush latency."""
+    return jsonify({
+        'success': True,
+        'asyncIngest': ASYNC_INGEST,
+        'queue': _ingest_queue.metrics() if _ingest_queue else None,
+    }), 200
 
 
 @activities_bp.route('', methods=['GET', 'OPTIONS'])
 def list_activities():
-    """List activities with optional filtering by user and timeframe."""
+    """List activities with optional filtering by user and timeframe.
+
+    Results are paged newest first; pass the returned ``nextPageToken`` as
+    ``pageToken`` to fetch the next page. Activities inserted while paging
+    land before the cursor, so pages never shift or repeat.
+    """
     if request.method == 'OPTIONS':
         return _cors_preflight_response()
 
@@ -114,138 +369,401 @@ def list_activities():
     user_email = request.args.get('userEmail')
     since_str = request.args.get('since')
     until_str = request.args.get('until')
-    limit = min(int(request.args.get('limit', 50)), 2000)  # Increased max limit to 2000 for all-time data
+    activity_type = (request.args.get('activityType') or '').strip().lower() or None
+    provider = (request.args.get('provider') or '').strip().lower() or None
+    page_token = request.args.get('pageToken')
+    try:
+        limit = int(request.args.get('limit', 50))
+    except (TypeError, ValueError):
+        return _error('limit must be an integer'), 400
+    if limit < 1:
+        return _error('limit must be at least 1'), 400
+    limit = min(limit, MAX_PAGE_SIZE)
 
-    print(f"[Activities API] Request params: userEmail={user_email}, userId={user_id}, limit={limit}, since={since_str}, until={until_str}")
+    print(f"[Activities API] Request params: userEmail={user_email}, userId={user_id}, limit={limit}, since={since_str}, until={until_str}, activityType={activity_type}, provider={provider}, pageToken={bool(page_token)}")
 
     try:
         activities_ref = get_collection('activities')
     except Exception as exc:
         print(f"[Activities API] Firebase unavailable: {exc}")
         return _error('Firebase not available', details=str(exc)), 503
-    # For all-time queries (no date filters), use higher limit
-    query_limit = limit * 5 if not since_str and not until_str else limit * 3
-    query = activities_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(query_limit)
 
     since_ts = _parse_iso_timestamp(since_str) if since_str else None
     until_ts = _parse_iso_timestamp(until_str) if until_str else None
 
     try:
-        docs = query.stream()
+        fields = parse_field_projection(request.args.get('fields'))
+        query = build_activities_query(
+            activities_ref,
+            user_email=user_email,
+            user_id=user_id,
+            since=since_ts,
+            until=until_ts,
+            activity_type=activity_type,
+            provider=provider,
+            fields=fields,
+        )
+        query = apply_page_token(query, page_token)
+    except ValueError as exc:
+        return _error(str(exc)), 400
+
+    try:
+        docs = list(query.limit(limit).stream())
     except Exception as exc:  # pylint: disable=broad-except
         print(f"[Activities API] Error loading activities: {exc}")
         return _error('Failed to load activities', details=str(exc)), 500
 
-    items = []
-    total_docs = 0
-    filtered_by_email = 0
-    filtered_by_time = 0
-    
-    for doc in docs:
-        total_docs += 1
-        data = doc.to_dict() or {}
-        
-        # Debug: print first few documents
-        if total_docs <= 3:
-            print(f"[Activities API] Doc {total_docs}: user_email={data.get('user_email')}, activity_type={data.get('activity_type')}, timestamp={data.get('timestamp')}")
-        
-        if user_id and data.get('user_id') != user_id:
-            continue
-        if user_email:
-            doc_email_raw = data.get('user_email')
-            # If email is None or empty, skip this document (it's invalid)
-            if not doc_email_raw:
-                filtered_by_email += 1
-                continue
-            doc_email = str(doc_email_raw).lower().strip()
-            req_email = str(user_email).lower().strip()
-            if doc_email != req_email:
-                filtered_by_email += 1
-                continue
-        ts = data.get('timestamp')
-        if since_ts and isinstance(ts, datetime) and ts < since_ts:
-            filtered_by_time += 1
-            continue
-        if until_ts and isinstance(ts, datetime) and ts > until_ts:
-            filtered_by_time += 1
-            continue
+    next_page_token = None
+    if docs and len(docs) == limit:
+        last = docs[-1]
+        next_page_token = encode_page_token(last.get('timestamp'), last.id)
 
-        data['id'] = doc.id
-        if isinstance(ts, datetime):
-            data['timestamp'] = ts.isoformat()
-        created_at = data.get('created_at')
-        if isinstance(created_at, datetime):
-            data['created_at'] = created_at.isoformat()
-        # Ensure emission fields exist: compute if missing to keep frontend consistent
-        try:
-            activity_type_field = data.get('activity_type') or data.get('activityType') or ''
-            if activity_type_field == 'email':
-                # prefer existing emission fields
-                existing = data.get('emission_kg') or data.get('emissionKg')
-                if not existing:
-                    payload = data.get('payload') or {}
-                    attachment_mb = (payload.get('attachment_bytes') or payload.get('attachmentBytes') or 0) / 1_000_000
-                    recipients_count = max(len(payload.get('recipients') or []) or 1, 1)
-                    try:
-                        computed = calculate_activity_emission('email', attachment_size_mb=attachment_mb, recipients_count=recipients_count)
-                        data['emission_kg'] = float(computed)
-                        print(f"[Activities API] Computed missing emission for doc {doc.id}: {computed} kg")
-                    except Exception as e:
-                        print(f"[Activities API] Failed to compute fallback emission for doc {doc.id}: {e}")
-        except Exception:
-            # don't let fallback computation break listing
-            pass
-
-        items.append(data)
-        if len(items) >= limit:
-            break
-
-    print(f"[Activities API] Results: total_docs={total_docs}, filtered_by_email={filtered_by_email}, filtered_by_time={filtered_by_time}, returned={len(items)}")
-    
-    # If no items found, let's check if there are ANY activities at all
-    if len(items) == 0:
-        all_activities_ref = get_collection('activities')
-        all_docs = list(all_activities_ref.limit(10).stream())
-        print(f"[Activities API] DEBUG: Found {len(all_docs)} total activities in database")
-        print(f"[Activities API] DEBUG: Requested email: '{user_email}'")
-        for i, doc in enumerate(all_docs[:5]):
-            doc_data = doc.to_dict() or {}
-            doc_email = doc_data.get('user_email') or 'NO_EMAIL'
-            print(f"[Activities API] DEBUG Sample {i+1}: user_email='{doc_email}' (type: {type(doc_email).__name__}), activity_type={doc_data.get('activity_type')}")
-        
-        if user_email:
-            # Try to find activities with similar emails
-            matching_docs = []
-            for doc in all_docs:
-                doc_data = doc.to_dict() or {}
-                doc_email = str(doc_data.get('user_email') or '').lower().strip()
-                req_email = str(user_email).lower().strip()
-                if req_email in doc_email or doc_email in req_email:
-                    matching_docs.append(doc_email)
-            if matching_docs:
-                print(f"[Activities API] DEBUG: Found similar emails: {set(matching_docs)}")
+    items = [_serialize_activity(doc) for doc in docs]
+
+    print(f"[Activities API] Results: returned={len(items)}, hasMore={next_page_token is not None}")
 
     response = jsonify({
         'success': True,
         'count': len(items),
         'activities': items,
+        'nextPageToken': next_page_token,
     })
     return response, 200
 
 
-def _calculate_emission(activity: NormalizedActivity) -> float:
+@activities_bp.route('/summary', methods=['GET', 'OPTIONS'])
+def activities_summary():
+    """Aggregate a user's activities server-side.
+
+    Returns day/week/month buckets (UTC) of emission and counts by
+    activity_type and provider, plus per-type stats, so dashboards don't
+    have to download raw activities.
+
+    Reads the daily rollups, so ``since``/``until`` are applied at whole
+    UTC day granularity. ``exact=true`` scans raw activities instead and
+    honours the exact timestamps.
+    """
+    if request.method == 'OPTIONS':
+        return _cors_preflight_response()
+
+    user_id = request.args.get('userId')
+    user_email = request.args.get('userEmail')
+    if not user_email and not user_id:
+        return _error('userEmail or userId required'), 400
+
+    since_str = request.args.get('since')
+    until_str = request.args.get('until')
+    since_ts = _parse_iso_timestamp(since_str) if since_str else None
+    until_ts = _parse_iso_timestamp(until_str) if until_str else None
+
+    exact = (request.args.get('exact') or '').lower() in ('1', 'true', 'yes')
+
+    builder = ActivitySummaryBuilder()
+    try:
+        if exact:
+            query = build_activities_query(
+                get_collection('activities'),
+                user_email=user_email,
+                user_id=user_id,
+                since=since_ts,
+                until=until_ts,
+                fields=SUMMARY_FIELDS,
+            )
+            for doc in stream_query_pages(query, EXPORT_PAGE_SIZE):
+                builder.add_activity(doc.to_dict() or {})
+        else:
+            query = rollups_query(
+                user_email=user_email,
+                user_id=user_id,
+                since=activity_day(since_ts) if since_ts else None,
+                until=activity_day(until_ts) if until_ts else None,
+            )
+            for rollup, day, metrics in iter_rollup_days(query):
+                builder.add_day(day, metrics, rollup_last_activity(rollup))
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[Activities API] Error building summary: {exc}")
+        return _error('Failed to build summary', details=str(exc)), 500
+
+    summary = builder.build()
+    print(f"[Activities API] Summary built: userEmail={user_email}, activities={summary['totals']['count']}")
+    return jsonify({
+        'success': True,
+        'since': since_ts.isoformat() if since_ts else None,
+        'until': until_ts.isoformat() if until_ts else None,
+        **summary,
+    }), 200
+
+
+@activities_bp.route('/export', methods=['GET', 'OPTIONS'])
+def export_activities():
+    """Stream a user's activities as NDJSON (default) or CSV.
+
+    Documents are paged from Firestore and written to the response as they
+    arrive, so memory stays constant regardless of history length. Accepts
+    the same filters as the listing (since, until, activityType, provider,
+    fields). The status is sent before the first page is read, so a failure
+    mid-stream ends the body with an error record instead: an ``error`` line
+    in NDJSON, a row starting with ``#error`` in CSV.
+    """
+    if request.method == 'OPTIONS':
+        return _cors_preflight_response()
+
+    user_id = request.args.get('userId')
+    user_email = request.args.get('userEmail')
+    if not user_email and not user_id:
+        return _error('userEmail or userId required'), 400
+
+    export_format = (request.args.get('format') or 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return _error('format must be ndjson or csv'), 400
+
+    since_str = request.args.get('since')
+    until_str = request.args.get('until')
+    try:
+        fields = parse_field_projection(request.args.get('fields'))
+        if fields is None and export_format == 'csv':
+            fields = list(DEFAULT_EXPORT_COLUMNS)
+        activities_ref = get_collection('activities')
+        query = build_activities_query(
+            activities_ref,
+            user_email=user_email,
+            user_id=user_id,
+            since=_parse_iso_timestamp(since_str) if since_str else None,
+            until=_parse_iso_timestamp(until_str) if until_str else None,
+            activity_type=(request.args.get('activityType') or '').strip().lower() or None,
+            provider=(request.args.get('provider') or '').strip().lower() or None,
+            fields=fields,
+        )
+    except ValueError as exc:
+        return _error(str(exc)), 400
+    except Exception as exc:
+        print(f"[Activities API] Firebase unavailable: {exc}")
+        return _error('Firebase not available', details=str(exc)), 503
+
+    print(f"[Activities API] Export started: userEmail={user_email}, userId={user_id}, format={export_format}")
+    if export_format == 'csv':
+        body = _export_csv_rows(query, ['id'] + fields)
+        mimetype = 'text/csv'
+    else:
+        body = _export_ndjson_lines(query)
+        mimetype = 'application/x-ndjson'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="activities.{export_format}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def _export_ndjson_lines(query):
+    exported = 0
+    try:
+        for doc in stream_query_pages(query, EXPORT_PAGE_SIZE):
+            item = _serialize_activity(doc)
+            yield json.dumps(item, default=_json_default, separators=(',', ':')) + '\n'
+            exported += 1
+    except Exception as exc:  # pylint: disable=broad-except
+        # Headers are already sent, so report the failure in-band
+        print(f"[Activities API] Export failed after {exported} activities: {exc}")
+        yield json.dumps({'error': 'Export interrupted', 'details': str(exc)}) + '\n'
+        return
+    print(f"[Activities API] Export finished: {exported} activities")
+
+
+def _export_csv_rows(query, columns: List[str]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush_row(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+
+    yield flush_row(columns)
+    exported = 0
+    try:
+        for doc in stream_query_pages(query, EXPORT_PAGE_SIZE):
+            item = _serialize_activity(doc)
+            yield flush_row([_csv_value(_nested_value(item, column)) for column in columns])
+            exported += 1
+    except Exception as exc:  # pylint: disable=broad-except
+        # Headers are already sent, so report the failure in-band
+        print(f"[Activities API] Export failed after {exported} activities: {exc}")
+        yield flush_row(['#error', 'Export interrupted', str(exc)])
+        return
+    print(f"[Activities API] Export finished: {exported} activities")
+
+
+def _nested_value(data: Dict[str, Any], path: str) -> Any:
+    value: Any = data
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return ';'.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=_json_default)
+    return value
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _enqueue_activity(activity_id: str, activity_doc: Dict[str, Any]):
+    """Hand an activity to the write-behind queue and answer before Firestore commits.
+
+    The cached 202 lets retries short-circuit while the write is pending; it
+    is evicted if the queue drops the activity, so a retry enqueues it again.
+    """
+    body = {
+        'success': True,
+        'activityId': activity_id,
+        'emissionKg': activity_doc['emission_kg'],
+        'queued': True,
+        'message': 'Activity accepted for processing',
+    }
+    # Cached before submitting so a fast drop can't be followed by a stale entry
+    _recent_ingest_responses.put(activity_id, (body, 202))
+    try:
+        _get_ingest_queue().submit(activity_id, activity_doc)
+    except IngestQueueFull as exc:
+        _recent_ingest_responses.pop(activity_id)
+        print(f"[Activities API] Rejecting activity, {exc}")
+        response = _error('Ingest queue is full, retry later')
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    return jsonify(body), 202
+
+
+def _get_ingest_queue() -> IngestQueue:
+    global _ingest_queue
+    with _ingest_queue_lock:
+        if _ingest_queue is None:
+            _ingest_queue = IngestQueue(
+                _flush_queued_activities,
+                max_size=int(os.getenv('INGEST_QUEUE_MAX_SIZE', 10000)),
+                batch_size=min(int(os.getenv('INGEST_QUEUE_BATCH_SIZE', 200)), FIRESTORE_MAX_BATCH_WRITES),
+                flush_interval=float(os.getenv('INGEST_QUEUE_FLUSH_INTERVAL', 0.5)),
+                workers=int(os.getenv('INGEST_QUEUE_WORKERS', 2)),
+                on_drop=_forget_dropped_activities,
+            )
+            _ingest_queue.start()
+            atexit.register(_ingest_queue.stop)
+        return _ingest_queue
+
+
+def _forget_dropped_activities(items: List[tuple]) -> None:
+    """Evict the cached 202s of activities the queue gave up on, so client retries aren't short-circuited."""
+    for activity_id, _ in items:
+        _recent_ingest_responses.pop(activity_id)
+
+
+def _flush_queued_activities(items: List[tuple]) -> None:
+    activity_ids = [activity_id for activity_id, _ in items]
+    activity_docs = [activity_doc for _, activity_doc in items]
+    created_flags = _create_activities(activity_ids, activity_docs)
+    _record_aggregates([doc for doc, created in zip(activity_docs, created_flags) if created is True])
+    errors = [created for created in created_flags if isinstance(created, Exception)]
+    if errors:
+        # The queue retries the batch; items stored this time then conflict and aren't counted twice
+        raise errors[0]
+
+
+def _serialize_activity(doc) -> Dict[str, Any]:
+    """Convert an activity snapshot into the JSON shape the frontend expects.
+
+    Stored emissions are returned as-is; missing or outdated ones are
+    backfilled by ``python -m jobs.recompute_emissions``, not patched on read.
+    """
+    data = doc.to_dict() or {}
+    data['id'] = doc.id
+    ts = data.get('timestamp')
+    if isinstance(ts, datetime):
+        data['timestamp'] = ts.isoformat()
+    created_at = data.get('created_at')
+    if isinstance(created_at, datetime):
+        data['created_at'] = created_at.isoformat()
+    return data
+
+
+def _resolve_emission_kg(normalized: NormalizedActivity, raw_payload: Dict[str, Any]) -> Tuple[float, str]:
+    """Prefer a client-provided emission (extension pre-computes on hover/send), else calculate it.
+
+    Returns the emission and the coefficient version (and org profile) to stamp on the activity.
+    """
+    emission_kg = _client_emission_kg(raw_payload)
+    if emission_kg is None or emission_kg == 0:
+        coefficients, stamp = coefficients_for(normalized.user_email)
+        emission_kg = _calculate_emission(normalized, coefficients, _grid_region(normalized))
+        print(f"[Activities API] Emission calculated: {emission_kg}kg ({stamp})")
+        return float(emission_kg), stamp
+    # ensure numeric float
+    return float(emission_kg), CLIENT_EMISSION_VERSION
+
+
+def _client_emission_kg(raw_payload: Dict[str, Any]) -> Optional[float]:
+    """Emission sent by the client in any of the accepted keys, converted to kg; None if absent or unparsable."""
+    emission_kg = None
+    try:
+        # Accept various possible keys from client
+        if raw_payload.get('emission_kg') is not None:
+            emission_kg = float(raw_payload.get('emission_kg'))
+            print(f"[Activities API] Using client-provided emission_kg: {emission_kg} kg")
+        elif raw_payload.get('emissionKg') is not None:
+            emission_kg = float(raw_payload.get('emissionKg'))
+            print(f"[Activities API] Using client-provided emissionKg: {emission_kg} kg")
+        elif raw_payload.get('emission_g') is not None:
+            emission_kg = float(raw_payload.get('emission_g')) / 1000.0
+            print(f"[Activities API] Using client-provided emission_g: {raw_payload.get('emission_g')} g -> {emission_kg} kg")
+        elif raw_payload.get('emissionG') is not None:
+            emission_kg = float(raw_payload.get('emissionG')) / 1000.0
+            print(f"[Activities API] Using client-provided emissionG: {raw_payload.get('emissionG')} g -> {emission_kg} kg")
+    except Exception as e:
+        print(f"[Activities API] Warning: could not parse client emission value: {e}")
+    return emission_kg
+
+
+def _grid_region(activity: NormalizedActivity) -> Optional[str]:
+    return grid_region_for(activity.user_email, metadata=activity.metadata)
+
+
+def _calculate_emission(
+    activity: NormalizedActivity,
+    coefficients: Optional[Mapping[str, float]] = None,
+    region: Optional[str] = None,
+) -> float:
     payload = activity.payload
+    timestamp = activity.timestamp if isinstance(activity.timestamp, datetime) else None
     if activity.activity_type == 'email':
         attachment_mb = (payload.get('attachment_bytes', 0) or 0) / 1_000_000
         recipients_count = max(len(payload.get('recipients', [])) or 1, 1)
         return calculate_activity_emission(
             'email',
+            coefficients=coefficients,
+            timestamp=timestamp,
+            region=region,
             attachment_size_mb=attachment_mb,
             recipients_count=recipients_count,
         )
     if activity.activity_type == 'meeting':
         return calculate_activity_emission(
             'meeting',
+            coefficients=coefficients,
+            timestamp=timestamp,
+            region=region,
             duration_minutes=payload.get('duration_minutes', 0) or 0,
             has_video=bool(payload.get('has_video', True)),
             participants_count=payload.get('participants_count', 1) or 1,
@@ -253,6 +771,9 @@ def _calculate_emission(activity: NormalizedActivity) -> float:
     if activity.activity_type == 'storage':
         return calculate_activity_emission(
             'storage',
+            coefficients=coefficients,
+            timestamp=timestamp,
+            region=region,
             upload_size_mb=payload.get('size_mb', 0.0) or 0.0,
             storage_gb=payload.get('total_storage_gb', 0.0) or 0.0,
             days_stored=payload.get('days_stored', 0) or 0,
@@ -260,12 +781,20 @@ def _calculate_emission(activity: NormalizedActivity) -> float:
     if activity.activity_type == 'browsing':
         return calculate_activity_emission(
             'browsing',
+            coefficients=coefficients,
+            timestamp=timestamp,
+            region=region,
             duration_minutes=payload.get('duration_minutes', 0) or 0,
         )
     return 0.0
 
 
-def _build_activity_document(normalized: NormalizedActivity, emission_kg: float, raw_payload: Dict[str, Any]) -> Dict[str, Any]:
+def _build_activity_document(
+    normalized: NormalizedActivity,
+    emission_kg: float,
+    raw_payload: Dict[str, Any],
+    emission_version: str = EMISSION_VERSION,
+) -> Dict[str, Any]:
     """Build activity document for Firebase storage."""
     # Ensure timestamp is a datetime object
     if isinstance(normalized.timestamp, datetime):
@@ -313,6 +842,8 @@ def _build_activity_document(normalized: NormalizedActivity, emission_kg: float,
         'user_id': normalized.user_id,
         'user_email': user_email,  # Use the extracted email (may be None)
         'emission_kg': float(emission_kg),  # Ensure it's a float
+        'emission_version': emission_version,
+        'grid_region': _grid_region(normalized),
         'payload': normalized.payload,
         'metadata': normalized.metadata,
         'created_at': now,
@@ -333,79 +864,87 @@ def _build_activity_document(normalized: NormalizedActivity, emission_kg: float,
     return activity_doc
 
 
-def _persist_activity(activity_doc: Dict[str, Any]) -> str:
-    """Persist activity to Firebase. Returns document ID."""
-    try:
-        activities_ref = get_collection('activities')
-        if not activities_ref:
-            raise Exception("Firebase activities collection is not available")
-        
-        ref = activities_ref.document()
-        ref.set(activity_doc)
-        return ref.id
-    except Exception as e:
-        print(f"[Activities API] Error persisting activity to Firebase: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
-
-
-def _update_user_totals(activity_doc: Dict[str, Any]) -> None:
-    """Update user totals in Firebase. Fails silently if there's an error."""
-    try:
-        user_id = activity_doc.get('user_id')
-        user_email = activity_doc.get('user_email')
-        emission_kg = activity_doc.get('emission_kg', 0.0)
-
-        if not user_id and not user_email:
-            print("[Activities API] Skipping user totals update: no user_id or user_email")
-            return
-
-        users_ref = get_collection('users')
-        doc_id = user_id or user_email
-        if not doc_id:
-            print("[Activities API] Skipping user totals update: doc_id is None")
-            return
-        
-        user_ref = users_ref.document(doc_id)
-
-        db = get_db()
-        if not db:
-            print("[Activities API] WARNING: Firebase db is None, skipping user totals update")
-            return
-            
-        transaction = db.transaction()
+def _create_activities(activity_ids: List[str], activity_docs: List[Dict[str, Any]]) -> List[Union[bool, Exception]]:
+    """Create activities under deterministic IDs using write batches.
+
+    Returns one flag per item: True when the document was created, False when
+    it already existed (an earlier attempt of the same request stored it), or
+    the exception that failed its write. A failing chunk doesn't stop the
+    later ones, so callers can still record aggregates for what was created.
+    """
+    activities_ref = get_collection('activities')
+    db = get_db()
+    if not activities_ref or not db:
+        raise Exception("Firebase activities collection is not available")
+
+    created_flags: List[bool] = []
+    for start in range(0, len(activity_docs), FIRESTORE_MAX_BATCH_WRITES):
+        chunk = list(zip(
+            activity_ids[start:start + FIRESTORE_MAX_BATCH_WRITES],
+            activity_docs[start:start + FIRESTORE_MAX_BATCH_WRITES],
+        ))
+        batch = db.batch()
+        for activity_id, activity_doc in chunk:
+            batch.create(activities_ref.document(activity_id), activity_doc)
+        try:
+            batch.commit()
+            created_flags.extend([True] * len(chunk))
+            continue
+        except AlreadyExists:
+            print(f"[Activities API] Batch contains already stored activities, retrying {len(chunk)} items individually")
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[Activities API] ERROR storing {len(chunk)} activities: {exc}")
+            created_flags.extend([exc] * len(chunk))
+            continue
 
-        @firestore.transactional
-        def update_totals(txn: firestore.Transaction, ref: firestore.DocumentReference) -> None:
+        # A batch is atomic, so one existing document rejects it; fall back to per-item creates
+        for activity_id, activity_doc in chunk:
             try:
-                snapshot = ref.get(transaction=txn)
-                total_emission = emission_kg
-                activity_count = 1
-
-                if snapshot.exists:
-                    data = snapshot.to_dict() or {}
-                    total_emission += data.get('total_emission_kg', 0.0)
-                    activity_count += data.get('activity_count', 0)
-
-                update_data = {
-                    'total_emission_kg': round(total_emission, 6),
-                    'activity_count': activity_count,
-                    'last_activity_at': activity_doc.get('timestamp'),
-                    'updated_at': datetime.utcnow(),
-                }
-                
-                if user_email:
-                    update_data['email'] = user_email
-                if user_id:
-                    update_data['user_id'] = user_id
-
-                txn.set(ref, update_data, merge=True)
-            except Exception as e:
-                print(f"[Activities API] Error in transaction: {e}")
-                raise
-
-        update_totals(transaction, user_ref)
+                activities_ref.document(activity_id).create(activity_doc)
+                created_flags.append(True)
+            except AlreadyExists:
+                created_flags.append(False)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[Activities API] ERROR storing activity {activity_id}: {exc}")
+                created_flags.append(exc)
+    return created_flags
+
+
+def _batch_emissions(pending_items: Dict[str, tuple], activity_ids: List[str], coefficients) -> List[float]:
+    """Vectorized emissions of the pending batch items ``activity_ids`` under one coefficient profile."""
+    emissions = calculate_emissions_batch(
+        **activity_emission_columns([
+            {**pending_items[activity_id][0].to_dict(), 'grid_region': _grid_region(pending_items[activity_id][0])}
+            for activity_id in activity_ids
+        ]),
+        coefficients=coefficients,
+    )
+    return emissions.tolist()
+
+
+def _stored_emissions(activity_ids: List[str]) -> Dict[str, float]:
+    """Read emission_kg of already stored activities in one get_all round trip."""
+    activities_ref = get_collection('activities')
+    refs = [activities_ref.document(activity_id) for activity_id in activity_ids]
+    emissions: Dict[str, float] = {}
+    for snapshot in get_db().get_all(refs, field_paths=['emission_kg']):
+        if snapshot.exists:
+            emissions[snapshot.id] = float((snapshot.to_dict() or {}).get('emission_kg', 0.0) or 0.0)
+    return emissions
+
+
+def _record_aggregates(activity_docs: List[Dict[str, Any]]) -> None:
+    """Fold newly created activities into user totals and daily rollups. Never raises."""
+    if not activity_docs:
+        return
+    _update_user_totals_many(activity_docs)
+    record_rollups(activity_docs)
+
+
+def _update_user_totals_many(activity_docs: Iterable[Dict[str, Any]]) -> None:
+    """Fold activities into one atomic-increment update per user. Fails silently if there's an error."""
+    try:
+        apply_user_totals(fold_user_totals(activity_docs))
     except Exception as exc:
         # Don't fail the whole request if user totals update fails
         print(f"[Activities API] Error updating user totals (non-fatal): {exc}")
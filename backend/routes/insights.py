@@ -3,179 +3,169 @@ Insights Routes
 Rule-based AI insights generation for activities
 """
 
+import time
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta, timezone
+from utils.activity_queries import build_activities_query
+from utils.activity_summary import merge_metrics
+from utils.coefficient_profiles import coefficients_for
 from utils.firebase_config import get_collection
-from firebase_admin import firestore as admin_firestore
-from utils.insights import (
-    generate_email_insight,
-    generate_meeting_insight,
-    generate_storage_insight,
-    generate_web_insight,
+from utils.insight_cache import read_cached_insights, store_insights
+from utils.insights import PERIOD_DAYS, generate_insights, insight_inputs, read_team_context
+from utils.rollups import iter_rollup_days, read_rollup_version, rollup_user_key, rollups_query
+from utils.scenarios import (
+    SIMULATION_FIELDS,
+    ScenarioError,
+    load_history,
+    parse_scenarios,
+    period_bounds,
+    scenario_catalog,
+    simulate_scenarios,
 )
 
 insights_bp = Blueprint('insights', __name__)
 
+MAX_SIMULATION_DAYS = 730
+
 
 @insights_bp.route('', methods=['GET', 'OPTIONS'])
 def get_insights():
-    """Generate rule-based insights for user activities"""
+    """Generate rule-based insights for user activities
+
+    Inputs are summed from the user's daily rollups for the period and the
+    result is cached in insights/{user}_{period} until it expires or the
+    user's rollup version moves. ``refresh=true`` bypasses the cache.
+    """
     if request.method == 'OPTIONS':
         return _cors_preflight_response()
 
     user_email = request.args.get('userEmail')
     user_id = request.args.get('userId')
     period = request.args.get('period', 'weekly')  # daily, weekly, monthly
+    refresh = (request.args.get('refresh') or '').lower() in ('1', 'true', 'yes')
 
     if not user_email and not user_id:
         return jsonify({'error': 'userEmail or userId required'}), 400
+    if period not in PERIOD_DAYS:
+        period = 'weekly'
+
+    user_key = rollup_user_key(user_email, user_id)
 
     try:
-        # Get activities for the period
         try:
-            activities_ref = get_collection('activities')
+            # Read before the rollups, so a write landing in between makes the entry stale, not wrong
+            version = read_rollup_version(user_key)
+            cached = None if refresh else read_cached_insights(user_key, period)
         except Exception as exc:
             print(f"[Insights API] Firebase unavailable: {exc}")
             return jsonify({'error': 'Firebase not available', 'details': str(exc)}), 503
-        query = activities_ref.order_by('timestamp', direction=admin_firestore.Query.DESCENDING).limit(500)
-
-        # Calculate date range based on period
-        now = datetime.now(timezone.utc)
-        if period == 'daily':
-            start_date = now - timedelta(days=1)
-        elif period == 'weekly':
-            start_date = now - timedelta(days=7)
-        elif period == 'monthly':
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = now - timedelta(days=7)
-
-        insights = []
-        activities = []
-        
-        for doc in query.stream():
-            data = doc.to_dict() or {}
-            doc_email = str(data.get('user_email') or '').lower().strip()
-            req_email = str(user_email or '').lower().strip()
-            
-            if user_email and doc_email != req_email:
-                continue
-            if user_id and data.get('user_id') != user_id:
-                continue
-
-            # Check if activity is within period
-            ts = data.get('timestamp')
-            if isinstance(ts, datetime):
-                if ts.tzinfo is None:
-                    ts = ts.replace(tzinfo=timezone.utc)
-                else:
-                    ts = ts.astimezone(timezone.utc)
-                if ts < start_date:
-                    continue
-
-            activities.append(data)
-
-        # Generate insights based on activities
-        email_activities = [a for a in activities if (a.get('activity_type') or a.get('activityType')) == 'email']
-        meeting_activities = [a for a in activities if (a.get('activity_type') or a.get('activityType')) == 'meeting']
-        storage_activities = [a for a in activities if (a.get('activity_type') or a.get('activityType')) == 'storage']
-        browsing_activities = [a for a in activities if (a.get('activity_type') or a.get('activityType')) == 'browsing']
-
-        # Email insights
-        if email_activities:
-            email_count = len(email_activities)
-            total_attachment_bytes = sum(
-                (e.get('payload', {}).get('attachment_bytes') or e.get('payload', {}).get('attachmentBytes') or 0)
-                for e in email_activities
-            )
-            avg_attachment_size = (total_attachment_bytes / email_count / 1_000_000) if email_count > 0 else 0
-            
-            email_insight = generate_email_insight(email_count, avg_attachment_size)
-            if email_insight:
-                insights.append({
-                    'id': f'email_{len(insights)}',
-                    'category': 'email',
-                    'message': email_insight,
-                    'created_at': datetime.utcnow().isoformat(),
-                })
-
-        # Meeting insights
-        if meeting_activities:
-            total_minutes = sum(
-                (m.get('payload', {}).get('duration_minutes') or m.get('payload', {}).get('durationMinutes') or 0)
-                for m in meeting_activities
-            )
-            meeting_hours = total_minutes / 60
-            avg_duration = total_minutes / len(meeting_activities) if meeting_activities else 0
-            has_video_count = sum(
-                1 for m in meeting_activities
-                if m.get('payload', {}).get('has_video') or m.get('payload', {}).get('hasVideo', True)
-            )
-            
-            meeting_insight = generate_meeting_insight(
-                meeting_hours, avg_duration, has_video_count, len(meeting_activities)
-            )
-            if meeting_insight:
-                insights.append({
-                    'id': f'meeting_{len(insights)}',
-                    'category': 'meeting',
-                    'message': meeting_insight,
-                    'created_at': datetime.utcnow().isoformat(),
-                })
-
-        # Storage insights
-        if storage_activities:
-            total_storage_gb = sum(
-                (s.get('payload', {}).get('total_storage_gb') or s.get('payload', {}).get('totalStorageGb') or 0)
-                for s in storage_activities
-            )
-            # Estimate unused storage (simplified - 20% of total)
-            unused_estimate_gb = total_storage_gb * 0.2
-            
-            storage_insight = generate_storage_insight(total_storage_gb, unused_estimate_gb)
-            if storage_insight:
-                insights.append({
-                    'id': f'storage_{len(insights)}',
-                    'category': 'storage',
-                    'message': storage_insight,
-                    'created_at': datetime.utcnow().isoformat(),
-                })
-
-        # Browsing insights (simplified)
-        if browsing_activities:
-            total_minutes = sum(
-                (b.get('payload', {}).get('duration_minutes') or b.get('payload', {}).get('durationMinutes') or 0)
-                for b in browsing_activities
-            )
-            streaming_hours = total_minutes / 60  # Simplified
-            
-            browsing_insight = generate_web_insight(0, streaming_hours)
-            if browsing_insight:
-                insights.append({
-                    'id': f'browsing_{len(insights)}',
-                    'category': 'browsing',
-                    'message': browsing_insight,
-                    'created_at': datetime.utcnow().isoformat(),
-                })
+        if cached and cached.get('rollups_version') == version:
+            return _insights_response(cached, cached=True)
+
+        # Sum the rollups of every UTC day touched by the period
+        start_day = (datetime.now(timezone.utc) - timedelta(days=PERIOD_DAYS[period])).date()
+        totals = {}
+        for _, _, metrics in iter_rollup_days(rollups_query(user_email=user_email, user_id=user_id, since=start_day)):
+            merge_metrics(totals, metrics)
+
+        inputs = insight_inputs(totals)
+        # Team comparisons come from the user's last alert evaluation
+        team_avg, team_percentiles = read_team_context(user_key, period)
+        insights = generate_insights(inputs, team_avg=team_avg, team_percentiles=team_percentiles)
+        entry = store_insights(
+            user_key,
+            period,
+            insights,
+            inputs,
+            team_avg=team_avg,
+            team_percentiles=team_percentiles,
+            rollups_version=version,
+        )
+        return _insights_response(entry, cached=False)
+
+    except Exception as e:
+        print(f"[Insights API] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@insights_bp.route('/simulate', methods=['GET', 'POST', 'OPTIONS'])
+def simulate():
+    """What-if simulation of a user's footprint under alternative behaviours
+
+    POST body: ``{userEmail|userId, days (default 365), scenarios: [...]}``
+    (see utils.scenarios.parse_scenarios). GET lists the scenario types.
+    """
+    if request.method == 'OPTIONS':
+        return _cors_preflight_response()
+    if request.method == 'GET':
+        return jsonify({'success': True, 'scenarioTypes': scenario_catalog()}), 200
+
+    body = request.get_json(silent=True) or {}
+    user_email = body.get('userEmail')
+    user_id = body.get('userId')
+    if not user_email and not user_id:
+        return jsonify({'error': 'userEmail or userId required'}), 400
+    days = body.get('days', 365)
+    if isinstance(days, bool) or not isinstance(days, int) or not 1 <= days <= MAX_SIMULATION_DAYS:
+        return jsonify({'error': f'days must be an integer between 1 and {MAX_SIMULATION_DAYS}'}), 400
+    try:
+        scenarios = parse_scenarios(body.get('scenarios'))
+    except ScenarioError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    try:
+        since, until = period_bounds(days)
+        query = build_activities_query(
+            get_collection('activities'),
+            user_email=user_email,
+            user_id=user_id,
+            since=since,
+            fields=SIMULATION_FIELDS,
+        )
+        history = load_history(query, cache_key=(rollup_user_key(user_email, user_id), days))
+
+        started = time.perf_counter()
+        coefficients, _ = coefficients_for(user_email)
+        result = simulate_scenarios(history.columns, scenarios, coefficients)
+        compute_ms = (time.perf_counter() - started) * 1000
 
         return jsonify({
             'success': True,
-            'insights': insights,
-            'count': len(insights),
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'activityCount': history.count,
+            'storedEmissionKg': history.stored_emission_kg,
+            **result,
+            'computeMs': round(compute_ms, 2),
         }), 200
 
     except Exception as e:
-        print(f"[Insights API] Error: {e}")
+        print(f"[Insights API] Simulation error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+def _insights_response(entry, cached):
+    generated_at = entry.get('generated_at')
+    insights = entry.get('insights') or []
+    return jsonify({
+        'success': True,
+        'insights': insights,
+        'count': len(insights),
+        'period': entry.get('period'),
+        'cached': cached,
+        'generatedAt': generated_at.isoformat() if isinstance(generated_at, datetime) else generated_at,
+    }), 200
+
+
 def _cors_preflight_response():
     response = jsonify({'status': 'ok'})
     origin = request.headers.get('Origin', '*')
     response.headers.add('Access-Control-Allow-Origin', origin)
-    response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+    response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
     response.headers.add('Access-Control-Allow-Headers', request.headers.get('Access-Control-Request-Headers', 'Content-Type'))
     return response, 204
 
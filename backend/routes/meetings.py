@@ -11,8 +11,11 @@ from googleapiclient.errors import HttpError
 import requests
 from utils.firebase_config import get_collection
 from utils.oauth_tokens import resolve_google_token_document
-from utils.activity_validator import validate_activity_payload
+from utils.activity_validator import validate_many
+from utils.coefficient_profiles import coefficients_for, grid_region_for
 from utils.emissions import calculate_activity_emission
+from utils.rollups import record_rollups
+from utils.sync_writes import create_sync_activities, find_stored_ids
 
 meetings_bp = Blueprint('meetings', __name__)
 
@@ -78,16 +81,20 @@ def sync_google_meet(user_id):
         ]
         
         user_email = tokens_data.get('user_email')
-        activities_ref = get_collection('activities')
         processed_count = 0
         skipped_count = 0
+        new_docs = {}
+        payloads = {}
+        stored_ids = find_stored_ids(
+            'google_meet', user_email,
+            [event.get('id') for event in meet_events[:max_results]],
+        )
         
         for event in meet_events[:max_results]:
             try:
                 # Check if already exists
                 event_id = event.get('id')
-                existing_query = activities_ref.where('metadata.google_calendar_event_id', '==', event_id).limit(1).stream()
-                if list(existing_query):
+                if not event_id or event_id in stored_ids or event_id in payloads:
                     skipped_count += 1
                     continue
                 
@@ -129,13 +136,31 @@ def sync_google_meet(user_id):
                     }
                 }
                 
-                # Validate and save
-                normalized = validate_activity_payload(activity_payload)
+                payloads[event_id] = (activity_payload, {
+                    'duration_minutes': duration_minutes,
+                    'has_video': has_video,
+                    'participants_count': participants_count,
+                })
+                
+            except Exception as e:
+                print(f"[Google Meet Sync] Error processing event {event.get('id')}: {e}")
+                skipped_count += 1
+                continue
+        
+        for (event_id, (activity_payload, emission_args)), (normalized, validation_error) in zip(
+            payloads.items(), validate_many([activity_payload for activity_payload, _ in payloads.values()]),
+        ):
+            try:
+                if validation_error is not None:
+                    raise validation_error
+                coefficients, emission_version = coefficients_for(normalized.user_email)
+                grid_region = grid_region_for(normalized.user_email, metadata=normalized.metadata)
                 emission_kg = calculate_activity_emission(
                     'meeting',
-                    duration_minutes=duration_minutes,
-                    has_video=has_video,
-                    participants_count=participants_count
+                    coefficients=coefficients,
+                    timestamp=normalized.timestamp,
+                    region=grid_region,
+                    **emission_args,
                 )
                 
                 activity_doc = {
@@ -148,6 +173,8 @@ def sync_google_meet(user_id):
                     'user_id': None,
                     'user_email': normalized.user_email,
                     'emission_kg': emission_kg,
+                    'emission_version': emission_version,
+                    'grid_region': grid_region,
                     'payload': normalized.payload,
                     'metadata': normalized.metadata,
                     'raw_payload': activity_payload,
@@ -155,13 +182,16 @@ def sync_google_meet(user_id):
                     'updated_at': datetime.utcnow(),
                 }
                 
-                activities_ref.document().set(activity_doc)
-                processed_count += 1
+                new_docs[event_id] = activity_doc
                 
             except Exception as e:
-                print(f"[Google Meet Sync] Error processing event {event.get('id')}: {e}")
+                print(f"[Google Meet Sync] Error processing event {event_id}: {e}")
                 skipped_count += 1
-                continue
+        
+        created_docs = create_sync_activities('google_meet', user_email, new_docs)
+        processed_count = len(created_docs)
+        skipped_count += len(new_docs) - len(created_docs)
+        record_rollups(created_docs)
         
         return jsonify({
             'success': True,
@@ -250,16 +280,20 @@ def sync_teams(user_id):
         ]
         
         user_email = tokens_data.get('user_email')
-        activities_ref = get_collection('activities')
         processed_count = 0
         skipped_count = 0
+        new_docs = {}
+        payloads = {}
+        stored_ids = find_stored_ids(
+            'microsoft_teams', user_email,
+            [event.get('id') for event in teams_events[:max_results]],
+        )
         
         for event in teams_events[:max_results]:
             try:
                 # Check if already exists
                 event_id = event.get('id')
-                existing_query = activities_ref.where('metadata.microsoft_event_id', '==', event_id).limit(1).stream()
-                if list(existing_query):
+                if not event_id or event_id in stored_ids or event_id in payloads:
                     skipped_count += 1
                     continue
                 
@@ -299,13 +333,31 @@ def sync_teams(user_id):
                     }
                 }
                 
-                # Validate and save
-                normalized = validate_activity_payload(activity_payload)
+                payloads[event_id] = (activity_payload, {
+                    'duration_minutes': duration_minutes,
+                    'has_video': has_video,
+                    'participants_count': participants_count,
+                })
+                
+            except Exception as e:
+                print(f"[Teams Sync] Error processing event {event.get('id')}: {e}")
+                skipped_count += 1
+                continue
+        
+        for (event_id, (activity_payload, emission_args)), (normalized, validation_error) in zip(
+            payloads.items(), validate_many([activity_payload for activity_payload, _ in payloads.values()]),
+        ):
+            try:
+                if validation_error is not None:
+                    raise validation_error
+                coefficients, emission_version = coefficients_for(normalized.user_email)
+                grid_region = grid_region_for(normalized.user_email, metadata=normalized.metadata)
                 emission_kg = calculate_activity_emission(
                     'meeting',
-                    duration_minutes=duration_minutes,
-                    has_video=has_video,
-                    participants_count=participants_count
+                    coefficients=coefficients,
+                    timestamp=normalized.timestamp,
+                    region=grid_region,
+                    **emission_args,
                 )
                 
                 activity_doc = {
@@ -318,6 +370,8 @@ def sync_teams(user_id):
                     'user_id': None,
                     'user_email': normalized.user_email,
                     'emission_kg': emission_kg,
+                    'emission_version': emission_version,
+                    'grid_region': grid_region,
                     'payload': normalized.payload,
                     'metadata': normalized.metadata,
                     'raw_payload': activity_payload,
@@ -325,13 +379,16 @@ def sync_teams(user_id):
                     'updated_at': datetime.utcnow(),
                 }
                 
-                activities_ref.document().set(activity_doc)
-                processed_count += 1
+                new_docs[event_id] = activity_doc
                 
             except Exception as e:
-                print(f"[Teams Sync] Error processing event {event.get('id')}: {e}")
+                print(f"[Teams Sync] Error processing event {event_id}: {e}")
                 skipped_count += 1
-                continue
+        
+        created_docs = create_sync_activities('microsoft_teams', user_email, new_docs)
+        processed_count = len(created_docs)
+        skipped_count += len(new_docs) - len(created_docs)
+        record_rollups(created_docs)
         
         return jsonify({
             'success': True,
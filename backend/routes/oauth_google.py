@@ -1,14 +1,9 @@
 """Google OAuth / Gmail sync routes."""
 
 from flask import Blueprint, request, jsonify, redirect
-import re
-import time
 from datetime import datetime, timedelta
-import threading
-import concurrent.futures
 
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 from google_auth_oauthlib.flow import Flow
@@ -17,6 +12,7 @@ import requests
 
 from utils.oauth_tokens import resolve_google_token_document
 from utils.firebase_config import get_collection
+from utils.gmail_sync import GmailMessageProcessor, load_google_token, window_queries
 
 
 oauth_google_bp = Blueprint('oauth_google', __name__)
@@ -70,215 +66,19 @@ def sync_gmail_for_user(user_identifier: str, days_back: float = 30, max_results
     """Fetch recent Gmail messages for a user and store them as activities.
 
     Returns a dict with stats: {'success': True, 'processed': X, ...}
-    This helper can be called from the Flask route or from a background poller.
+    The background poller uses utils.gmail_sync.sync_gmail_incremental instead,
+    which reads only the changes since the user's history checkpoint.
     """
-    tokens_doc, _ = resolve_google_token_document(user_identifier)
-    if not tokens_doc or not tokens_doc.exists:
-        raise ValueError('No tokens found for user')
-
-    tokens_data = tokens_doc.to_dict()
-    google_token = tokens_data.get('google_token')
-    if not google_token:
-        raise ValueError('Google token not found in token document')
-
-    creds = Credentials(
-        token=google_token.get('token'),
-        refresh_token=google_token.get('refresh_token'),
-        token_uri=google_token.get('token_uri'),
-        client_id=google_token.get('client_id'),
-        client_secret=google_token.get('client_secret'),
-        scopes=google_token.get('scopes', []),
-    )
-
-    service = build('gmail', 'v1', credentials=creds)
+    _, _, tokens_data, google_token = load_google_token(user_identifier)
+    processor = GmailMessageProcessor(google_token, tokens_data.get('user_email'))
 
+    # Both directions are listed concurrently into the staged pipeline
     since_dt = datetime.utcnow() - timedelta(days=days_back)
-    since_query = int(since_dt.timestamp())
-
-    activities_ref = get_collection('activities')
-
-    stats = {
-        'outbound': {'found': 0, 'processed': 0, 'skipped': 0},
-        'inbound': {'found': 0, 'processed': 0, 'skipped': 0},
-    }
-
-    email_regex = re.compile(r'[\w\.-]+@[\w\.-]+\.[A-Za-z]{2,}')
-
-    def parse_addresses(raw: str):
-        if not raw:
-            return []
-        seen = set()
-        out = []
-        for m in email_regex.findall(raw):
-            lowered = m.lower()
-            if lowered not in seen:
-                seen.add(lowered)
-                out.append(m)
-        return out
-
-    def get_header(headers, name):
-        for h in headers:
-            if h.get('name', '').lower() == name.lower():
-                return h.get('value', '')
-        return ''
-
-    def count_attachments(parts_list):
-        cnt = 0
-        size = 0
-        for p in parts_list or []:
-            if p.get('filename'):
-                cnt += 1
-                size += int(p.get('body', {}).get('size', 0) or 0)
-            if p.get('parts'):
-                sub_cnt, sub_size = count_attachments(p.get('parts'))
-                cnt += sub_cnt
-                size += sub_size
-        return cnt, size
-
-    from utils.activity_validator import validate_activity_payload
-    from utils.emissions import calculate_activity_emission
-
-    stats_lock = threading.Lock()
-
-    def process_message(message_id: str, direction: str, user_email: str):
-        try:
-            # Fetch only necessary fields to reduce payload
-            msg = service.users().messages().get(
-                userId='me', id=message_id,
-                format='full',
-                fields='id,internalDate,payload(headers,parts(filename,body,size,parts)),snippet,threadId,labelIds'
-            ).execute()
-
-            headers = msg.get('payload', {}).get('headers', [])
-            subject = get_header(headers, 'Subject')
-            sender_candidates = parse_addresses(get_header(headers, 'From'))
-            sender_email = sender_candidates[0] if sender_candidates else user_email
-
-            recipient_fields = ' '.join([get_header(headers, 'To'), get_header(headers, 'Cc'), get_header(headers, 'Bcc')])
-            recipients = parse_addresses(recipient_fields)
-
-            snippet = msg.get('snippet', '')
-            parts = msg.get('payload', {}).get('parts', [])
-            attachment_count, attachment_bytes = count_attachments(parts)
-
-            existing = list(activities_ref.where('metadata.gmail_message_id', '==', message_id).limit(1).stream())
-            if existing:
-                with stats_lock:
-                    stats[direction]['skipped'] += 1
-                return
-
-            timestamp_iso = datetime.fromtimestamp(int(msg['internalDate']) / 1000).isoformat()
-
-            activity_payload = {
-                'activityType': 'email',
-                'provider': 'gmail',
-                'timestamp': timestamp_iso,
-                'subject': subject,
-                'recipients': recipients,
-                'bodyPreview': snippet,
-                'attachmentCount': attachment_count,
-                'attachmentBytes': attachment_bytes,
-                'direction': direction,
-                'sender': sender_email,
-                'user_email': user_email,
-                'metadata': {
-                    'source': 'gmail_api_sync',
-                    'gmail_message_id': message_id,
-                    'account_email': user_email,
-                    'direction': direction,
-                    'thread_id': msg.get('threadId'),
-                    'label_ids': msg.get('labelIds', []),
-                }
-            }
-
-            normalized = validate_activity_payload(activity_payload)
-            emission_kg = calculate_activity_emission(
-                'email',
-                attachment_size_mb=(attachment_bytes or 0) / 1_000_000,
-                recipients_count=len(recipients) or 1,
-            )
-
-            activity_doc = {
-                'activity_type': normalized.activity_type,
-                'provider': normalized.provider,
-                'timestamp': normalized.timestamp,
-                'platform': normalized.platform,
-                'mode': 'sync',
-                'extension_version': 'api-sync',
-                'user_id': None,
-                'user_email': normalized.user_email,
-                'emission_kg': emission_kg,
-                'payload': normalized.payload,
-                'metadata': normalized.metadata,
-                'raw_payload': activity_payload,
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow(),
-            }
-
-            activities_ref.document().set(activity_doc)
-            with stats_lock:
-                stats[direction]['processed'] += 1
-
-        except Exception as exc:
-            print(f"[Gmail Sync] Error processing message {message_id}: {exc}")
-            with stats_lock:
-                stats[direction]['skipped'] += 1
-
-    directions = [
-        ('outbound', {'userId': 'me', 'maxResults': min(max_results, 500), 'q': f'is:sent after:{since_query}'}),
-        ('inbound', {'userId': 'me', 'maxResults': min(max_results, 500), 'labelIds': ['INBOX'], 'q': f'after:{since_query}'}),
-    ]
-
-    for direction, base_params in directions:
-        params = dict(base_params)
-        processed_count = 0
-        page_token = None
-        total_found = 0
-
-        max_workers = min(8, max_results or 1)
-        futures = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            while True:
-                if page_token:
-                    params['pageToken'] = page_token
-                t0 = time.time()
-                resp = service.users().messages().list(**params).execute()
-                t1 = time.time()
-                print(f"[Gmail Sync] list() took {t1-t0:.2f}s for {direction}")
-
-                messages = resp.get('messages', []) or []
-                total_found += len(messages)
-                for m in messages:
-                    if processed_count >= max_results:
-                        break
-                    message_id = m.get('id')
-                    if not message_id:
-                        continue
-                    futures.append(executor.submit(process_message, message_id, direction, tokens_data.get('user_email')))
-                    processed_count += 1
-
-                page_token = resp.get('nextPageToken')
-                if not page_token or processed_count >= max_results:
-                    break
-
-            if futures:
-                concurrent.futures.wait(futures)
-
-        stats[direction]['found'] = total_found
-
-    total_found = sum(v['found'] for v in stats.values())
-    total_processed = sum(v['processed'] for v in stats.values())
-    total_skipped = sum(v['skipped'] for v in stats.values())
-
-    return {
-        'success': True,
-        'messages_found': total_found,
-        'processed': total_processed,
-        'skipped': total_skipped,
-        'processed_sent': stats['outbound']['processed'],
-        'processed_received': stats['inbound']['processed'],
-        'message': f"Gmail sync completed: {stats['outbound']['processed']} sent, {stats['inbound']['processed']} received processed",
-    }
+    processor.run([
+        processor.window_source(direction, base_params, max_results)
+        for direction, base_params in window_queries(since_dt, max_results)
+    ])
+    return processor.result(truncated=processor.truncated)
 
 
 @oauth_google_bp.route('/login', methods=['GET'])
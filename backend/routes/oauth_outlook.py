@@ -9,6 +9,7 @@ import os
 import re
 from datetime import datetime, timedelta
 from utils.firebase_config import get_collection, COLLECTIONS
+from utils.rollups import record_rollups
 
 oauth_outlook_bp = Blueprint('oauth_outlook', __name__)
 
@@ -314,12 +315,12 @@ def sync_outlook(user_id):
             'Content-Type': 'application/json'
         }
         
-        from utils.activity_validator import validate_activity_payload
+        from utils.activity_validator import validate_many
+        from utils.coefficient_profiles import coefficients_for, grid_region_for
         from utils.emissions import calculate_activity_emission
-        from utils.firebase_config import get_collection as get_fb_collection
+        from utils.sync_writes import create_sync_activities, find_stored_ids
         
         user_email = tokens_data.get('user_email')
-        activities_ref = get_fb_collection('activities')
         
         stats = {
             'outbound': {'found': 0, 'processed': 0, 'skipped': 0},
@@ -351,14 +352,13 @@ def sync_outlook(user_id):
                 attach_bytes = sum(int(att.get('size', 0)) for att in attachments)
             return attach_count, attach_bytes
         
-        def process_message(message: dict, direction: str, timestamp_field: str):
+        def process_message(message: dict, direction: str, timestamp_field: str, stored_ids: set, payloads: dict):
             try:
                 outlook_id = message.get('id')
                 if not outlook_id:
                     return
                 
-                existing_query = activities_ref.where('metadata.outlook_message_id', '==', outlook_id).limit(1).stream()
-                if list(existing_query):
+                if outlook_id in stored_ids or outlook_id in payloads:
                     stats[direction]['skipped'] += 1
                     return
                 
@@ -412,38 +412,59 @@ def sync_outlook(user_id):
                     }
                 }
                 
-                normalized = validate_activity_payload(activity_payload)
-                emission_kg = calculate_activity_emission(
-                    'email',
-                    attachment_size_mb=attachment_bytes / 1_000_000,
-                    recipients_count=len(deduped_recipients) or 1
-                )
-                
-                activity_doc = {
-                    'activity_type': normalized.activity_type,
-                    'provider': normalized.provider,
-                    'timestamp': normalized.timestamp,
-                    'platform': normalized.platform,
-                    'mode': 'sync',
-                    'extension_version': 'api-sync',
-                    'user_id': None,
-                    'user_email': normalized.user_email,
-                    'emission_kg': emission_kg,
-                    'payload': normalized.payload,
-                    'metadata': normalized.metadata,
-                    'raw_payload': activity_payload,
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow(),
-                }
-                
-                activities_ref.document().set(activity_doc)
-                stats[direction]['processed'] += 1
+                payloads[outlook_id] = activity_payload
             except Exception as exc:
                 print(f"[Outlook Sync] Error processing message {message.get('id')}: {exc}")
                 import traceback
                 traceback.print_exc()
                 stats[direction]['skipped'] += 1
         
+        def build_documents(direction: str, payloads: dict) -> dict:
+            new_docs = {}
+            for (outlook_id, activity_payload), (normalized, validation_error) in zip(
+                payloads.items(), validate_many(list(payloads.values())),
+            ):
+                try:
+                    if validation_error is not None:
+                        raise validation_error
+                    coefficients, emission_version = coefficients_for(normalized.user_email)
+                    grid_region = grid_region_for(normalized.user_email, metadata=normalized.metadata)
+                    emission_kg = calculate_activity_emission(
+                        'email',
+                        coefficients=coefficients,
+                        timestamp=normalized.timestamp,
+                        region=grid_region,
+                        attachment_size_mb=activity_payload['attachmentBytes'] / 1_000_000,
+                        recipients_count=len(activity_payload['recipients']) or 1
+                    )
+                    
+                    activity_doc = {
+                        'activity_type': normalized.activity_type,
+                        'provider': normalized.provider,
+                        'timestamp': normalized.timestamp,
+                        'platform': normalized.platform,
+                        'mode': 'sync',
+                        'extension_version': 'api-sync',
+                        'user_id': None,
+                        'user_email': normalized.user_email,
+                        'emission_kg': emission_kg,
+                        'emission_version': emission_version,
+                        'grid_region': grid_region,
+                        'payload': normalized.payload,
+                        'metadata': normalized.metadata,
+                        'raw_payload': activity_payload,
+                        'created_at': datetime.utcnow(),
+                        'updated_at': datetime.utcnow(),
+                    }
+                    
+                    new_docs[outlook_id] = activity_doc
+                except Exception as exc:
+                    print(f"[Outlook Sync] Error processing message {outlook_id}: {exc}")
+                    import traceback
+                    traceback.print_exc()
+                    stats[direction]['skipped'] += 1
+            return new_docs
+        
         list_configs = [
             (
                 'outbound',
@@ -486,8 +507,20 @@ def sync_outlook(user_id):
             
             messages = response.json().get('value', []) or []
             stats[direction]['found'] = len(messages)
+            stored_ids = find_stored_ids(
+                'outlook', user_email,
+                [message.get('id') for message in messages[:max_results]],
+            )
+            payloads = {}
             for message in messages[:max_results]:
-                process_message(message, direction, timestamp_field)
+                process_message(message, direction, timestamp_field, stored_ids, payloads)
+            new_docs = build_documents(direction, payloads)
+            
+            # Store and roll up per direction so an auth failure on the next list call keeps these
+            created_docs = create_sync_activities('outlook', user_email, new_docs)
+            stats[direction]['processed'] += len(created_docs)
+            stats[direction]['skipped'] += len(new_docs) - len(created_docs)
+            record_rollups(created_docs)
         
         total_found = sum(item['found'] for item in stats.values())
         total_processed = sum(item['processed'] for item in stats.values())
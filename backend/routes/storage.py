@@ -11,8 +11,11 @@ from googleapiclient.errors import HttpError
 import requests
 from utils.firebase_config import get_collection
 from utils.oauth_tokens import resolve_google_token_document
-from utils.activity_validator import validate_activity_payload
+from utils.activity_validator import validate_many
+from utils.coefficient_profiles import coefficients_for, grid_region_for
 from utils.emissions import calculate_activity_emission
+from utils.rollups import record_rollups
+from utils.sync_writes import create_sync_activities, find_stored_ids
 
 storage_bp = Blueprint('storage', __name__)
 
@@ -74,16 +77,20 @@ def sync_google_drive(user_id):
         files = results.get('files', [])
         
         user_email = tokens_data.get('user_email')
-        activities_ref = get_collection('activities')
         processed_count = 0
         skipped_count = 0
+        new_docs = {}
+        payloads = {}
+        stored_ids = find_stored_ids(
+            'google_drive', user_email,
+            [file.get('id') for file in files[:max_results]],
+        )
         
         for file in files[:max_results]:
             try:
                 # Check if already exists
                 file_id = file.get('id')
-                existing_query = activities_ref.where('metadata.google_drive_file_id', '==', file_id).limit(1).stream()
-                if list(existing_query):
+                if not file_id or file_id in stored_ids or file_id in payloads:
                     skipped_count += 1
                     continue
                 
@@ -124,13 +131,31 @@ def sync_google_drive(user_id):
                     }
                 }
                 
-                # Validate and save
-                normalized = validate_activity_payload(activity_payload)
+                payloads[file_id] = (activity_payload, {
+                    'upload_size_mb': size_mb,
+                    'storage_gb': total_storage_gb,
+                    'days_stored': days_stored,
+                })
+                
+            except Exception as e:
+                print(f"[Google Drive Sync] Error processing file {file.get('id')}: {e}")
+                skipped_count += 1
+                continue
+        
+        for (file_id, (activity_payload, emission_args)), (normalized, validation_error) in zip(
+            payloads.items(), validate_many([activity_payload for activity_payload, _ in payloads.values()]),
+        ):
+            try:
+                if validation_error is not None:
+                    raise validation_error
+                coefficients, emission_version = coefficients_for(normalized.user_email)
+                grid_region = grid_region_for(normalized.user_email, metadata=normalized.metadata)
                 emission_kg = calculate_activity_emission(
                     'storage',
-                    upload_size_mb=size_mb,
-                    storage_gb=total_storage_gb,
-                    days_stored=days_stored
+                    coefficients=coefficients,
+                    timestamp=normalized.timestamp,
+                    region=grid_region,
+                    **emission_args,
                 )
                 
                 activity_doc = {
@@ -143,6 +168,8 @@ def sync_google_drive(user_id):
                     'user_id': None,
                     'user_email': normalized.user_email,
                     'emission_kg': emission_kg,
+                    'emission_version': emission_version,
+                    'grid_region': grid_region,
                     'payload': normalized.payload,
                     'metadata': normalized.metadata,
                     'raw_payload': activity_payload,
@@ -150,13 +177,16 @@ def sync_google_drive(user_id):
                     'updated_at': datetime.utcnow(),
                 }
                 
-                activities_ref.document().set(activity_doc)
-                processed_count += 1
+                new_docs[file_id] = activity_doc
                 
             except Exception as e:
-                print(f"[Google Drive Sync] Error processing file {file.get('id')}: {e}")
+                print(f"[Google Drive Sync] Error processing file {file_id}: {e}")
                 skipped_count += 1
-                continue
+        
+        created_docs = create_sync_activities('google_drive', user_email, new_docs)
+        processed_count = len(created_docs)
+        skipped_count += len(new_docs) - len(created_docs)
+        record_rollups(created_docs)
         
         return jsonify({
             'success': True,
@@ -248,16 +278,20 @@ def sync_onedrive(user_id):
         files = response.json().get('value', [])
         
         user_email = tokens_data.get('user_email')
-        activities_ref = get_collection('activities')
         processed_count = 0
         skipped_count = 0
+        new_docs = {}
+        payloads = {}
+        stored_ids = find_stored_ids(
+            'onedrive', user_email,
+            [file.get('id') for file in files[:max_results]],
+        )
         
         for file in files[:max_results]:
             try:
                 # Check if already exists
                 file_id = file.get('id')
-                existing_query = activities_ref.where('metadata.onedrive_file_id', '==', file_id).limit(1).stream()
-                if list(existing_query):
+                if not file_id or file_id in stored_ids or file_id in payloads:
                     skipped_count += 1
                     continue
                 
@@ -298,13 +332,31 @@ def sync_onedrive(user_id):
                     }
                 }
                 
-                # Validate and save
-                normalized = validate_activity_payload(activity_payload)
+                payloads[file_id] = (activity_payload, {
+                    'upload_size_mb': size_mb,
+                    'storage_gb': total_storage_gb,
+                    'days_stored': days_stored,
+                })
+                
+            except Exception as e:
+                print(f"[OneDrive Sync] Error processing file {file.get('id')}: {e}")
+                skipped_count += 1
+                continue
+        
+        for (file_id, (activity_payload, emission_args)), (normalized, validation_error) in zip(
+            payloads.items(), validate_many([activity_payload for activity_payload, _ in payloads.values()]),
+        ):
+            try:
+                if validation_error is not None:
+                    raise validation_error
+                coefficients, emission_version = coefficients_for(normalized.user_email)
+                grid_region = grid_region_for(normalized.user_email, metadata=normalized.metadata)
                 emission_kg = calculate_activity_emission(
                     'storage',
-                    upload_size_mb=size_mb,
-                    storage_gb=total_storage_gb,
-                    days_stored=days_stored
+                    coefficients=coefficients,
+                    timestamp=normalized.timestamp,
+                    region=grid_region,
+                    **emission_args,
                 )
                 
                 activity_doc = {
@@ -317,6 +369,8 @@ def sync_onedrive(user_id):
                     'user_id': None,
                     'user_email': normalized.user_email,
                     'emission_kg': emission_kg,
+                    'emission_version': emission_version,
+                    'grid_region': grid_region,
                     'payload': normalized.payload,
                     'metadata': normalized.metadata,
                     'raw_payload': activity_payload,
@@ -324,13 +378,16 @@ def sync_onedrive(user_id):
                     'updated_at': datetime.utcnow(),
                 }
                 
-                activities_ref.document().set(activity_doc)
-                processed_count += 1
+                new_docs[file_id] = activity_doc
                 
             except Exception as e:
-                print(f"[OneDrive Sync] Error processing file {file.get('id')}: {e}")
+                print(f"[OneDrive Sync] Error processing file {file_id}: {e}")
                 skipped_count += 1
-                continue
+        
+        created_docs = create_sync_activities('onedrive', user_email, new_docs)
+        processed_count = len(created_docs)
+        skipped_count += len(new_docs) - len(created_docs)
+        record_rollups(created_docs)
         
         return jsonify({
             'success': True,
@@ -0,0 +1,43 @@
+"""
+utils.bloom_filter.BloomFilter.merge, which seen-filter saves use to keep
+concurrent workers' additions. Run from backend/: python -m unittest discover tests
+"""
+
+import unittest
+
+from utils.bloom_filter import BloomFilter
+
+
+class BloomMergeTest(unittest.TestCase):
+    def test_merge_keeps_both_sides(self):
+        ours = BloomFilter.for_capacity(1000)
+        theirs = BloomFilter.for_capacity(1000)
+        ours.update(f'ours-{index}' for index in range(300))
+        theirs.update(f'theirs-{index}' for index in range(300))
+
+        ours.merge(theirs)
+
+        self.assertTrue(all(f'ours-{index}' in ours for index in range(300)))
+        self.assertTrue(all(f'theirs-{index}' in ours for index in range(300)))
+        self.assertEqual(ours.bits_set, sum(bin(byte).count('1') for byte in ours.bits))
+        self.assertTrue(550 <= ours.count <= 650)
+
+    def test_merge_survives_round_trip(self):
+        ours = BloomFilter.for_capacity(100)
+        ours.add('a')
+        stored = BloomFilter.from_bytes(ours.to_bytes())
+        stored.add('b')
+
+        ours.merge(stored)
+        ours.merge(stored)
+
+        self.assertIn('b', ours)
+        self.assertEqual(ours.count, 2)
+
+    def test_merge_rejects_other_shapes(self):
+        with self.assertRaises(ValueError):
+            BloomFilter.for_capacity(100).merge(BloomFilter.for_capacity(200))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Checkpoint handling of utils.gmail_sync.sync_gmail_incremental with a fake
+Gmail service. Run from backend/: python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from utils import gmail_sync
+from utils.activity_validator import validate_many
+
+
+class _FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.ids = []
+
+    def add(self, _request, request_id):
+        self.ids.append(request_id)
+
+    def execute(self):
+        for request_id in self.ids:
+            status = self.service.statuses.get(request_id)
+            if status:
+                self.callback(request_id, None, HttpError(httplib2.Response({'status': status}), b'error'))
+            else:
+                self.callback(request_id, {'id': request_id, 'labelIds': ['INBOX'], 'payload': {'mimeType': 'text/plain'}}, None)
+
+
+class _FakeService(mock.MagicMock):
+    """messages.get answers from ``statuses``: an HTTP error status per ID, else the message."""
+
+    def new_batch_http_request(self, callback):
+        return _FakeBatch(self, callback)
+
+
+class SyncCheckpointTest(unittest.TestCase):
+    def sync(self, statuses, retry=None, refs=None):
+        service = _FakeService()
+        service.statuses = statuses
+        tokens_ref = mock.MagicMock()
+        tokens_data = {'user_email': 'me@example.com', 'gmail_history': {'history_id': '100', 'retry': retry or []}}
+        if refs is None:
+            refs = [('kept', 'inbound'), ('other', 'inbound')]
+
+        def write(_provider, _owner, docs):
+            return list(docs.values()), []
+
+        with mock.patch.object(gmail_sync, 'load_google_token', return_value=(None, tokens_ref, tokens_data, {})), \
+                mock.patch.object(gmail_sync, 'build_gmail_service', return_value=service), \
+                mock.patch.object(gmail_sync, 'list_history_changes', return_value=(refs, '200')), \
+                mock.patch.object(gmail_sync, 'find_stored_ids', return_value=set()), \
+                mock.patch.object(gmail_sync, 'write_sync_activities', side_effect=write), \
+                mock.patch.object(gmail_sync, 'record_rollups'), \
+                mock.patch.object(gmail_sync.time, 'sleep'), \
+                mock.patch.object(
+                    gmail_sync.GmailMessageProcessor, 'build_activities',
+                    lambda self, items: [{'metadata': {'direction': direction}} for _, direction, _ in items],
+                ):
+            result = gmail_sync.sync_gmail_incremental('me@example.com')
+        return result, tokens_ref
+
+    def test_deleted_message_does_not_hold_checkpoint(self):
+        result, tokens_ref = self.sync({'other': '404'})
+
+        self.assertEqual(result['processed'], 1)
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual(result['failed'], 0)
+        self.assertTrue(result['checkpoint_advanced'])
+        checkpoint = tokens_ref.set.call_args[0][0][gmail_sync.HISTORY_CHECKPOINT_FIELD]
+        self.assertEqual(checkpoint['history_id'], '200')
+
+    def test_unavailable_message_is_kept_for_retry(self):
+        result, tokens_ref = self.sync({'other': '503'})
+
+        self.assertEqual(result['processed'], 1)
+        self.assertEqual(result['failed'], 1)
+        self.assertTrue(result['checkpoint_advanced'])
+        checkpoint = tokens_ref.set.call_args[0][0][gmail_sync.HISTORY_CHECKPOINT_FIELD]
+        self.assertEqual(checkpoint['history_id'], '200')
+        self.assertEqual(checkpoint['retry'], [{'id': 'other', 'direction': 'inbound', 'attempts': 1}])
+
+    def test_retried_message_leaves_retry_list(self):
+        retry = [{'id': 'old', 'direction': 'inbound', 'attempts': 2}]
+        result, tokens_ref = self.sync({}, retry=retry, refs=[])
+
+        self.assertEqual(result['processed'], 1)
+        self.assertEqual(result['retry_pending'], 0)
+        checkpoint = tokens_ref.set.call_args[0][0][gmail_sync.HISTORY_CHECKPOINT_FIELD]
+        self.assertEqual(checkpoint['retry'], [])
+
+    def test_message_out_of_attempts_is_given_up(self):
+        retry = [{'id': 'old', 'direction': 'inbound', 'attempts': gmail_sync.MAX_MESSAGE_ATTEMPTS - 1}]
+        result, tokens_ref = self.sync({'old': '503'}, retry=retry, refs=[])
+
+        self.assertEqual(result['failed'], 1)
+        self.assertTrue(result['checkpoint_advanced'])
+        checkpoint = tokens_ref.set.call_args[0][0][gmail_sync.HISTORY_CHECKPOINT_FIELD]
+        self.assertEqual(checkpoint['retry'], [])
+
+    def test_too_many_failures_hold_checkpoint(self):
+        refs = [(f'm{index}', 'inbound') for index in range(gmail_sync.MAX_RETRY_MESSAGES + 1)]
+        statuses = {message_id: '503' for message_id, _ in refs}
+        result, tokens_ref = self.sync(statuses, refs=refs)
+
+        self.assertFalse(result['checkpoint_advanced'])
+        tokens_ref.set.assert_not_called()
+
+
+class WindowCatchUpTest(unittest.TestCase):
+    def sync(self, catch_up_results):
+        service = _FakeService()
+        service.users().getProfile().execute.return_value = {'historyId': '300'}
+        tokens_ref = mock.MagicMock()
+        tokens_data = {'user_email': 'me@example.com', 'gmail_history': {'catch_up_results': catch_up_results}}
+
+        def pages(_service, _direction, _params, max_results):
+            yield [], max_results + 1, True
+
+        with mock.patch.object(gmail_sync, 'load_google_token', return_value=(None, tokens_ref, tokens_data, {})), \
+                mock.patch.object(gmail_sync, 'build_gmail_service', return_value=service), \
+                mock.patch.object(gmail_sync, 'list_window_pages', side_effect=pages):
+            result = gmail_sync.sync_gmail_incremental('me@example.com')
+        return result, tokens_ref.set.call_args[0][0][gmail_sync.HISTORY_CHECKPOINT_FIELD]
+
+    def test_truncated_window_doubles_cap(self):
+        result, checkpoint = self.sync(1000)
+
+        self.assertFalse(result['checkpoint_advanced'])
+        self.assertEqual(checkpoint['catch_up_results'], min(2000, gmail_sync.MAX_CATCH_UP_RESULTS))
+
+    def test_window_truncated_at_max_cap_advances(self):
+        result, checkpoint = self.sync(10 * gmail_sync.MAX_CATCH_UP_RESULTS)
+
+        self.assertTrue(result['truncated'])
+        self.assertTrue(result['checkpoint_advanced'])
+        self.assertEqual(checkpoint['history_id'], '300')
+        self.assertEqual(checkpoint['catch_up_results'], 0)
+
+
+
+class BuildActivitiesTest(unittest.TestCase):
+    def test_chunk_is_validated_once(self):
+        processor = gmail_sync.GmailMessageProcessor({}, 'me@example.com')
+        message = {'id': 'ok', 'internalDate': '1700000000000', 'payload': {'headers': [{'name': 'To', 'value': 'a@example.com'}]}}
+        items = [(message, 'outbound', (1, 2_000_000)), ({'id': 'no-date'}, 'inbound', (0, 0)), (dict(message, id='ok-2'), 'inbound', (0, 0))]
+
+        with mock.patch('utils.activity_validator.validate_many', wraps=validate_many) as batch:
+            docs = processor.build_activities(items)
+
+        batch.assert_called_once()
+        self.assertEqual(len(batch.call_args[0][0]), 2)
+        self.assertIsNone(docs[1])
+        self.assertEqual([docs[0]['metadata']['gmail_message_id'], docs[2]['metadata']['gmail_message_id']], ['ok', 'ok-2'])
+        self.assertEqual(docs[0]['metadata']['direction'], 'outbound')
+        self.assertEqual(docs[2]['metadata']['direction'], 'inbound')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Write-behind ingest (ASYNC_INGEST): an activity the queue drops must not
+keep answering retries from the idempotency cache.
+Run from backend/: python -m unittest discover tests
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from routes import activities
+from utils.ingest_queue import IngestQueue
+
+PAYLOAD = {
+    'activityType': 'email',
+    'provider': 'gmail',
+    'timestamp': '2026-01-05T10:00:00Z',
+    'user_email': 'me@example.com',
+    'emission_kg': 0.004,
+}
+HEADERS = {activities.IDEMPOTENCY_HEADER: 'retry-after-drop'}
+
+
+class DroppedActivityRetryTest(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(activities.activities_bp, url_prefix='/api/activities')
+        self.client = app.test_client()
+
+        self.flushed = []
+        self.dropped = threading.Semaphore(0)
+
+        def flush(batch):
+            self.flushed.append([activity_id for activity_id, _ in batch])
+            raise RuntimeError('Firestore unavailable')
+
+        def on_drop(batch):
+            activities._forget_dropped_activities(batch)
+            self.dropped.release()
+
+        self.queue = IngestQueue(flush, batch_size=10, flush_interval=0.01, workers=1, max_attempts=1, on_drop=on_drop)
+        self.queue.start()
+        patches = [
+            mock.patch.object(activities, 'ASYNC_INGEST', True),
+            mock.patch.object(activities, '_ingest_queue', self.queue),
+            mock.patch.object(activities, '_recent_ingest_responses', activities.LRUCache(100)),
+            mock.patch.object(activities, '_build_activity_document', lambda normalized, emission_kg, *_: {'emission_kg': emission_kg}),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.queue.stop, 1.0)
+
+    def test_retry_after_drop_is_enqueued_again(self):
+        first = self.client.post('/api/activities/log', json=PAYLOAD, headers=HEADERS)
+        self.assertEqual(first.status_code, 202)
+        self.assertTrue(self.dropped.acquire(timeout=5))
+
+        retry = self.client.post('/api/activities/log', json=PAYLOAD, headers=HEADERS)
+        self.assertEqual(retry.status_code, 202)
+        self.assertEqual(retry.get_json()['activityId'], first.get_json()['activityId'])
+        self.assertTrue(self.dropped.acquire(timeout=5))
+
+        activity_id = first.get_json()['activityId']
+        self.assertEqual(self.flushed, [[activity_id], [activity_id]])
+
+
+if __name__ == '__main__':
+    unittest.main()
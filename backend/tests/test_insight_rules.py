@@ -0,0 +1,126 @@
+"""
+Parity of the rule-table insight wrappers (utils.insights.generate_*_insight)
+with the hand-written functions they replaced, kept below as ``legacy_*``.
+Run from backend/: python -m unittest discover tests
+"""
+
+import random
+import unittest
+
+from utils import insights
+
+
+def legacy_email_insight(email_count, avg_attachment_size, team_avg=None, team_p90=None):
+    if team_p90 and email_count > team_p90:
+        return (
+            f"You sent {email_count} emails this week, more than 90% of your team (typical: {team_p90:.0f}). "
+            "Try batching updates or using collaboration tools instead."
+        )
+    if team_avg and email_count > team_avg * 1.4:
+        percentage = int(((email_count - team_avg) / team_avg) * 100)
+        return (
+            f"You sent {percentage}% more emails this week than your team average. "
+            "Try batching updates or using collaboration tools instead."
+        )
+    if email_count > 100:
+        return (
+            f"You sent {email_count} emails this week. "
+            "Consider consolidating multiple updates into fewer, comprehensive emails."
+        )
+    if avg_attachment_size > 5:
+        return (
+            f"Your average attachment size is {avg_attachment_size:.1f}MB. "
+            "Use cloud storage links (Drive/OneDrive) instead of attachments to reduce emissions."
+        )
+    return None
+
+
+def legacy_meeting_insight(meeting_hours, avg_duration, has_video_count, total_meetings):
+    if avg_duration > 60:
+        return (
+            f"Your average meeting duration is {avg_duration:.0f} minutes. "
+            "Try keeping meetings under 30 minutes when possible, or split longer sessions."
+        )
+    video_percentage = (has_video_count / total_meetings * 100) if total_meetings > 0 else 0
+    if video_percentage > 80 and avg_duration < 15:
+        return "For short meetings (<15 min), consider audio-only mode to reduce emissions by 75%."
+    if meeting_hours > 20:
+        return (
+            f"You spent {meeting_hours:.1f} hours in meetings this week. "
+            "Evaluate if all meetings are necessary or if async communication could work."
+        )
+    return None
+
+
+def legacy_storage_insight(storage_gb, unused_estimate_gb):
+    if unused_estimate_gb > 1:
+        return (
+            f"Deleting {unused_estimate_gb:.1f}GB of unused data could save ~{unused_estimate_gb * 3.6:.1f}kg CO₂ per year. "
+            "Review and clean up old files regularly."
+        )
+    if storage_gb > 50:
+        return (
+            f"You're using {storage_gb:.1f}GB of cloud storage. "
+            "Consider archiving old files or using compression for large documents."
+        )
+    return None
+
+
+def legacy_web_insight(idle_tabs, streaming_hours):
+    if idle_tabs > 10:
+        return (
+            f"Detected {idle_tabs} idle browser tabs. "
+            "Close unused tabs to reduce energy consumption and emissions."
+        )
+    if streaming_hours > 5:
+        return (
+            f"You streamed {streaming_hours:.1f} hours this week. "
+            "Consider downloading content for offline viewing when possible."
+        )
+    return None
+
+
+class InsightWrapperParityTest(unittest.TestCase):
+    CASES = 5000
+
+    def setUp(self):
+        self.rng = random.Random(14)
+
+    def test_email(self):
+        rng = self.rng
+        cases = [(0, 20, None, None), (0, 0, None, None), (0, 20, 10, 30)]
+        for _ in range(self.CASES):
+            cases.append((
+                rng.choice([0, 1, rng.randint(0, 300)]),
+                rng.choice([0, 5, rng.uniform(0, 12)]),
+                rng.choice([None, 0, rng.uniform(1, 150)]),
+                rng.choice([None, 0, rng.uniform(1, 250)]),
+            ))
+        for case in cases:
+            self.assertEqual(insights.generate_email_insight(*case), legacy_email_insight(*case), case)
+
+    def test_meeting(self):
+        rng = self.rng
+        cases = [(29, 51, 1, 0), (0, 90, 0, 0), (21, 10, 0, 0)]
+        for _ in range(self.CASES):
+            total = rng.choice([0, 1, rng.randint(0, 40)])
+            cases.append((
+                rng.choice([0, 20, rng.uniform(0, 40)]),
+                rng.choice([0, 15, 60, rng.uniform(0, 120)]),
+                rng.randint(0, total) if total else 0,
+                total,
+            ))
+        for case in cases:
+            self.assertEqual(insights.generate_meeting_insight(*case), legacy_meeting_insight(*case), case)
+
+    def test_storage_and_web(self):
+        rng = self.rng
+        for _ in range(self.CASES):
+            storage = (rng.choice([0, 50, rng.uniform(0, 120)]), rng.choice([0, 1, rng.uniform(0, 5)]))
+            self.assertEqual(insights.generate_storage_insight(*storage), legacy_storage_insight(*storage), storage)
+            web = (rng.choice([0, 10, rng.randint(0, 30)]), rng.choice([0, 5, rng.uniform(0, 12)]))
+            self.assertEqual(insights.generate_web_insight(*web), legacy_web_insight(*web), web)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+"""
+Parameter validation of GET /api/activities (list_activities).
+Run from backend/: python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from routes import activities
+
+
+class ListLimitTest(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(activities.activities_bp, url_prefix='/api/activities')
+        self.client = app.test_client()
+
+    def test_invalid_limit_is_rejected(self):
+        with mock.patch.object(activities, 'get_collection') as get_collection:
+            for limit in ('0', '-5', 'abc', '1.5'):
+                response = self.client.get('/api/activities', query_string={'userEmail': 'me@example.com', 'limit': limit})
+                self.assertEqual(response.status_code, 400, limit)
+        get_collection.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Batching of utils.rollups.apply_rollups and the rollup version writes that
+travel with it. Run from backend/: python -m unittest discover tests
+"""
+
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from utils import rollups
+
+
+class _Batch:
+    def __init__(self, committed):
+        self.committed = committed
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref.path, data))
+
+    def commit(self):
+        self.committed.append(self.writes)
+
+
+class _Collection:
+    def __init__(self, name):
+        self.name = name
+
+    def document(self, doc_id):
+        return mock.Mock(path=f'{self.name}/{doc_id}')
+
+
+class ApplyRollupsTest(unittest.TestCase):
+    def apply(self, folded, batch=None):
+        committed = []
+        db = mock.Mock()
+        db.batch.side_effect = lambda: _Batch(committed)
+        with mock.patch.object(rollups, 'get_collection', side_effect=_Collection), \
+                mock.patch.object(rollups, 'get_db', return_value=db):
+            rollups.apply_rollups(folded, batch=batch)
+        return committed
+
+    def folded(self, users, days):
+        activities = [
+            {'user_email': f'user{user}@example.com', 'user_id': f'id{user}', 'activity_type': 'email',
+             'timestamp': (date(2024, 1, 1) + timedelta(days=day)).isoformat() + 'T12:00:00+00:00', 'emission_kg': 0.1}
+            for user in range(users) for day in range(days)
+        ]
+        return rollups.fold_rollups(activities)
+
+    def test_commits_stay_under_write_limit(self):
+        committed = self.apply(self.folded(users=300, days=2))
+
+        self.assertGreater(len(committed), 1)
+        self.assertTrue(all(len(writes) <= rollups.FIRESTORE_MAX_BATCH_WRITES for writes in committed))
+        rollup_writes = [path for writes in committed for path, _ in writes if path.startswith('daily_rollups/')]
+        self.assertEqual(len(rollup_writes), 600)
+
+    def test_each_commit_bumps_versions_of_its_users(self):
+        for writes in self.apply(self.folded(users=300, days=2)):
+            paths = {path for path, _ in writes}
+            for path in paths:
+                if path.startswith('daily_rollups/'):
+                    user_key = path.split('/', 1)[1].rsplit('_', 1)[0]
+                    self.assertIn(f'rollup_versions/{user_key}', paths)
+
+    def test_versions_cover_email_and_user_id_keys(self):
+        batch = _Batch([])
+        self.apply(self.folded(users=1, days=3), batch=batch)
+
+        versions = sorted(path for path, _ in batch.writes if path.startswith('rollup_versions/'))
+        self.assertEqual(versions, ['rollup_versions/id0', 'rollup_versions/user0@example.com'])
+
+
+if __name__ == '__main__':
+    unittest.main()
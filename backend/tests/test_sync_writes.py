@@ -0,0 +1,36 @@
+"""
+utils.sync_writes.find_stored_ids with a seen filter and legacy (random-ID)
+activities. Run from backend/: python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from utils import sync_writes
+from utils.bloom_filter import BloomFilter
+
+
+class FindStoredIdsTest(unittest.TestCase):
+    def test_legacy_activity_missed_by_filter_is_found(self):
+        # Seeded through the owner query, which doesn't match this casing
+        legacy = mock.Mock()
+        legacy.to_dict.return_value = {'user_email': 'Jane.Doe@Example.com', 'metadata': {'gmail_message_id': 'legacy-1'}}
+        activities = mock.Mock()
+        activities.where.return_value.select.return_value.stream.return_value = [legacy]
+        db = mock.Mock()
+        db.get_all.return_value = []
+
+        with mock.patch.object(sync_writes, 'LEGACY_DEDUPE', True), \
+                mock.patch.object(sync_writes, 'get_seen_filter', return_value=BloomFilter.for_capacity(100)), \
+                mock.patch.object(sync_writes, 'record_lookups'), \
+                mock.patch.object(sync_writes, 'get_collection', return_value=activities), \
+                mock.patch.object(sync_writes, 'get_db', return_value=db):
+            stored = sync_writes.find_stored_ids('gmail', 'jane.doe@example.com', ['legacy-1', 'new-1'])
+
+        self.assertEqual(stored, {'legacy-1'})
+        db.get_all.assert_not_called()
+        activities.where.assert_called_once_with('metadata.gmail_message_id', 'in', ['legacy-1', 'new-1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""
+Batching of utils.user_totals.apply_user_totals when sharding adds a parent
+identity write per user. Run from backend/: python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from utils import user_totals
+
+
+class ApplyUserTotalsTest(unittest.TestCase):
+    def test_sharded_writes_are_chunked(self):
+        committed = []
+
+        def new_batch():
+            batch = mock.Mock()
+            batch.commit.side_effect = lambda: committed.append(batch.set.call_count)
+            return batch
+
+        db = mock.Mock()
+        db.batch.side_effect = new_batch
+        activities = [
+            {'user_id': f'user-{index}', 'user_email': f'user{index}@example.com', 'activity_type': 'email', 'emission_kg': 0.1}
+            for index in range(400)
+        ]
+        with mock.patch.object(user_totals, 'DEFAULT_SHARD_COUNT', 4), \
+                mock.patch.object(user_totals, '_identified_parents', user_totals.LRUCache(max_entries=1000)), \
+                mock.patch.object(user_totals, 'get_collection'), \
+                mock.patch.object(user_totals, 'get_db', return_value=db):
+            user_totals.apply_user_totals(user_totals.fold_user_totals(activities))
+
+        self.assertEqual(sum(committed), 800)
+        self.assertTrue(all(writes <= user_totals.FIRESTORE_MAX_BATCH_WRITES for writes in committed))
+
+
+if __name__ == '__main__':
+    unittest.main()
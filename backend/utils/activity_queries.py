@@ -0,0 +1,180 @@
+"""
+Activity query helpers.
+Builds Firestore queries over the activities collection with user and time
+filters pushed down to the server, so reads scale with one user's data
+instead of the whole collection. Required composite indexes are declared in
+backend/firestore.indexes.json.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Tuple
+
+from google.cloud import firestore
+
+# Firestore caps the number of values in an 'in' filter
+MAX_IN_VALUES = 30
+
+# Dotted field paths made of plain identifiers, e.g. "payload.duration_minutes"
+_FIELD_PATH_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+MAX_PROJECTED_FIELDS = 50
+
+
+def email_lookup_candidates(user_email: Optional[str]) -> List[str]:
+    """Spellings of an email that stored activities may use.
+
+    New documents usually carry the provider's lowercase address, but legacy
+    documents were stored exactly as the client sent them. Firestore equality
+    is case-sensitive, so we match the address as given, fully lowercased,
+    and with only the (case-insensitive) domain lowercased.
+
+    Known limitation: a legacy document whose local part uses a different
+    mixed casing than the request (stored ``John.Doe@x.com``, requested
+    ``john.doe@x.com`` or ``JOHN.DOE@x.com``) is not matched. Stored emails
+    are not rewritten because rollups, seen-ID filters and sync document IDs
+    are keyed on them; clients should send the address as the account
+    reports it, or query by userId.
+    """
+    if not user_email:
+        return []
+    email = str(user_email).strip()
+    if not email:
+        return []
+
+    candidates = [email, email.lower()]
+    local, sep, domain = email.rpartition('@')
+    if sep:
+        candidates.append(f'{local}@{domain.lower()}')
+
+    unique: List[str] = []
+    for candidate in candidates:
+        if candidate not in unique:
+            unique.append(candidate)
+    return unique[:MAX_IN_VALUES]
+
+
+def build_activities_query(
+    activities_ref: Any,
+    *,
+    user_email: Optional[str] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    activity_type: Optional[str] = None,
+    provider: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+):
+    """Return a query for one user's activities, newest first.
+
+    Equality filters on user_email/user_id plus the timestamp range are all
+    evaluated by Firestore; without a user filter the whole collection is
+    ordered by timestamp (admin/debug use only). The document ID breaks ties
+    between equal timestamps so page cursors are total and stable.
+
+    ``activity_type``/``provider`` are pushed down as equality filters and
+    ``fields`` becomes a server-side projection (see parse_field_projection).
+    """
+    query = activities_ref
+    candidates = email_lookup_candidates(user_email)
+    if len(candidates) == 1:
+        query = query.where('user_email', '==', candidates[0])
+    elif candidates:
+        query = query.where('user_email', 'in', candidates)
+    if user_id:
+        query = query.where('user_id', '==', user_id)
+    if activity_type:
+        query = query.where('activity_type', '==', activity_type)
+    if provider:
+        query = query.where('provider', '==', provider)
+    if since:
+        query = query.where('timestamp', '>=', since)
+    if until:
+        query = query.where('timestamp', '<=', until)
+    if fields:
+        query = query.select(fields)
+    return (
+        query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+        .order_by(firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+    )
+
+
+def parse_field_projection(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a ``fields=a,b.c`` parameter into Firestore field paths.
+
+    ``timestamp`` is always included because page cursors are built from it;
+    ``id`` is accepted but dropped since the document ID is always returned.
+    Raises ValueError for malformed paths.
+    """
+    if not value:
+        return None
+    fields: List[str] = []
+    for raw in value.split(','):
+        field = raw.strip()
+        if not field or field == 'id':
+            continue
+        if not _FIELD_PATH_PATTERN.match(field):
+            raise ValueError(f'Invalid field: {field}')
+        if field not in fields:
+            fields.append(field)
+    if len(fields) > MAX_PROJECTED_FIELDS:
+        raise ValueError(f'Too many fields (max {MAX_PROJECTED_FIELDS})')
+    if 'timestamp' not in fields:
+        fields.append('timestamp')
+    return fields
+
+
+def encode_page_token(timestamp: Any, doc_id: str) -> str:
+    """Opaque cursor pointing just after the (timestamp, document ID) of the last item of a page."""
+    if isinstance(timestamp, datetime):
+        value = {'t': 'dt', 'v': timestamp.isoformat()}
+    else:
+        value = {'t': 'raw', 'v': timestamp}
+    raw = json.dumps({'ts': value, 'id': doc_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_token(token: str) -> Tuple[Any, str]:
+    """Inverse of encode_page_token. Raises ValueError for malformed tokens."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        value = data['ts']
+        doc_id = data['id']
+        timestamp = datetime.fromisoformat(value['v']) if value['t'] == 'dt' else value['v']
+    except Exception as exc:  # pylint: disable=broad-except
+        raise ValueError('Invalid pageToken') from exc
+    if not isinstance(doc_id, str) or not doc_id:
+        raise ValueError('Invalid pageToken')
+    return timestamp, doc_id
+
+
+def apply_page_token(query: Any, page_token: Optional[str]):
+    """Resume a build_activities_query() query after the cursor in ``page_token``."""
+    if not page_token:
+        return query
+    timestamp, doc_id = decode_page_token(page_token)
+    return query.start_after({'timestamp': timestamp, '__name__': doc_id})
+
+
+def stream_query_pages(query: Any, page_size: int = 500) -> Iterator[Any]:
+    """Yield every document of a build_activities_query() query, page by page.
+
+    Each page is a separate bounded request resumed with start_after, so
+    arbitrarily long histories are read with constant memory and without
+    holding one long-lived stream open.
+    """
+    cursor = None
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        docs = list(page_query.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+        cursor = {'timestamp': last.get('timestamp'), '__name__': last.id}
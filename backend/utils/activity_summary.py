@@ -0,0 +1,243 @@
+"""
+Activity Summary Module
+Server-side replacement for the frontend's buildAggregations: folds
+activities into per-day metrics and derives day/week/month buckets plus
+per-type statistics from them.
+
+Per-day metrics have a fixed nested shape (see ``activity_metrics``) so the
+same numbers can be summed from raw activities or from pre-aggregated days.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+
+# Fields a summary needs; used as a Firestore projection when scanning activities
+SUMMARY_FIELDS = [
+    'timestamp',
+    'activity_type',
+    'provider',
+    'emission_kg',
+    'payload.direction',
+    'payload.recipients',
+    'payload.attachment_count',
+    'payload.attachment_bytes',
+    'payload.duration_minutes',
+    'payload.participants_count',
+    'payload.has_video',
+    'payload.size_mb',
+    'payload.total_storage_gb',
+]
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def activity_metrics(activity: Dict[str, Any]) -> Dict[str, Any]:
+    """Contribution of one stored activity to its day's metrics."""
+    activity_type = activity.get('activity_type') or activity.get('activityType') or 'unknown'
+    provider = activity.get('provider') or 'unknown'
+    emission_kg = float(activity.get('emission_kg') or activity.get('emissionKg') or 0.0)
+    payload = activity.get('payload') or {}
+
+    metrics: Dict[str, Any] = {
+        'emission_kg': emission_kg,
+        'count': 1,
+        'by_type': {activity_type: {'count': 1, 'emission_kg': emission_kg}},
+        'by_provider': {provider: {'count': 1, 'emission_kg': emission_kg}},
+    }
+
+    if activity_type == 'email':
+        direction = str(payload.get('direction') or 'outbound').lower()
+        metrics['email'] = {
+            'recipients': len(payload.get('recipients') or []),
+            'attachments': int(payload.get('attachment_count') or payload.get('attachmentCount') or 0),
+            'attachment_bytes': int(payload.get('attachment_bytes') or payload.get('attachmentBytes') or 0),
+            'outbound': 1 if direction != 'inbound' else 0,
+            'inbound': 1 if direction == 'inbound' else 0,
+        }
+    elif activity_type == 'meeting':
+        minutes = float(payload.get('duration_minutes') or payload.get('durationMinutes') or 0)
+        has_video = payload.get('has_video', payload.get('hasVideo', True))
+        metrics['meeting'] = {
+            'minutes': minutes,
+            'participants': int(payload.get('participants_count') or payload.get('participantsCount') or 1),
+            'video_count': 1 if has_video else 0,
+            'video_minutes': minutes if has_video else 0.0,
+        }
+    elif activity_type == 'storage':
+        metrics['storage'] = {
+            'size_mb': float(payload.get('size_mb') or payload.get('sizeMb') or 0.0),
+            'total_storage_gb': float(payload.get('total_storage_gb') or payload.get('totalStorageGb') or 0.0),
+        }
+    elif activity_type == 'browsing':
+        metrics['browsing'] = {
+            'minutes': float(payload.get('duration_minutes') or payload.get('durationMinutes') or 0),
+        }
+    return metrics
+
+
+def emission_delta_metrics(activity: Dict[str, Any]) -> Dict[str, Any]:
+    """Metrics change when an already counted activity's emission changes by ``emission_kg``."""
+    activity_type = activity.get('activity_type') or activity.get('activityType') or 'unknown'
+    provider = activity.get('provider') or 'unknown'
+    delta = float(activity.get('emission_kg') or 0.0)
+    return {
+        'emission_kg': delta,
+        'by_type': {activity_type: {'emission_kg': delta}},
+        'by_provider': {provider: {'emission_kg': delta}},
+    }
+
+
+def merge_metrics(target: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Add ``delta`` into ``target`` in place (nested dicts are summed key by key)."""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            merge_metrics(target.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + value
+    return target
+
+
+def activity_day(timestamp: Any) -> Optional[date]:
+    """UTC calendar day of a stored activity timestamp."""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc)
+        return timestamp.date()
+    if isinstance(timestamp, str):
+        try:
+            return activity_day(datetime.fromisoformat(timestamp.replace('Z', '+00:00')))
+        except ValueError:
+            return None
+    return None
+
+
+class ActivitySummaryBuilder:
+    """Single-pass accumulator over activities (or pre-aggregated days)."""
+
+    def __init__(self):
+        self._days: Dict[date, Dict[str, Any]] = {}
+        self._last_activity_at: Optional[datetime] = None
+
+    def add_activity(self, activity: Dict[str, Any]) -> None:
+        timestamp = activity.get('timestamp')
+        day = activity_day(timestamp)
+        if day is None:
+            return
+        self.add_day(day, activity_metrics(activity))
+        if isinstance(timestamp, datetime) and (self._last_activity_at is None or timestamp > self._last_activity_at):
+            self._last_activity_at = timestamp
+
+    def add_day(self, day: date, metrics: Dict[str, Any], last_activity_at: Optional[datetime] = None) -> None:
+        merge_metrics(self._days.setdefault(day, {}), metrics)
+        if isinstance(last_activity_at, datetime) and (self._last_activity_at is None or last_activity_at > self._last_activity_at):
+            self._last_activity_at = last_activity_at
+
+    def build(self) -> Dict[str, Any]:
+        totals: Dict[str, Any] = {}
+        buckets: Dict[str, Dict[str, Dict[str, Any]]] = {granularity: {} for granularity in GRANULARITIES}
+        for day in sorted(self._days):
+            metrics = self._days[day]
+            merge_metrics(totals, metrics)
+            for granularity in GRANULARITIES:
+                key, start = _bucket_key(day, granularity)
+                bucket = buckets[granularity].setdefault(key, {'period': key, 'start': start.isoformat()})
+                merge_metrics(bucket.setdefault('_metrics', {}), metrics)
+
+        return {
+            'totals': _format_bucket_metrics(totals),
+            'lastActivityAt': self._last_activity_at.isoformat() if self._last_activity_at else None,
+            'buckets': {
+                granularity: [
+                    {'period': bucket['period'], 'start': bucket['start'], **_format_bucket_metrics(bucket['_metrics'])}
+                    for bucket in by_key.values()
+                ]
+                for granularity, by_key in buckets.items()
+            },
+            'stats': _type_stats(totals),
+        }
+
+
+def summarize_activities(activities: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    builder = ActivitySummaryBuilder()
+    for activity in activities:
+        builder.add_activity(activity)
+    return builder.build()
+
+
+def _bucket_key(day: date, granularity: str):
+    if granularity == 'week':
+        iso_year, iso_week, iso_weekday = day.isocalendar()
+        return f'{iso_year}-W{iso_week:02d}', day - timedelta(days=iso_weekday - 1)
+    if granularity == 'month':
+        return day.strftime('%Y-%m'), day.replace(day=1)
+    return day.isoformat(), day
+
+
+def _format_bucket_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'emissionKg': round(metrics.get('emission_kg', 0.0), 6),
+        'count': metrics.get('count', 0),
+        'byType': _format_breakdown(metrics.get('by_type')),
+        'byProvider': _format_breakdown(metrics.get('by_provider')),
+    }
+
+
+def _format_breakdown(breakdown: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        key: {'count': value.get('count', 0), 'emissionKg': round(value.get('emission_kg', 0.0), 6)}
+        for key, value in (breakdown or {}).items()
+    }
+
+
+def _type_stats(totals: Dict[str, Any]) -> Dict[str, Any]:
+    by_type = totals.get('by_type') or {}
+
+    def type_totals(activity_type: str):
+        entry = by_type.get(activity_type) or {}
+        return entry.get('count', 0), round(entry.get('emission_kg', 0.0), 6)
+
+    email = totals.get('email') or {}
+    email_count, email_emission = type_totals('email')
+    meeting = totals.get('meeting') or {}
+    meeting_count, meeting_emission = type_totals('meeting')
+    storage = totals.get('storage') or {}
+    storage_count, storage_emission = type_totals('storage')
+    browsing = totals.get('browsing') or {}
+    browsing_count, browsing_emission = type_totals('browsing')
+    meeting_minutes = meeting.get('minutes', 0)
+
+    return {
+        'email': {
+            'total': email_count,
+            'emissionKg': email_emission,
+            'avgEmissionKg': round(email_emission / email_count, 6) if email_count else 0,
+            'outbound': email.get('outbound', 0),
+            'inbound': email.get('inbound', 0),
+            'avgRecipients': round(email.get('recipients', 0) / email_count, 2) if email_count else 0,
+            'attachments': email.get('attachments', 0),
+            'attachmentBytes': email.get('attachment_bytes', 0),
+            'avgAttachmentMb': round(email.get('attachment_bytes', 0) / email_count / 1_000_000, 3) if email_count else 0,
+        },
+        'meeting': {
+            'total': meeting_count,
+            'emissionKg': meeting_emission,
+            'totalMinutes': round(meeting_minutes, 2),
+            'avgDurationMinutes': round(meeting_minutes / meeting_count, 2) if meeting_count else 0,
+            'avgParticipants': round(meeting.get('participants', 0) / meeting_count, 1) if meeting_count else 0,
+            'videoShare': round(meeting.get('video_count', 0) / meeting_count, 3) if meeting_count else 0,
+            'videoMinutesShare': round(meeting.get('video_minutes', 0) / meeting_minutes, 3) if meeting_minutes else 0,
+        },
+        'storage': {
+            'total': storage_count,
+            'emissionKg': storage_emission,
+            'uploadedMb': round(storage.get('size_mb', 0.0), 2),
+            'avgStorageGb': round(storage.get('total_storage_gb', 0.0) / storage_count, 3) if storage_count else 0,
+        },
+        'browsing': {
+            'total': browsing_count,
+            'emissionKg': browsing_emission,
+            'totalMinutes': round(browsing.get('minutes', 0), 2),
+        },
+    }
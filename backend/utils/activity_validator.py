@@ -1,10 +1,15 @@
-"""Activity payload validation and normalization utilities."""
+"""Activity payload validation and normalization utilities.
+
+Per-type payload normalizers are generated once at import from
+ACTIVITY_SCHEMAS and compiled into straight-line functions, and validated
+activities are immutable slotted records, so validating an event costs a
+handful of dict lookups and one tuple allocation.
+"""
 
 from __future__ import annotations
 
-from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 ALLOWED_ACTIVITY_TYPES = {
     'email',
@@ -26,12 +31,46 @@ ALLOWED_PROVIDERS = {
 DEFAULT_EXTENSION_VERSION = 'unknown'
 DEFAULT_MODE = 'awareness'
 
+# Normalized payload per activity type: (stored field, payload key, kind, default).
+# Kinds: str (stripped, non-strings -> default), int/float (coerced, failures ->
+# default), bool (truthiness, missing -> default), direction (lowercased string,
+# empty -> default), recipients (list or comma-separated string).
+ACTIVITY_SCHEMAS = {
+    'email': (
+        ('subject', 'subject', 'str', ''),
+        ('recipients', 'recipients', 'recipients', None),
+        ('body_preview', 'bodyPreview', 'str', ''),
+        ('attachment_count', 'attachmentCount', 'int', 0),
+        ('attachment_bytes', 'attachmentBytes', 'int', 0),
+        ('direction', 'direction', 'direction', 'outbound'),
+        ('sender', 'sender', 'str', ''),
+    ),
+    'meeting': (
+        ('title', 'title', 'str', ''),
+        ('duration_minutes', 'durationMinutes', 'int', 0),
+        ('participants_count', 'participantsCount', 'int', 1),
+        ('has_video', 'hasVideo', 'bool', True),
+    ),
+    'storage': (
+        ('action', 'action', 'str', ''),
+        ('size_mb', 'sizeMb', 'float', 0.0),
+        ('total_storage_gb', 'totalStorageGb', 'float', 0.0),
+        ('days_stored', 'daysStored', 'int', 0),
+    ),
+    'browsing': (
+        ('site', 'site', 'str', ''),
+        ('category', 'category', 'str', ''),
+        ('duration_minutes', 'durationMinutes', 'int', 0),
+    ),
+}
+
 class ActivityValidationError(ValueError):
     """Raised when an incoming activity payload fails validation."""
 
 
-@dataclass
-class NormalizedActivity:
+class NormalizedActivity(NamedTuple):
+    """Validated activity (immutable, slotted)."""
+
     activity_type: str
     provider: str
     timestamp: datetime
@@ -44,18 +83,7 @@ class NormalizedActivity:
     metadata: Dict[str, Any]
 
     def to_dict(self) -> Dict[str, Any]:
-        return {
-            'activity_type': self.activity_type,
-            'provider': self.provider,
-            'timestamp': self.timestamp,
-            'platform': self.platform,
-            'mode': self.mode,
-            'extension_version': self.extension_version,
-            'user_id': self.user_id,
-            'user_email': self.user_email,
-            'payload': self.payload,
-            'metadata': self.metadata,
-        }
+        return self._asdict()
 
 
 def validate_activity_payload(payload: Dict[str, Any]) -> NormalizedActivity:
@@ -70,108 +98,180 @@ def validate_activity_payload(payload: Dict[str, Any]) -> NormalizedActivity:
     Raises:
         ActivityValidationError: if validation fails
     """
+    return _validate(payload, None)
+
+
+def validate_many(
+    payloads: Iterable[Dict[str, Any]],
+) -> List[Tuple[Optional[NormalizedActivity], Optional[Exception]]]:
+    """Validate a batch of payloads; one bad payload never fails the others.
+
+    Args:
+        payloads: Raw JSON payloads
+
+    Returns:
+        list: One ``(activity, None)`` or ``(None, error)`` per payload, in order.
+        The error is an ActivityValidationError, or the unexpected exception
+        validating that payload raised
+    """
+    timestamps: Dict[str, datetime] = {}
+    results: List[Tuple[Optional[NormalizedActivity], Optional[Exception]]] = []
+    append = results.append
+    for payload in payloads:
+        try:
+            append((_validate(payload, timestamps), None))
+        except Exception as exc:  # pylint: disable=broad-except
+            append((None, exc))
+    return results
+
+
+def _validate(payload: Dict[str, Any], timestamps: Optional[Dict[str, datetime]]) -> NormalizedActivity:
     if not isinstance(payload, dict):
         raise ActivityValidationError('Payload must be a JSON object')
+    get = payload.get
 
-    activity_type = _require_string(payload, 'activityType').lower()
+    activity_type = get('activityType')
+    if not isinstance(activity_type, str) or not activity_type.strip():
+        raise ActivityValidationError('Missing or invalid activityType')
+    activity_type = activity_type.strip().lower()
     if activity_type not in ALLOWED_ACTIVITY_TYPES:
         raise ActivityValidationError(f'Unsupported activityType: {activity_type}')
 
-    provider = _optional_string(payload, 'provider', '').lower()
+    provider = get('provider')
+    provider = provider.strip().lower() if isinstance(provider, str) else ''
     if provider and provider not in ALLOWED_PROVIDERS:
         raise ActivityValidationError(f'Unsupported provider: {provider}')
     elif not provider:
         provider = _infer_provider(activity_type, payload)
 
-    platform = _optional_string(payload, 'platform', provider)
-    mode = _optional_string(payload, 'mode', DEFAULT_MODE)
-    extension_version = _optional_string(payload, 'extensionVersion', DEFAULT_EXTENSION_VERSION)
-
-    timestamp = _parse_timestamp(_optional_string(payload, 'timestamp', ''))
-
-    user_info = payload.get('user')
+    value = get('platform')
+    platform = value.strip() if isinstance(value, str) else provider
+    value = get('mode')
+    mode = value.strip() if isinstance(value, str) else DEFAULT_MODE
+    value = get('extensionVersion')
+    extension_version = value.strip() if isinstance(value, str) else DEFAULT_EXTENSION_VERSION
+
+    value = get('timestamp')
+    value = value.strip() if isinstance(value, str) else ''
+    if timestamps is None or not value:
+        timestamp = _parse_timestamp(value)
+    else:
+        timestamp = timestamps.get(value)
+        if timestamp is None:
+            timestamp = timestamps[value] = _parse_timestamp(value)
+
+    user_info = get('user')
     user_id: Optional[str] = None
     user_email: Optional[str] = None
     if isinstance(user_info, dict):
-        user_id = _optional_string(user_info, 'id', None)
-        user_email = _optional_string(user_info, 'email', None)
+        value = user_info.get('id')
+        user_id = value.strip() if isinstance(value, str) else None
+        value = user_info.get('email')
+        user_email = value.strip() if isinstance(value, str) else None
     # Also check for top-level user_email (from extension)
     if not user_email:
-        user_email = _optional_string(payload, 'user_email', None)
+        value = get('user_email')
+        user_email = value.strip() if isinstance(value, str) else None
+    metadata = get('metadata')
+    if not isinstance(metadata, dict):
+        metadata = {}
     # Also check metadata for account_email
     if not user_email:
-        metadata_temp = payload.get('metadata')
-        if isinstance(metadata_temp, dict):
-            user_email = _optional_string(metadata_temp, 'account_email', None)
-
-    metadata = payload.get('metadata') if isinstance(payload.get('metadata'), dict) else {}
-    normalized_payload = _normalize_activity_details(activity_type, payload)
+        value = metadata.get('account_email')
+        user_email = value.strip() if isinstance(value, str) else None
 
+    normalize = _NORMALIZERS.get(activity_type)
     return NormalizedActivity(
-        activity_type=activity_type,
-        provider=provider,
-        timestamp=timestamp,
-        platform=platform,
-        mode=mode,
-        extension_version=extension_version,
-        user_id=user_id,
-        user_email=user_email,
-        payload=normalized_payload,
-        metadata=metadata,
+        activity_type,
+        provider,
+        timestamp,
+        platform,
+        mode,
+        extension_version,
+        user_id,
+        user_email,
+        normalize(payload) if normalize else {},
+        metadata,
     )
 
 
-def _normalize_activity_details(activity_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    if activity_type == 'email':
-        direction = _optional_string(payload, 'direction', 'outbound')
-        direction = direction.lower() if direction else 'outbound'
-        return {
-            'subject': _optional_string(payload, 'subject', ''),
-            'recipients': _normalize_recipients(payload.get('recipients')),
-            'body_preview': _optional_string(payload, 'bodyPreview', ''),
-            'attachment_count': _optional_int(payload, 'attachmentCount', 0),
-            'attachment_bytes': _optional_int(payload, 'attachmentBytes', 0),
-            'direction': direction,
-            'sender': _optional_string(payload, 'sender', ''),
-        }
-
-    if activity_type == 'meeting':
-        return {
-            'title': _optional_string(payload, 'title', ''),
-            'duration_minutes': _optional_int(payload, 'durationMinutes', 0),
-            'participants_count': _optional_int(payload, 'participantsCount', 1),
-            'has_video': bool(payload.get('hasVideo', True)),
-        }
-
-    if activity_type == 'storage':
-        return {
-            'action': _optional_string(payload, 'action', ''),
-            'size_mb': _optional_float(payload, 'sizeMb', 0.0),
-            'total_storage_gb': _optional_float(payload, 'totalStorageGb', 0.0),
-            'days_stored': _optional_int(payload, 'daysStored', 0),
-        }
+_FIELD_TEMPLATES = {
+    'str': (
+        "    value = get({key!r})\n"
+        "    {var} = value.strip() if isinstance(value, str) else {default!r}\n"
+    ),
+    'int': (
+        "    value = get({key!r})\n"
+        "    if value is None:\n"
+        "        {var} = {default!r}\n"
+        "    elif value.__class__ is int:\n"
+        "        {var} = value\n"
+        "    else:\n"
+        "        try:\n"
+        "            {var} = int(value)\n"
+        "        except (TypeError, ValueError):\n"
+        "            {var} = {default!r}\n"
+    ),
+    'float': (
+        "    value = get({key!r})\n"
+        "    if value is None:\n"
+        "        {var} = {default!r}\n"
+        "    elif value.__class__ is float:\n"
+        "        {var} = value\n"
+        "    else:\n"
+        "        try:\n"
+        "            {var} = float(value)\n"
+        "        except (TypeError, ValueError):\n"
+        "            {var} = {default!r}\n"
+    ),
+    'bool': "    {var} = bool(get({key!r}, {default!r}))\n",
+    'direction': (
+        "    value = get({key!r})\n"
+        "    {var} = value.strip().lower() if isinstance(value, str) else ''\n"
+        "    if not {var}:\n"
+        "        {var} = {default!r}\n"
+    ),
+    'recipients': "    {var} = _normalize_recipients(get({key!r}))\n",
+}
 
-    if activity_type == 'browsing':
-        return {
-            'site': _optional_string(payload, 'site', ''),
-            'category': _optional_string(payload, 'category', ''),
-            'duration_minutes': _optional_int(payload, 'durationMinutes', 0),
-        }
 
-    return {}
+def compile_normalizer(activity_type: str, fields: Tuple[Tuple[str, str, str, Any], ...]):
+    """Generate the payload normalizer of one activity type from its schema."""
+    lines = [f"def normalize_{activity_type}(payload):\n", "    get = payload.get\n"]
+    for index, (_, key, kind, default) in enumerate(fields):
+        if kind not in _FIELD_TEMPLATES:
+            raise ValueError(f'Unknown field kind {kind!r} in {activity_type} schema')
+        lines.append(_FIELD_TEMPLATES[kind].format(key=key, var=f'v{index}', default=default))
+    lines.append(
+        "    return {" + ", ".join(f"{field!r}: v{index}" for index, (field, _, _, _) in enumerate(fields)) + "}\n"
+    )
+    namespace: Dict[str, Any] = {'_normalize_recipients': _normalize_recipients}
+    exec(compile(''.join(lines), f'<{activity_type} normalizer>', 'exec'), namespace)  # pylint: disable=exec-used
+    return namespace[f'normalize_{activity_type}']
 
 
 def _normalize_recipients(value: Any) -> List[str]:
     if isinstance(value, list):
-        return [str(item).strip() for item in value if str(item).strip()]
+        return [stripped for item in value if (stripped := str(item).strip())]
     if isinstance(value, str):
         return [entry.strip() for entry in value.split(',') if entry.strip()]
     return []
 
 
+_NORMALIZERS = {activity_type: compile_normalizer(activity_type, fields) for activity_type, fields in ACTIVITY_SCHEMAS.items()}
+
+
 def _parse_timestamp(value: str) -> datetime:
     if not value:
         return datetime.utcnow()
+    # Fast path for the common UTC form sent by clients ('...T12:34:56.789Z')
+    if value[-1] == 'Z' and len(value) > 11 and value[10] == 'T':
+        try:
+            dt = datetime.fromisoformat(value[:-1])
+        except ValueError:
+            dt = None
+        if dt is not None and dt.tzinfo is None:
+            return dt
     try:
         dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
         if dt.tzinfo is None:
@@ -181,13 +281,6 @@ def _parse_timestamp(value: str) -> datetime:
         raise ActivityValidationError('timestamp must be in ISO 8601 format') from exc
 
 
-def _require_string(container: Dict[str, Any], key: str) -> str:
-    value = container.get(key)
-    if not isinstance(value, str) or not value.strip():
-        raise ActivityValidationError(f'Missing or invalid {key}')
-    return value.strip()
-
-
 def _optional_string(container: Dict[str, Any], key: str, default: Optional[str]) -> Optional[str]:
     value = container.get(key)
     if value is None:
@@ -197,26 +290,6 @@ def _optional_string(container: Dict[str, Any], key: str, default: Optional[str]
     return default
 
 
-def _optional_int(container: Dict[str, Any], key: str, default: int) -> int:
-    value = container.get(key)
-    if value is None:
-        return default
-    try:
-        return int(value)
-    except (TypeError, ValueError):
-        return default
-
-
-def _optional_float(container: Dict[str, Any], key: str, default: float) -> float:
-    value = container.get(key)
-    if value is None:
-        return default
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return default
-
-
 def _infer_provider(activity_type: str, payload: Dict[str, Any]) -> str:
     platform = _optional_string(payload, 'platform', '')
     if platform:
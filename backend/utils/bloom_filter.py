@@ -0,0 +1,113 @@
+"""
+Bloom Filter
+Fixed-size probabilistic set of strings in pure Python. Membership tests
+never miss an added key and wrongly report an absent key with a rate set by
+the capacity and target false-positive rate it was sized for.
+``to_bytes``/``from_bytes`` give a compact binary form that fits in a
+Firestore bytes field.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import struct
+from typing import Iterable
+
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BIIQQ')  # version, num_bits, num_hashes, count, bits_set
+_MASK64 = (1 << 64) - 1
+
+
+class BloomFilter:
+    """Bloom filter over strings using double hashing of one BLAKE2b digest."""
+
+    def __init__(self, num_bits: int, num_hashes: int):
+        self.num_bits = max(8, int(num_bits))
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.bits_set = 0
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float = 0.01) -> 'BloomFilter':
+        """Filter sized so ``capacity`` keys give a false-positive rate of ``fp_rate``."""
+        capacity = max(1, int(capacity))
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        num_bits = self.num_bits
+        return [((h1 + i * h2) & _MASK64) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> bool:
+        """Add ``key``; returns False when it was (probably) present already."""
+        bits = self.bits
+        added = False
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                self.bits_set += 1
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def same_shape(self, other: 'BloomFilter') -> bool:
+        return self.num_bits == other.num_bits and self.num_hashes == other.num_hashes
+
+    def merge(self, other: 'BloomFilter') -> None:
+        """OR ``other``'s bits into this filter (both must have the same shape).
+
+        The union's key count isn't known exactly; it is estimated from the
+        bits set, and never below either filter's own count.
+        """
+        if not self.same_shape(other):
+            raise ValueError('Cannot merge bloom filters of different shapes')
+        merged = int.from_bytes(self.bits, 'little') | int.from_bytes(other.bits, 'little')
+        self.bits = bytearray(merged.to_bytes(len(self.bits), 'little'))
+        self.bits_set = bin(merged).count('1')
+        if self.bits_set >= self.num_bits:
+            estimate = max(self.count, other.count)
+        else:
+            estimate = round(-self.num_bits / self.num_hashes * math.log(1 - self.bits_set / self.num_bits))
+        self.count = max(self.count, other.count, estimate)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def fill_ratio(self) -> float:
+        return self.bits_set / self.num_bits
+
+    @property
+    def estimated_fp_rate(self) -> float:
+        """False-positive rate implied by the fraction of bits set."""
+        return self.fill_ratio ** self.num_hashes
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_FORMAT_VERSION, self.num_bits, self.num_hashes, self.count, self.bits_set) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        version, num_bits, num_hashes, count, bits_set = _HEADER.unpack_from(data, 0)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f'Unsupported bloom filter format version: {version}')
+        bloom = cls(num_bits, num_hashes)
+        bits = data[_HEADER.size:]
+        if len(bits) != len(bloom.bits):
+            raise ValueError('Bloom filter data is truncated')
+        bloom.bits = bytearray(bits)
+        bloom.count = count
+        bloom.bits_set = bits_set
+        return bloom
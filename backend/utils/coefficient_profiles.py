@@ -0,0 +1,195 @@
+"""
+Coefficient Profiles Module
+Per-organization emission coefficient overrides stored in the ``settings``
+collection, e.g.::
+
+    settings/coefficients_acme = {
+        'kind': 'emission_coefficients',
+        'org_id': 'acme',
+        'domains': ['acme.com', 'acme.co.uk'],
+        'revision': '3',
+        'grid_region': 'GB',
+        'coefficients': {'meeting_per_hour_video': 1.2},
+    }
+
+Profiles are held in an immutable ProfileSnapshot. A Firestore snapshot
+listener builds a new snapshot on every change and swaps the module
+reference in one assignment, so readers never lock and never hit Firestore.
+Orgs follow utils.thresholds: an explicit org_id, or ``domain:{domain}``.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+from utils.emissions import EMISSION_COEFFICIENT_VERSIONS, EMISSION_VERSION
+from utils.grid_intensity import DEFAULT_GRID_REGION, get_grid_table
+
+PROFILE_KIND = 'emission_coefficients'
+
+
+@dataclass(frozen=True)
+class CoefficientProfile:
+    org_id: str
+    revision: str
+    domains: Tuple[str, ...]
+    overrides: Mapping[str, float]
+    coefficients: Mapping[str, float]  # EMISSION_VERSION set with the overrides applied
+    grid_region: Optional[str] = None
+
+    def merged(self, version: str = EMISSION_VERSION) -> Mapping[str, float]:
+        """Coefficients of ``version`` with this profile's overrides applied."""
+        if version == EMISSION_VERSION:
+            return self.coefficients
+        return MappingProxyType({**EMISSION_COEFFICIENT_VERSIONS[version], **self.overrides})
+
+    @property
+    def stamp(self) -> str:
+        return f'{self.org_id}@{self.revision}'
+
+
+@dataclass(frozen=True)
+class ProfileSnapshot:
+    profiles: Mapping[str, CoefficientProfile] = field(default_factory=lambda: MappingProxyType({}))
+    by_domain: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    loaded_at: Optional[datetime] = None
+
+    def resolve(self, user_email: Optional[str] = None, org_id: Optional[str] = None) -> Optional[CoefficientProfile]:
+        """Profile for an org ID, else for the email's domain; None means the default coefficients."""
+        if org_id and org_id in self.profiles:
+            return self.profiles[org_id]
+        _, sep, domain = str(user_email or '').strip().lower().rpartition('@')
+        if not sep or not domain:
+            return None
+        profile_org = self.by_domain.get(domain)
+        return self.profiles.get(profile_org) if profile_org else None
+
+
+_snapshot = ProfileSnapshot()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def current_snapshot() -> ProfileSnapshot:
+    return _snapshot
+
+
+def coefficients_for(
+    user_email: Optional[str] = None,
+    org_id: Optional[str] = None,
+    version: str = EMISSION_VERSION,
+) -> Tuple[Mapping[str, float], str]:
+    """Coefficients to use for a user/org and the ``emission_version`` stamp that records them.
+
+    One dict lookup on the current snapshot; no locks, no Firestore reads.
+    """
+    profile = _snapshot.resolve(user_email, org_id)
+    coefficients = EMISSION_COEFFICIENT_VERSIONS[version] if profile is None else profile.merged(version)
+    return coefficients, emission_stamp(version, profile)
+
+
+def grid_region_for(
+    user_email: Optional[str] = None,
+    org_id: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    """Grid region of an activity: client-sent ``metadata.grid_region``, else the org profile's, else the default."""
+    region = (metadata or {}).get('grid_region')
+    if isinstance(region, str) and region.strip():
+        return region.strip().upper()
+    profile = _snapshot.resolve(user_email, org_id)
+    return (profile.grid_region if profile else None) or DEFAULT_GRID_REGION
+
+
+def emission_stamp(version: str, profile: Optional[CoefficientProfile] = None) -> str:
+    """``emission_version`` value for a coefficient version, optional org profile and loaded grid table."""
+    stamp = f'{version}+{profile.stamp}' if profile else version
+    grid_table = get_grid_table()
+    return f'{stamp}+grid@{grid_table.version}' if grid_table else stamp
+
+
+def build_snapshot(documents: Iterable[Any]) -> ProfileSnapshot:
+    """Build an immutable snapshot from ``settings`` profile documents; invalid ones are skipped."""
+    base = EMISSION_COEFFICIENT_VERSIONS[EMISSION_VERSION]
+    profiles: Dict[str, CoefficientProfile] = {}
+    by_domain: Dict[str, str] = {}
+    for doc in documents:
+        data = doc.to_dict() or {}
+        org_id = str(data.get('org_id') or doc.id)
+        try:
+            overrides = _validate_overrides(data.get('coefficients') or {})
+        except ValueError as exc:
+            print(f"[Coefficient Profiles] Skipping profile {doc.id}: {exc}")
+            continue
+        update_time = getattr(doc, 'update_time', None)
+        revision = str(data.get('revision') or (update_time.isoformat() if update_time else '0'))
+        domains = tuple(sorted({str(domain).strip().lower() for domain in data.get('domains') or [] if str(domain).strip()}))
+        if org_id.startswith('domain:'):
+            domains = tuple(sorted(set(domains) | {org_id[len('domain:'):]}))
+        profiles[org_id] = CoefficientProfile(
+            org_id=org_id,
+            revision=revision,
+            domains=domains,
+            overrides=MappingProxyType(overrides),
+            coefficients=MappingProxyType({**base, **overrides}),
+            grid_region=str(data['grid_region']).strip().upper() if data.get('grid_region') else None,
+        )
+        for domain in domains:
+            by_domain[domain] = org_id
+    return ProfileSnapshot(
+        profiles=MappingProxyType(profiles),
+        by_domain=MappingProxyType(by_domain),
+        loaded_at=datetime.utcnow(),
+    )
+
+
+def load_profiles() -> ProfileSnapshot:
+    """One-shot read of all profiles (for jobs); also installs the result as the current snapshot."""
+    global _snapshot
+    from utils.firebase_config import get_collection
+
+    _snapshot = build_snapshot(get_collection('settings').where('kind', '==', PROFILE_KIND).stream())
+    return _snapshot
+
+
+def start_profile_listener() -> None:
+    """Keep the snapshot in sync with ``settings`` (idempotent). Errors are logged, never raised."""
+    global _listener
+    from utils.firebase_config import get_collection
+
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        def on_snapshot(documents, changes, read_time):
+            global _snapshot
+            try:
+                snapshot = build_snapshot(documents)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[Coefficient Profiles] Failed to rebuild profiles, keeping previous snapshot: {exc}")
+                return
+            _snapshot = snapshot
+            print(f"[Coefficient Profiles] Loaded {len(snapshot.profiles)} profile(s)")
+
+        try:
+            _listener = get_collection('settings').where('kind', '==', PROFILE_KIND).on_snapshot(on_snapshot)
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[Coefficient Profiles] Could not start profile listener: {exc}")
+
+
+def _validate_overrides(raw: Dict[str, Any]) -> Dict[str, float]:
+    if not isinstance(raw, dict):
+        raise ValueError('coefficients must be a map')
+    base = EMISSION_COEFFICIENT_VERSIONS[EMISSION_VERSION]
+    overrides: Dict[str, float] = {}
+    for key, value in raw.items():
+        if key not in base:
+            raise ValueError(f'unknown coefficient {key!r}')
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f'coefficient {key!r} must be a non-negative number')
+        overrides[key] = float(value)
+    return overrides
@@ -0,0 +1,226 @@
+"""
+Emission Recompute Module
+Re-derives stored ``emission_kg`` values with a given coefficient version.
+
+Activities are paged in document-ID order and recomputed with
+``calculate_emissions_batch``, using each user's org coefficient profile
+(utils.coefficient_profiles) when one applies. Each chunk is committed as one write batch
+holding the activity updates, the user-totals and daily-rollup corrections
+for the emission deltas, and the job checkpoint. A restart therefore
+resumes exactly after the last committed chunk, and no delta is applied
+twice.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+
+from utils.coefficient_profiles import coefficients_for, grid_region_for, load_profiles
+from utils.emissions import (
+    CLIENT_EMISSION_VERSION,
+    EMISSION_VERSION,
+    activity_emission_columns,
+    calculate_emissions_batch,
+    get_emission_coefficients,
+)
+from utils.firebase_config import get_collection, get_db
+from utils.rollups import apply_rollups, fold_rollups
+from utils.user_totals import apply_user_totals, fold_user_totals
+
+# The ingest API's client emission keys, in its order of precedence
+CLIENT_EMISSION_KEYS = ('emission_kg', 'emissionKg', 'emission_g', 'emissionG')
+CLIENT_EMISSION_PATHS = [f'raw_payload.{key}' for key in CLIENT_EMISSION_KEYS]
+
+RECOMPUTE_FIELDS = [
+    'activity_type',
+    'provider',
+    'timestamp',
+    'user_email',
+    'user_id',
+    'mode',
+    'emission_kg',
+    'emission_version',
+    'grid_region',
+    'payload',
+    # Client-provided emissions of activities stored before emission_version existed
+    *CLIENT_EMISSION_PATHS,
+]
+# Each activity can add one user-totals write, one rollup write and two rollup
+# version writes next to its own update, so 95 activities (+ checkpoint) stay
+# under Firestore's 500 writes
+MAX_DOCS_PER_COMMIT = 95
+# Differences below half a milligram are rounding noise, not a changed emission
+EMISSION_TOLERANCE_KG = 5e-7
+STAT_KEYS = ('scanned', 'updated', 'restamped', 'skipped')
+
+
+def checkpoint_ref(version: str):
+    return get_collection('job_checkpoints').document(f'emission_recompute_{version}')
+
+
+class _Throttle:
+    """Sleeps so that the average rate stays at or below ``rate`` items per second."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def wait(self, items: int) -> None:
+        self.count += items
+        if self.rate <= 0:
+            return
+        ahead = self.count / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def recompute_emissions(
+    *,
+    version: str = EMISSION_VERSION,
+    page_size: int = 500,
+    max_docs_per_second: float = 200.0,
+    include_client: bool = False,
+    restart: bool = False,
+    max_docs: Optional[int] = None,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Recompute every activity's emission with coefficient set ``version``.
+
+    Activities already stamped with ``version`` and their current org
+    profile revision are skipped, as are
+    client-computed ones unless ``include_client``. Legacy activities without
+    a stamp are recomputed, except those whose stored payload carries a
+    client emission, which count as client-computed. ``max_docs`` stops after roughly that many
+    scanned activities (the checkpoint lets the next run continue).
+    """
+    get_emission_coefficients(version)  # validates the version
+    profiles = load_profiles()
+    print(f"[Emission Recompute] Using {len(profiles.profiles)} org coefficient profile(s)")
+    db = get_db()
+    state_ref = checkpoint_ref(version)
+
+    state: Dict[str, Any] = {}
+    if restart and not dry_run:
+        state_ref.delete()
+    if not restart:
+        snapshot = state_ref.get()
+        state = (snapshot.to_dict() or {}) if snapshot.exists else {}
+        if state.get('completed_at'):
+            print(f"[Emission Recompute] {version} already completed at {state['completed_at']}; use restart to run again")
+            return {**{key: state.get(key, 0) for key in STAT_KEYS}, 'completed': True}
+
+    cursor: Optional[str] = state.get('last_doc_id')
+    stats: Dict[str, Any] = {key: int(state.get(key, 0) or 0) for key in STAT_KEYS}
+    if cursor:
+        print(f"[Emission Recompute] Resuming {version} after {cursor} ({stats['scanned']} scanned so far)")
+
+    query = (
+        get_collection('activities')
+        .order_by(firestore.FieldPath.document_id())
+        .select(RECOMPUTE_FIELDS)
+    )
+    throttle = _Throttle(max_docs_per_second)
+    scanned_this_run = 0
+    completed = False
+
+    while True:
+        page_query = query.limit(page_size)
+        if cursor:
+            page_query = page_query.start_after({'__name__': cursor})
+        docs = list(page_query.stream())
+
+        for start in range(0, len(docs), MAX_DOCS_PER_COMMIT):
+            chunk = docs[start:start + MAX_DOCS_PER_COMMIT]
+            cursor = chunk[-1].id
+            _recompute_chunk(db, state_ref, chunk, version, include_client, stats, cursor, dry_run)
+            scanned_this_run += len(chunk)
+            throttle.wait(len(chunk))
+
+        print(f"[Emission Recompute] {stats['scanned']} scanned, {stats['updated']} updated, cursor={cursor}")
+        if len(docs) < page_size:
+            completed = True
+            break
+        if max_docs and scanned_this_run >= max_docs:
+            break
+
+    if completed and not dry_run:
+        state_ref.set({'completed_at': datetime.utcnow()}, merge=True)
+    return {**stats, 'completed': completed}
+
+
+def _legacy_client_stamp(raw_payload: Any) -> Optional[str]:
+    """CLIENT_EMISSION_VERSION when an unstamped activity's payload held a client emission the ingest API used."""
+    if not isinstance(raw_payload, dict):
+        return None
+    for key in CLIENT_EMISSION_KEYS:
+        value = raw_payload.get(key)
+        if value is None:
+            continue
+        try:
+            # Ingest ignored a zero (or unparsable) value and calculated the emission itself
+            return CLIENT_EMISSION_VERSION if float(value) else None
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _recompute_chunk(db, state_ref, chunk, version, include_client, stats, cursor, dry_run) -> None:
+    activities = [doc.to_dict() or {} for doc in chunk]
+    stats['scanned'] += len(chunk)
+
+    # Eligible activity indexes grouped by the stamp (version + org profile) they should carry
+    eligible: Dict[str, Tuple[Any, List[int]]] = {}
+    for index, activity in enumerate(activities):
+        if not activity.get('grid_region'):
+            activity['grid_region'] = grid_region_for(activity.get('user_email'))
+        raw_payload = activity.pop('raw_payload', None)
+        stamped = activity.get('emission_version') or _legacy_client_stamp(raw_payload)
+        coefficients, expected = coefficients_for(activity.get('user_email'), version=version)
+        if (stamped == expected and activity.get('emission_kg') is not None) or (
+            stamped == CLIENT_EMISSION_VERSION and not include_client
+        ):
+            stats['skipped'] += 1
+            continue
+        eligible.setdefault(expected, (coefficients, []))[1].append(index)
+
+    now = datetime.utcnow()
+    batch = db.batch()
+    deltas: List[Dict[str, Any]] = []
+    for expected, (coefficients, indexes) in eligible.items():
+        emissions = calculate_emissions_batch(
+            **activity_emission_columns([activities[index] for index in indexes]),
+            coefficients=coefficients,
+        )
+        for index, emission_kg in zip(indexes, emissions.tolist()):
+            activity = activities[index]
+            previous = float(activity.get('emission_kg') or 0.0)
+            update: Dict[str, Any] = {'emission_version': expected, 'grid_region': activity['grid_region'], 'updated_at': now}
+            if activity.get('emission_kg') is None or abs(emission_kg - previous) > EMISSION_TOLERANCE_KG:
+                update['emission_kg'] = emission_kg
+                stats['updated'] += 1
+                deltas.append({**activity, 'emission_kg': round(emission_kg - previous, 6)})
+            else:
+                stats['restamped'] += 1
+            batch.update(chunk[index].reference, update)
+
+    folded_rollups = fold_rollups(deltas, count_activities=False)
+    # Provider syncs never fed user totals (only rollups), so only their rollups are corrected
+    ingested = [delta for delta in deltas if delta.get('mode') != 'sync']
+    apply_user_totals(fold_user_totals(ingested, count_activities=False), batch=batch)
+    apply_rollups(folded_rollups, batch=batch)
+    batch.set(state_ref, {
+        'version': version,
+        'last_doc_id': cursor,
+        **{key: stats[key] for key in STAT_KEYS},
+        'updated_at': now,
+    }, merge=True)
+
+    if dry_run:
+        return
+    # apply_rollups bumped the users' rollup versions in this batch, which retires their cached insights
+    batch.commit()
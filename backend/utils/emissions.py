@@ -3,48 +3,72 @@ CO₂ Emission Calculation Module
 Calculates carbon emissions for different digital activities based on emission coefficients
 """
 
-# Emission coefficients (in kg CO₂)
-EMISSION_COEFFICIENTS = {
-    # Email emissions
-    # Aligning with user formula: C = 0.3 g base, A = 15 g per MB
-    'email_base': 0.0003,  # 0.3 g per email (base) -> 0.0003 kg
-    'email_attachment_per_mb': 0.015,  # 15 g per MB -> 0.015 kg per MB
-    
-    # Meeting emissions
-    'meeting_per_hour_video': 1.6,  # 1.6kg per hour with video
-    'meeting_per_hour_audio': 0.4,  # 0.4kg per hour audio-only
-    
-    # Storage emissions
-    'storage_per_gb_per_year': 3.6,  # 3.6kg per GB per year
-    'storage_upload_per_mb': 0.0001,  # 0.1g per MB uploaded
-    'storage_download_per_mb': 0.0001,  # 0.1g per MB downloaded
-    
-    # Web browsing emissions
-    'web_browsing_per_minute': 0.0002,  # 0.2g per minute
-    'pdf_reading_per_minute': 0.00015,  # 0.15g per minute
-    'streaming_per_minute': 0.0005,  # 0.5g per minute
+import os
+from datetime import datetime
+
+import numpy as np
+
+from utils.grid_intensity import UNKNOWN_REGION_CODE, get_grid_table, grid_factor, hour_of_year
+
+# Emission coefficient sets (in kg CO₂), keyed by version.
+# Never edit a published set: add a new version and recompute stored
+# activities with python -m jobs.recompute_emissions.
+EMISSION_COEFFICIENT_VERSIONS = {
+    'v1': {
+        # Email emissions
+        # Aligning with user formula: C = 0.3 g base, A = 15 g per MB
+        'email_base': 0.0003,  # 0.3 g per email (base) -> 0.0003 kg
+        'email_attachment_per_mb': 0.015,  # 15 g per MB -> 0.015 kg per MB
+    
+        # Meeting emissions
+        'meeting_per_hour_video': 1.6,  # 1.6kg per hour with video
+        'meeting_per_hour_audio': 0.4,  # 0.4kg per hour audio-only
+    
+        # Storage emissions
+        'storage_per_gb_per_year': 3.6,  # 3.6kg per GB per year
+        'storage_upload_per_mb': 0.0001,  # 0.1g per MB uploaded
+        'storage_download_per_mb': 0.0001,  # 0.1g per MB downloaded
+    
+        # Web browsing emissions
+        'web_browsing_per_minute': 0.0002,  # 0.2g per minute
+        'pdf_reading_per_minute': 0.00015,  # 0.15g per minute
+        'streaming_per_minute': 0.0005,  # 0.5g per minute
+    },
 }
 
-def calculate_email_emission(attachment_size_mb=0, recipients_count=1):
+# Version used for new calculations (stamped on activities as emission_version)
+EMISSION_VERSION = os.getenv('EMISSION_COEFFICIENTS_VERSION', 'v1')
+# Stamped on activities whose emission was computed by the client
+CLIENT_EMISSION_VERSION = 'client'
+
+if EMISSION_VERSION not in EMISSION_COEFFICIENT_VERSIONS:
+    raise ValueError(f"Unknown EMISSION_COEFFICIENTS_VERSION: {EMISSION_VERSION}")
+
+# Emission coefficients (in kg CO₂) of the current version
+EMISSION_COEFFICIENTS = EMISSION_COEFFICIENT_VERSIONS[EMISSION_VERSION]
+
+def calculate_email_emission(attachment_size_mb=0, recipients_count=1, coefficients=None):
     """
     Calculate CO₂ emission for sending an email
     
     Args:
         attachment_size_mb: Size of attachments in MB
         recipients_count: Number of recipients (default: 1)
+        coefficients: Coefficient dict to use (defaults to EMISSION_COEFFICIENTS)
     
     Returns:
         float: CO₂ emission in kg
     """
-    base_emission = EMISSION_COEFFICIENTS['email_base']
-    attachment_emission = attachment_size_mb * EMISSION_COEFFICIENTS['email_attachment_per_mb']
+    coef = EMISSION_COEFFICIENTS if coefficients is None else coefficients
+    base_emission = coef['email_base']
+    attachment_emission = attachment_size_mb * coef['email_attachment_per_mb']
     
     # Multiply by number of recipients (each recipient receives a copy)
     total_emission = (base_emission + attachment_emission) * recipients_count
     
     return round(total_emission, 6)  # Round to 6 decimal places (milligrams precision)
 
-def calculate_meeting_emission(duration_minutes, has_video=True, participants_count=1):
+def calculate_meeting_emission(duration_minutes, has_video=True, participants_count=1, coefficients=None):
     """
     Calculate CO₂ emission for a virtual meeting
     
@@ -52,23 +76,25 @@ def calculate_meeting_emission(duration_minutes, has_video=True, participants_co
         duration_minutes: Meeting duration in minutes
         has_video: Whether video was enabled (default: True)
         participants_count: Number of participants (default: 1)
+        coefficients: Coefficient dict to use (defaults to EMISSION_COEFFICIENTS)
     
     Returns:
         float: CO₂ emission in kg
     """
+    coef = EMISSION_COEFFICIENTS if coefficients is None else coefficients
     duration_hours = duration_minutes / 60.0
     
     if has_video:
-        emission_per_hour = EMISSION_COEFFICIENTS['meeting_per_hour_video']
+        emission_per_hour = coef['meeting_per_hour_video']
     else:
-        emission_per_hour = EMISSION_COEFFICIENTS['meeting_per_hour_audio']
+        emission_per_hour = coef['meeting_per_hour_audio']
     
     # Emission scales with participants (each participant consumes energy)
     total_emission = emission_per_hour * duration_hours * participants_count
     
     return round(total_emission, 6)
 
-def calculate_storage_emission(upload_size_mb=0, download_size_mb=0, storage_gb=0, days_stored=0):
+def calculate_storage_emission(upload_size_mb=0, download_size_mb=0, storage_gb=0, days_stored=0, coefficients=None):
     """
     Calculate CO₂ emission for cloud storage operations
     
@@ -77,16 +103,18 @@ def calculate_storage_emission(upload_size_mb=0, download_size_mb=0, storage_gb=
         download_size_mb: Size downloaded in MB
         storage_gb: Total storage used in GB
         days_stored: Number of days data is stored (for annual calculation)
+        coefficients: Coefficient dict to use (defaults to EMISSION_COEFFICIENTS)
     
     Returns:
         float: CO₂ emission in kg
     """
-    upload_emission = upload_size_mb * EMISSION_COEFFICIENTS['storage_upload_per_mb']
-    download_emission = download_size_mb * EMISSION_COEFFICIENTS['storage_download_per_mb']
+    coef = EMISSION_COEFFICIENTS if coefficients is None else coefficients
+    upload_emission = upload_size_mb * coef['storage_upload_per_mb']
+    download_emission = download_size_mb * coef['storage_download_per_mb']
     
     # Annual storage emission (prorated by days)
     if storage_gb > 0 and days_stored > 0:
-        annual_emission = EMISSION_COEFFICIENTS['storage_per_gb_per_year'] * storage_gb
+        annual_emission = coef['storage_per_gb_per_year'] * storage_gb
         storage_emission = (annual_emission * days_stored) / 365.0
     else:
         storage_emission = 0
@@ -95,75 +123,283 @@ def calculate_storage_emission(upload_size_mb=0, download_size_mb=0, storage_gb=
     
     return round(total_emission, 6)
 
-def calculate_web_emission(activity_type, duration_minutes):
+def calculate_web_emission(activity_type, duration_minutes, coefficients=None):
     """
     Calculate CO₂ emission for web browsing and other activities
     
     Args:
         activity_type: Type of activity ('browsing', 'pdf_reading', 'streaming')
         duration_minutes: Duration in minutes
+        coefficients: Coefficient dict to use (defaults to EMISSION_COEFFICIENTS)
     
     Returns:
         float: CO₂ emission in kg
     """
+    coef = EMISSION_COEFFICIENTS if coefficients is None else coefficients
     coefficient_key = {
         'browsing': 'web_browsing_per_minute',
         'pdf_reading': 'pdf_reading_per_minute',
         'streaming': 'streaming_per_minute'
     }.get(activity_type, 'web_browsing_per_minute')
     
-    emission_per_minute = EMISSION_COEFFICIENTS[coefficient_key]
+    emission_per_minute = coef[coefficient_key]
     total_emission = emission_per_minute * duration_minutes
     
     return round(total_emission, 6)
 
-def calculate_activity_emission(activity_type, **kwargs):
+def calculate_activity_emission(activity_type, coefficients=None, timestamp=None, region=None, **kwargs):
     """
     Universal function to calculate emission for any activity type
     
     Args:
         activity_type: Type of activity ('email', 'meeting', 'storage', 'web')
+        coefficients: Coefficient dict to use (see coefficient_profiles.coefficients_for)
+        timestamp: Activity time, for the grid carbon-intensity factor
+        region: Grid region, for the grid carbon-intensity factor
         **kwargs: Activity-specific parameters
     
     Returns:
         float: CO₂ emission in kg
     """
     if activity_type == 'email':
-        return calculate_email_emission(
+        emission = calculate_email_emission(
             attachment_size_mb=kwargs.get('attachment_size_mb', 0),
-            recipients_count=kwargs.get('recipients_count', 1)
+            recipients_count=kwargs.get('recipients_count', 1),
+            coefficients=coefficients
         )
     
     elif activity_type == 'meeting':
-        return calculate_meeting_emission(
+        emission = calculate_meeting_emission(
             duration_minutes=kwargs.get('duration_minutes', 0),
             has_video=kwargs.get('has_video', True),
-            participants_count=kwargs.get('participants_count', 1)
+            participants_count=kwargs.get('participants_count', 1),
+            coefficients=coefficients
         )
     
     elif activity_type == 'storage':
-        return calculate_storage_emission(
+        emission = calculate_storage_emission(
             upload_size_mb=kwargs.get('upload_size_mb', 0),
             download_size_mb=kwargs.get('download_size_mb', 0),
             storage_gb=kwargs.get('storage_gb', 0),
-            days_stored=kwargs.get('days_stored', 0)
+            days_stored=kwargs.get('days_stored', 0),
+            coefficients=coefficients
         )
     
     elif activity_type in ['browsing', 'pdf_reading', 'streaming']:
-        return calculate_web_emission(
+        emission = calculate_web_emission(
             activity_type=activity_type,
-            duration_minutes=kwargs.get('duration_minutes', 0)
+            duration_minutes=kwargs.get('duration_minutes', 0),
+            coefficients=coefficients
         )
     
     else:
         raise ValueError(f"Unknown activity type: {activity_type}")
+    
+    factor = grid_factor(region, timestamp)
+    return emission if factor == 1.0 else round(emission * factor, 6)
 
-def get_emission_coefficients():
+def get_emission_coefficients(version=None, org_id=None):
     """
-    Get current emission coefficients (for settings/configuration)
+    Get emission coefficients (for settings/configuration)
+    
+    Args:
+        version: Coefficient set version (default: current EMISSION_VERSION)
+        org_id: Apply this organization's coefficient profile, if it has one
     
     Returns:
         dict: Dictionary of emission coefficients
     """
-    return EMISSION_COEFFICIENTS.copy()
+    if version is None:
+        version = EMISSION_VERSION
+    if version not in EMISSION_COEFFICIENT_VERSIONS:
+        raise ValueError(f"Unknown emission coefficient version: {version}")
+    if org_id:
+        from utils.coefficient_profiles import coefficients_for
+        return dict(coefficients_for(org_id=org_id, version=version)[0])
+    return EMISSION_COEFFICIENT_VERSIONS[version].copy()
+
+# Integer codes for the columnar batch calculator
+ACTIVITY_TYPE_CODES = {
+    'email': 0,
+    'meeting': 1,
+    'storage': 2,
+    'browsing': 3,
+    'pdf_reading': 4,
+    'streaming': 5,
+}
+UNKNOWN_TYPE_CODE = -1  # rows with this code get 0.0 (stored activities of unsupported types)
+
+def encode_activity_types(activity_types, strict=True):
+    """
+    Map activity type names to ACTIVITY_TYPE_CODES
+    
+    Args:
+        activity_types: Iterable of activity type names
+        strict: Raise on unknown types instead of using UNKNOWN_TYPE_CODE
+    
+    Returns:
+        numpy.ndarray: int8 type codes
+    """
+    codes = []
+    for activity_type in activity_types:
+        code = ACTIVITY_TYPE_CODES.get(activity_type, UNKNOWN_TYPE_CODE)
+        if strict and code == UNKNOWN_TYPE_CODE:
+            raise ValueError(f"Unknown activity type: {activity_type}")
+        codes.append(code)
+    return np.asarray(codes, dtype=np.int8)
+
+def calculate_emissions_batch(type_codes, attachment_mb=None, recipients=None, minutes=None,
+                              has_video=None, participants=None, storage_gb=None, days=None,
+                              upload_mb=None, download_mb=None, coefficients=None, grid_factors=None):
+    """
+    Calculate CO₂ emissions for many activities at once (columnar, NumPy)
+    
+    Every row is computed with the same formulas and operation order as the
+    scalar calculate_*_emission functions, so results match them to 6 decimal
+    places. Missing columns take the scalar defaults.
+    
+    Args:
+        type_codes: ACTIVITY_TYPE_CODES per row (see encode_activity_types)
+        attachment_mb: Email attachment size in MB
+        recipients: Email recipients count (default 1)
+        minutes: Meeting / browsing duration in minutes
+        has_video: Meeting video flag (default True)
+        participants: Meeting participants count (default 1)
+        storage_gb: Total storage used in GB
+        days: Days stored (storage)
+        upload_mb: Storage upload size in MB
+        download_mb: Storage download size in MB
+        coefficients: Coefficient dict to use (defaults to EMISSION_COEFFICIENTS)
+        grid_factors: Grid carbon-intensity multiplier per row (default 1.0)
+    
+    Returns:
+        numpy.ndarray: CO₂ emission in kg per row (float64, rounded to 6 decimals)
+    """
+    coef = EMISSION_COEFFICIENTS if coefficients is None else coefficients
+    codes = np.asarray(type_codes, dtype=np.int8)
+    rows = codes.shape[0]
+
+    def column(values, default, dtype=np.float64):
+        if values is None:
+            return np.full(rows, default, dtype=dtype)
+        array = np.asarray(values, dtype=dtype)
+        if array.shape != (rows,):
+            raise ValueError(f"Column has shape {array.shape}, expected ({rows},)")
+        return array
+
+    valid = (codes == UNKNOWN_TYPE_CODE) | np.isin(codes, list(ACTIVITY_TYPE_CODES.values()))
+    if not valid.all():
+        raise ValueError(f"Unknown activity type code: {codes[~valid][0]}")
+
+    attachment_mb = column(attachment_mb, 0.0)
+    recipients = column(recipients, 1.0)
+    minutes = column(minutes, 0.0)
+    has_video = column(has_video, True, dtype=bool)
+    participants = column(participants, 1.0)
+    storage_gb = column(storage_gb, 0.0)
+    days = column(days, 0.0)
+    upload_mb = column(upload_mb, 0.0)
+    download_mb = column(download_mb, 0.0)
+
+    email = (coef['email_base'] + attachment_mb * coef['email_attachment_per_mb']) * recipients
+
+    per_hour = np.where(has_video, coef['meeting_per_hour_video'], coef['meeting_per_hour_audio'])
+    meeting = per_hour * (minutes / 60.0) * participants
+
+    prorated = (coef['storage_per_gb_per_year'] * storage_gb * days) / 365.0
+    storage = (
+        upload_mb * coef['storage_upload_per_mb']
+        + download_mb * coef['storage_download_per_mb']
+        + np.where((storage_gb > 0) & (days > 0), prorated, 0.0)
+    )
+
+    emissions = np.select(
+        [
+            codes == ACTIVITY_TYPE_CODES['email'],
+            codes == ACTIVITY_TYPE_CODES['meeting'],
+            codes == ACTIVITY_TYPE_CODES['storage'],
+            codes == ACTIVITY_TYPE_CODES['browsing'],
+            codes == ACTIVITY_TYPE_CODES['pdf_reading'],
+            codes == ACTIVITY_TYPE_CODES['streaming'],
+        ],
+        [
+            email,
+            meeting,
+            storage,
+            coef['web_browsing_per_minute'] * minutes,
+            coef['pdf_reading_per_minute'] * minutes,
+            coef['streaming_per_minute'] * minutes,
+        ],
+        default=0.0,
+    )
+    emissions = np.round(emissions, 6)
+    if grid_factors is not None:
+        # Same rounding steps as the scalar path: round the base emission, then the scaled one
+        emissions = np.round(emissions * column(grid_factors, 1.0), 6)
+    return emissions
+
+def activity_emission_columns(activities):
+    """
+    Build calculate_emissions_batch() columns from stored activity dicts
+    (activity_type + normalized payload), mirroring the ingest path's inputs.
+    With a grid intensity table loaded, grid_factors come from each
+    activity's grid_region and timestamp
+    
+    Args:
+        activities: Sequence of activity dicts
+    
+    Returns:
+        dict: Keyword arguments for calculate_emissions_batch()
+    """
+    rows = len(activities)
+    type_codes = np.full(rows, UNKNOWN_TYPE_CODE, dtype=np.int8)
+    attachment_mb = np.zeros(rows)
+    recipients = np.ones(rows)
+    minutes = np.zeros(rows)
+    has_video = np.ones(rows, dtype=bool)
+    participants = np.ones(rows)
+    storage_gb = np.zeros(rows)
+    days = np.zeros(rows)
+    upload_mb = np.zeros(rows)
+    grid_table = get_grid_table()
+    region_codes = np.full(rows, UNKNOWN_REGION_CODE, dtype=np.int32)
+    hours = np.zeros(rows, dtype=np.int32)
+
+    for row, activity in enumerate(activities):
+        activity_type = activity.get('activity_type') or activity.get('activityType')
+        payload = activity.get('payload') or {}
+        type_codes[row] = ACTIVITY_TYPE_CODES.get(activity_type, UNKNOWN_TYPE_CODE)
+        if activity_type == 'email':
+            attachment_mb[row] = (payload.get('attachment_bytes', 0) or 0) / 1_000_000
+            recipients[row] = max(len(payload.get('recipients', [])) or 1, 1)
+        elif activity_type == 'meeting':
+            minutes[row] = payload.get('duration_minutes', 0) or 0
+            has_video[row] = bool(payload.get('has_video', True))
+            participants[row] = payload.get('participants_count', 1) or 1
+        elif activity_type == 'storage':
+            upload_mb[row] = payload.get('size_mb', 0.0) or 0.0
+            storage_gb[row] = payload.get('total_storage_gb', 0.0) or 0.0
+            days[row] = payload.get('days_stored', 0) or 0
+        elif activity_type == 'browsing':
+            minutes[row] = payload.get('duration_minutes', 0) or 0
+        else:
+            type_codes[row] = UNKNOWN_TYPE_CODE
+        timestamp = activity.get('timestamp')
+        if grid_table is not None and isinstance(timestamp, datetime):
+            region_codes[row] = grid_table.region_code(activity.get('grid_region'))
+            hours[row] = hour_of_year(timestamp)
 
+    columns = {
+        'type_codes': type_codes,
+        'attachment_mb': attachment_mb,
+        'recipients': recipients,
+        'minutes': minutes,
+        'has_video': has_video,
+        'participants': participants,
+        'storage_gb': storage_gb,
+        'days': days,
+        'upload_mb': upload_mb,
+    }
+    if grid_table is not None:
+        columns['grid_factors'] = grid_table.factors(region_codes, hours)
+    return columns
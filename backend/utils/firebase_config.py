@@ -59,7 +59,11 @@ COLLECTIONS = {
     'reports': 'reports',
     'audit_logs': 'audit_logs',
     'settings': 'settings',
-    'analytics_cache': 'analytics_cache'
+    'analytics_cache': 'analytics_cache',
+    'daily_rollups': 'daily_rollups',
+    'rollup_versions': 'rollup_versions',
+    'alerts': 'alerts',
+    'job_checkpoints': 'job_checkpoints'
 }
 
 def get_collection(collection_name):
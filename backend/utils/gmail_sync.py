@@ -0,0 +1,675 @@
+"""
+Gmail Sync Module
+Turns Gmail messages into email activities. Shared by the windowed sync
+(routes.oauth_google.sync_gmail_for_user) and the incremental sync the
+poller runs, which reads only changes since a per-user History API
+checkpoint stored in the user's oauth_tokens document.
+
+Messages are fetched through Gmail batch requests (up to 100 calls per HTTP
+round trip) in metadata format with only the headers we store. Attachment
+sizes need the MIME part tree, so only messages whose top-level type can
+carry attachments get a second, part-sizes-only batched fetch. Already
+stored messages are dropped before fetching (see utils.sync_writes).
+
+A sync runs as a staged pipeline (utils.pipeline) over chunks of
+GMAIL_BATCH_SIZE messages: list (one thread per direction) -> drop stored
+IDs and fetch -> build activity documents -> BulkWriter create and rollups.
+Stages are joined by bounded queues, so a backfill holds a few chunks in
+memory however large it is. Every thread that calls Gmail builds its own
+service object, since the httplib2 transport is not thread-safe.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from utils.oauth_tokens import resolve_google_token_document
+from utils.pipeline import run_pipeline
+from utils.rollups import record_rollups
+from utils.sync_writes import find_stored_ids, write_sync_activities
+
+DIRECTIONS = ('outbound', 'inbound')
+# oauth_tokens field holding {'history_id', 'updated_at', 'catch_up_results', 'retry'}
+HISTORY_CHECKPOINT_FIELD = 'gmail_history'
+# Gmail keeps history for about a week; a windowed catch-up never reaches further back
+MAX_CATCH_UP_DAYS = float(os.getenv('GMAIL_MAX_CATCH_UP_DAYS', '7'))
+# A truncated window doubles its cap on the next run, up to this many messages per direction
+MAX_CATCH_UP_RESULTS = max(1, int(os.getenv('GMAIL_MAX_CATCH_UP_RESULTS', '4000')))
+# Failed messages the checkpoint can move past; they are retried by ID on later runs
+MAX_RETRY_MESSAGES = int(os.getenv('GMAIL_MAX_RETRY_MESSAGES', '500'))
+# Runs a failing message is tried on before it is given up
+MAX_MESSAGE_ATTEMPTS = max(1, int(os.getenv('GMAIL_MAX_MESSAGE_ATTEMPTS', '5')))
+# Window for users without any checkpoint yet
+INITIAL_SYNC_DAYS = float(os.getenv('GMAIL_INITIAL_SYNC_DAYS', '1'))
+# Gmail accepts at most 100 calls per batch request
+GMAIL_BATCH_SIZE = max(1, min(100, int(os.getenv('GMAIL_BATCH_SIZE', '100'))))
+GMAIL_BATCH_RETRIES = 2
+METADATA_HEADERS = ['Subject', 'From', 'To', 'Cc', 'Bcc']
+METADATA_FIELDS = 'id,threadId,labelIds,snippet,internalDate,payload(mimeType,headers)'
+# Part sizes only: attachments sit at most a few levels deep (forwarded mail nests them)
+ATTACHMENT_FIELDS = 'id,payload(parts(filename,body/size,parts(filename,body/size,parts(filename,body/size))))'
+# Top-level types without attachments; everything else gets a part-sizes fetch
+_NO_ATTACHMENT_TYPES = ('text/', 'multipart/alternative')
+# Pipeline stage concurrency and chunks buffered between stages
+GMAIL_FETCH_WORKERS = int(os.getenv('GMAIL_FETCH_WORKERS', '2'))
+GMAIL_BUILD_WORKERS = int(os.getenv('GMAIL_BUILD_WORKERS', '1'))
+GMAIL_WRITE_WORKERS = int(os.getenv('GMAIL_WRITE_WORKERS', '2'))
+GMAIL_QUEUE_CHUNKS = int(os.getenv('GMAIL_QUEUE_CHUNKS', '4'))
+
+_EMAIL_REGEX = re.compile(r'[\w\.-]+@[\w\.-]+\.[A-Za-z]{2,}')
+
+
+def build_gmail_service(google_token: Dict[str, Any]):
+    creds = Credentials(
+        token=google_token.get('token'),
+        refresh_token=google_token.get('refresh_token'),
+        token_uri=google_token.get('token_uri'),
+        client_id=google_token.get('client_id'),
+        client_secret=google_token.get('client_secret'),
+        scopes=google_token.get('scopes', []),
+    )
+    return build('gmail', 'v1', credentials=creds)
+
+
+def load_google_token(user_identifier: str):
+    """Return ``(tokens_doc, tokens_ref, tokens_data, google_token)``; raises ValueError when missing."""
+    tokens_doc, tokens_ref = resolve_google_token_document(user_identifier)
+    if not tokens_doc or not tokens_doc.exists:
+        raise ValueError('No tokens found for user')
+    tokens_data = tokens_doc.to_dict()
+    google_token = tokens_data.get('google_token')
+    if not google_token:
+        raise ValueError('Google token not found in token document')
+    return tokens_doc, tokens_ref, tokens_data, google_token
+
+
+def parse_addresses(raw: str) -> List[str]:
+    if not raw:
+        return []
+    seen = set()
+    out = []
+    for m in _EMAIL_REGEX.findall(raw):
+        lowered = m.lower()
+        if lowered not in seen:
+            seen.add(lowered)
+            out.append(m)
+    return out
+
+
+def get_header(headers, name):
+    for h in headers:
+        if h.get('name', '').lower() == name.lower():
+            return h.get('value', '')
+    return ''
+
+
+def count_attachments(parts_list):
+    cnt = 0
+    size = 0
+    for p in parts_list or []:
+        if p.get('filename'):
+            cnt += 1
+            size += int(p.get('body', {}).get('size', 0) or 0)
+        if p.get('parts'):
+            sub_cnt, sub_size = count_attachments(p.get('parts'))
+            cnt += sub_cnt
+            size += sub_size
+    return cnt, size
+
+
+def message_direction(label_ids: Iterable[str]) -> Optional[str]:
+    """Direction of a message from its labels; None for drafts, spam and other mail we don't track."""
+    labels = set(label_ids or [])
+    if 'SENT' in labels:
+        return 'outbound'
+    if 'INBOX' in labels:
+        return 'inbound'
+    return None
+
+
+def may_have_attachments(message: Dict[str, Any]) -> bool:
+    mime_type = ((message.get('payload') or {}).get('mimeType') or '').lower()
+    return not mime_type.startswith(_NO_ATTACHMENT_TYPES)
+
+
+def fetch_messages(
+    service, message_ids: List[str], batch_size: int = GMAIL_BATCH_SIZE, unavailable: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Message metadata (stored headers, labels, snippet) by ID.
+
+    IDs still rate-limited or failing with 5xx after the retries are appended
+    to ``unavailable``; other missing IDs are gone (404/410) or rejected for good.
+    """
+    messages = service.users().messages()
+    return _batch_get(service, message_ids, batch_size, lambda message_id: messages.get(
+        userId='me', id=message_id, format='metadata', metadataHeaders=METADATA_HEADERS, fields=METADATA_FIELDS,
+    ), unavailable)
+
+
+def fetch_attachment_sizes(service, message_ids: List[str], batch_size: int = GMAIL_BATCH_SIZE) -> Dict[str, Tuple[int, int]]:
+    """``(attachment_count, attachment_bytes)`` by message ID from the part tree only."""
+    messages = service.users().messages()
+    parts = _batch_get(service, message_ids, batch_size, lambda message_id: messages.get(
+        userId='me', id=message_id, format='full', fields=ATTACHMENT_FIELDS,
+    ))
+    return {
+        message_id: count_attachments((msg.get('payload') or {}).get('parts'))
+        for message_id, msg in parts.items()
+    }
+
+
+def _batch_get(
+    service, ids: List[str], batch_size: int, make_request, unavailable: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Run one request per ID through batch requests; rate-limited and 5xx calls are retried.
+
+    IDs that were still retryable when the retries ran out go to ``unavailable``.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = list(dict.fromkeys(ids))
+    for attempt in range(GMAIL_BATCH_RETRIES + 1):
+        retry: List[str] = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            elif not _is_retryable(exception):
+                # Deleted since it was listed (404/410) or rejected for good: retrying can't help
+                print(f"[Gmail Sync] Dropping message {request_id}: {exception}")
+            elif attempt < GMAIL_BATCH_RETRIES:
+                retry.append(request_id)
+            else:
+                print(f"[Gmail Sync] Error fetching message {request_id}: {exception}")
+                if unavailable is not None:
+                    unavailable.append(request_id)
+
+        for start in range(0, len(pending), batch_size):
+            batch = service.new_batch_http_request(callback=callback)
+            for request_id in pending[start:start + batch_size]:
+                batch.add(make_request(request_id), request_id=request_id)
+            batch.execute()
+
+        if not retry:
+            break
+        time.sleep(2 ** attempt)
+        pending = retry
+    return results
+
+
+def _is_retryable(exception: Exception) -> bool:
+    status = getattr(getattr(exception, 'resp', None), 'status', None)
+    return status == 429 or (status is not None and int(status) >= 500)
+
+
+class GmailMessageProcessor:
+    """Stores new Gmail messages as email activities, with per-direction stats.
+
+    Stage concurrency defaults to the GMAIL_*_WORKERS settings.
+    """
+
+    def __init__(
+        self,
+        google_token: Dict[str, Any],
+        user_email: Optional[str],
+        *,
+        fetch_workers: Optional[int] = None,
+        build_workers: Optional[int] = None,
+        write_workers: Optional[int] = None,
+        queue_chunks: Optional[int] = None,
+    ):
+        self.google_token = google_token
+        self.user_email = user_email
+        self.fetch_workers = fetch_workers or GMAIL_FETCH_WORKERS
+        self.build_workers = build_workers or GMAIL_BUILD_WORKERS
+        self.write_workers = write_workers or GMAIL_WRITE_WORKERS
+        self.queue_chunks = queue_chunks or GMAIL_QUEUE_CHUNKS
+        # skipped: already stored, deleted or unusable; failed: temporary fetch or write failure
+        self.stats = {direction: {'found': 0, 'processed': 0, 'skipped': 0, 'failed': 0} for direction in DIRECTIONS}
+        # Chunks the pipeline dropped on an unexpected error, and how many of them had their
+        # messages recorded in failed_refs first
+        self.pipeline_errors = 0
+        self._recorded_errors = 0
+        # message_id -> direction of every message counted as failed, for a later retry
+        self.failed_refs: Dict[str, str] = {}
+        # Set when a window listing stopped at its cap with messages left over
+        self.truncated = False
+        self._lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        """True when no listed message is waiting on a temporary fetch or write failure."""
+        return not self.pipeline_errors and not any(stats['failed'] for stats in self.stats.values())
+
+    @property
+    def recoverable(self) -> bool:
+        """True when every failed message is in ``failed_refs``, so it can be retried by ID."""
+        return self.pipeline_errors <= self._recorded_errors
+
+    def run(self, sources: List[Callable[[Callable[[Any], None]], None]]) -> None:
+        """Run the pipeline over chunks of ``(message_id, direction)`` emitted by ``sources``."""
+        self.pipeline_errors += run_pipeline(
+            sources,
+            [
+                (self._fetch_worker, self.fetch_workers),
+                (lambda: self._build_chunk, self.build_workers),
+                (lambda: self._write_chunk, self.write_workers),
+            ],
+            queue_size=self.queue_chunks,
+            name='Gmail Sync',
+        )
+
+    def process_many(self, message_refs: List[Tuple[str, str]]) -> None:
+        """Store the new messages among already listed ``(message_id, direction)`` pairs."""
+        def source(emit):
+            for start in range(0, len(message_refs), GMAIL_BATCH_SIZE):
+                emit(message_refs[start:start + GMAIL_BATCH_SIZE])
+        self.run([source])
+
+    def window_source(self, direction: str, base_params: Dict[str, Any], max_results: int):
+        """Pipeline source listing one direction with ``messages.list`` on its own service."""
+        def source(emit):
+            service = build_gmail_service(self.google_token)
+            for refs, listed, truncated in list_window_pages(service, direction, base_params, max_results):
+                self._count(direction, 'found', listed)
+                if truncated:
+                    self.truncated = True
+                for start in range(0, len(refs), GMAIL_BATCH_SIZE):
+                    emit(refs[start:start + GMAIL_BATCH_SIZE])
+        return source
+
+    def _fetch_worker(self):
+        service = build_gmail_service(self.google_token)
+
+        def fetch_chunk(chunk):
+            try:
+                stored = find_stored_ids('gmail', self.user_email, [message_id for message_id, _ in chunk])
+            except Exception:
+                self._fail_chunk(chunk)
+                raise
+            pending = []
+            for message_id, direction in chunk:
+                if message_id in stored:
+                    self._count(direction, 'skipped')
+                else:
+                    pending.append((message_id, direction))
+            if not pending:
+                return None
+            unavailable: List[str] = []
+            try:
+                messages = fetch_messages(service, [message_id for message_id, _ in pending], unavailable=unavailable)
+                attachments = fetch_attachment_sizes(
+                    service,
+                    [message_id for message_id, msg in messages.items() if may_have_attachments(msg)],
+                )
+            except Exception:
+                self._fail_chunk(pending)
+                raise
+            return pending, messages, attachments, set(unavailable)
+
+        return fetch_chunk
+
+    def _build_chunk(self, fetched):
+        pending, messages, attachments, unavailable = fetched
+        new_docs: Dict[str, Dict[str, Any]] = {}
+        fetched_refs = [(message_id, direction) for message_id, direction in pending if messages.get(message_id)]
+        activity_docs = dict(zip(
+            [message_id for message_id, _ in fetched_refs],
+            self.build_activities([
+                (messages[message_id], direction, attachments.get(message_id, (0, 0)))
+                for message_id, direction in fetched_refs
+            ]),
+        ))
+        for message_id, direction in pending:
+            activity_doc = activity_docs.get(message_id)
+            if activity_doc is not None:
+                new_docs[message_id] = activity_doc
+            elif message_id in unavailable:
+                # Only a temporary fetch failure is worth a retry
+                self._fail(message_id, direction)
+            else:
+                # Deleted since listing, rejected by the API or not buildable: a retry changes nothing
+                self._count(direction, 'skipped')
+        return new_docs or None
+
+    def _write_chunk(self, new_docs):
+        try:
+            created, failed = write_sync_activities('gmail', self.user_email, new_docs)
+        except Exception:
+            self._fail_chunk([(message_id, activity_doc['metadata']['direction']) for message_id, activity_doc in new_docs.items()])
+            raise
+        created_ids = {id(activity_doc) for activity_doc in created}
+        failed_ids = set(failed)
+        for message_id, activity_doc in new_docs.items():
+            direction = activity_doc['metadata']['direction']
+            if id(activity_doc) in created_ids:
+                self._count(direction, 'processed')
+            elif message_id in failed_ids:
+                self._fail(message_id, direction)
+            else:
+                self._count(direction, 'skipped')
+        record_rollups(created)
+
+    def _count(self, direction: str, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[direction][key] += amount
+
+    def _fail(self, message_id: str, direction: str) -> None:
+        with self._lock:
+            self.stats[direction]['failed'] += 1
+            self.failed_refs[message_id] = direction
+
+    def _fail_chunk(self, refs: List[Tuple[str, str]]) -> None:
+        """Record every message of a chunk the pipeline is about to drop."""
+        for message_id, direction in refs:
+            self._fail(message_id, direction)
+        with self._lock:
+            self._recorded_errors += 1
+
+    def build_activities(
+        self, items: List[Tuple[Dict[str, Any], str, Tuple[int, int]]],
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Email activity documents of fetched ``(message, direction, attachments)`` items,
+        validated as one batch; None for an item that can't be built."""
+        from utils.activity_validator import validate_many
+        from utils.coefficient_profiles import coefficients_for, grid_region_for
+        from utils.emissions import calculate_activity_emission
+
+        payloads = [self.activity_payload(msg, direction, attachments) for msg, direction, attachments in items]
+        valid = [payload for payload in payloads if payload is not None]
+        results = iter(validate_many(valid))
+        activity_docs: List[Optional[Dict[str, Any]]] = []
+        for activity_payload in payloads:
+            if activity_payload is None:
+                activity_docs.append(None)
+                continue
+            normalized, validation_error = next(results)
+            message_id = activity_payload['metadata']['gmail_message_id']
+            try:
+                if validation_error is not None:
+                    raise validation_error
+                coefficients, emission_version = coefficients_for(normalized.user_email)
+                grid_region = grid_region_for(normalized.user_email, metadata=normalized.metadata)
+                emission_kg = calculate_activity_emission(
+                    'email',
+                    coefficients=coefficients,
+                    timestamp=normalized.timestamp,
+                    region=grid_region,
+                    attachment_size_mb=(activity_payload['attachmentBytes'] or 0) / 1_000_000,
+                    recipients_count=len(activity_payload['recipients']) or 1,
+                )
+
+                activity_docs.append({
+                    'activity_type': normalized.activity_type,
+                    'provider': normalized.provider,
+                    'timestamp': normalized.timestamp,
+                    'platform': normalized.platform,
+                    'mode': 'sync',
+                    'extension_version': 'api-sync',
+                    'user_id': None,
+                    'user_email': normalized.user_email,
+                    'emission_kg': emission_kg,
+                    'emission_version': emission_version,
+                    'grid_region': grid_region,
+                    'payload': normalized.payload,
+                    'metadata': normalized.metadata,
+                    'raw_payload': activity_payload,
+                    'created_at': datetime.utcnow(),
+                    'updated_at': datetime.utcnow(),
+                })
+            except Exception as exc:
+                print(f"[Gmail Sync] Error processing message {message_id}: {exc}")
+                activity_docs.append(None)
+        return activity_docs
+
+    def activity_payload(self, msg: Dict[str, Any], direction: str, attachments: Tuple[int, int] = (0, 0)) -> Optional[Dict[str, Any]]:
+        """Raw activity payload of one fetched message; None when it can't be built."""
+        user_email = self.user_email
+        message_id = msg.get('id')
+        try:
+            headers = msg.get('payload', {}).get('headers', [])
+            subject = get_header(headers, 'Subject')
+            sender_candidates = parse_addresses(get_header(headers, 'From'))
+            sender_email = sender_candidates[0] if sender_candidates else user_email
+
+            recipient_fields = ' '.join([get_header(headers, 'To'), get_header(headers, 'Cc'), get_header(headers, 'Bcc')])
+            recipients = parse_addresses(recipient_fields)
+
+            snippet = msg.get('snippet', '')
+            attachment_count, attachment_bytes = attachments
+
+            timestamp_iso = datetime.fromtimestamp(int(msg['internalDate']) / 1000).isoformat()
+
+            return {
+                'activityType': 'email',
+                'provider': 'gmail',
+                'timestamp': timestamp_iso,
+                'subject': subject,
+                'recipients': recipients,
+                'bodyPreview': snippet,
+                'attachmentCount': attachment_count,
+                'attachmentBytes': attachment_bytes,
+                'direction': direction,
+                'sender': sender_email,
+                'user_email': user_email,
+                'metadata': {
+                    'source': 'gmail_api_sync',
+                    'gmail_message_id': message_id,
+                    'account_email': user_email,
+                    'direction': direction,
+                    'thread_id': msg.get('threadId'),
+                    'label_ids': msg.get('labelIds', []),
+                }
+            }
+
+        except Exception as exc:
+            print(f"[Gmail Sync] Error processing message {message_id}: {exc}")
+            return None
+
+    def result(self, **extra) -> Dict[str, Any]:
+        """Sync response in the shape returned by the sync endpoint."""
+        stats = self.stats
+        return {
+            'success': True,
+            'messages_found': sum(v['found'] for v in stats.values()),
+            'processed': sum(v['processed'] for v in stats.values()),
+            'skipped': sum(v['skipped'] for v in stats.values()),
+            'failed': sum(v['failed'] for v in stats.values()),
+            'processed_sent': stats['outbound']['processed'],
+            'processed_received': stats['inbound']['processed'],
+            'message': f"Gmail sync completed: {stats['outbound']['processed']} sent, {stats['inbound']['processed']} received processed",
+            **extra,
+        }
+
+
+def window_queries(since_dt: datetime, max_results: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """``messages.list`` parameters per direction for messages after ``since_dt``."""
+    since_query = int(since_dt.timestamp())
+    return [
+        ('outbound', {'userId': 'me', 'maxResults': min(max_results, 500), 'q': f'is:sent after:{since_query}'}),
+        ('inbound', {'userId': 'me', 'maxResults': min(max_results, 500), 'labelIds': ['INBOX'], 'q': f'after:{since_query}'}),
+    ]
+
+
+def list_window_pages(
+    service, direction: str, base_params: Dict[str, Any], max_results: int,
+) -> Iterator[Tuple[List[Tuple[str, str]], int, bool]]:
+    """Page through ``messages.list``, yielding each page's refs (up to ``max_results`` in all), its size
+    and whether listing stopped at ``max_results`` with messages left over."""
+    params = dict(base_params)
+    remaining = max_results
+    page_token = None
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        t0 = time.time()
+        resp = service.users().messages().list(**params).execute()
+        print(f"[Gmail Sync] list() took {time.time() - t0:.2f}s for {direction}")
+
+        messages = resp.get('messages', []) or []
+        page_refs = [(m['id'], direction) for m in messages if m.get('id')]
+        refs = page_refs[:remaining]
+        remaining -= len(refs)
+        page_token = resp.get('nextPageToken')
+        truncated = len(refs) < len(page_refs) or (remaining <= 0 and bool(page_token))
+        yield refs, len(messages), truncated
+
+        if not page_token or remaining <= 0:
+            return
+
+
+def list_history_changes(service, start_history_id: str) -> Tuple[List[Tuple[str, str]], str]:
+    """Messages added since ``start_history_id`` and the history ID to resume from next time.
+
+    Raises HttpError 404 when the start ID is older than Gmail's history retention.
+    """
+    refs: List[Tuple[str, str]] = []
+    seen = set()
+    latest_history_id = start_history_id
+    params: Dict[str, Any] = {
+        'userId': 'me',
+        'startHistoryId': start_history_id,
+        'historyTypes': ['messageAdded'],
+        'maxResults': 500,
+        'fields': 'history(messagesAdded(message(id,labelIds))),historyId,nextPageToken',
+    }
+    while True:
+        resp = service.users().history().list(**params).execute()
+        latest_history_id = resp.get('historyId') or latest_history_id
+        for record in resp.get('history', []) or []:
+            for added in record.get('messagesAdded', []) or []:
+                message = added.get('message') or {}
+                message_id = message.get('id')
+                direction = message_direction(message.get('labelIds'))
+                if message_id and direction and message_id not in seen:
+                    seen.add(message_id)
+                    refs.append((message_id, direction))
+        page_token = resp.get('nextPageToken')
+        if not page_token:
+            return refs, latest_history_id
+        params['pageToken'] = page_token
+
+
+def sync_gmail_incremental(user_identifier: str, max_catch_up_results: int = 500) -> Dict[str, Any]:
+    """Store mail added since the user's history checkpoint, then advance it.
+
+    Without a checkpoint, or when Gmail no longer has history that old, a
+    windowed sync covers the gap (at most MAX_CATCH_UP_DAYS) and a fresh
+    checkpoint is taken before listing, so nothing arriving meanwhile is lost.
+
+    Messages that hit a temporary fetch or write failure don't hold the
+    checkpoint: they are kept in its ``retry`` list and fetched by ID on the
+    next runs, up to MAX_MESSAGE_ATTEMPTS each. The checkpoint only stays put
+    when a chunk was lost without its message IDs or more than
+    MAX_RETRY_MESSAGES failed (an outage rather than a bad message); the same
+    history or window is then listed again, where stored messages are cheap
+    dedupe hits. A window cut off at its cap is reported as ``truncated`` and
+    retried with twice the cap, up to MAX_CATCH_UP_RESULTS; a window still
+    truncated at that cap advances anyway, leaving its oldest messages out.
+    """
+    _, tokens_ref, tokens_data, google_token = load_google_token(user_identifier)
+    service = build_gmail_service(google_token)
+    processor = GmailMessageProcessor(google_token, tokens_data.get('user_email'))
+
+    checkpoint = tokens_data.get(HISTORY_CHECKPOINT_FIELD) or {}
+    retry = {
+        entry['id']: entry for entry in checkpoint.get('retry') or []
+        if isinstance(entry, dict) and entry.get('id') and entry.get('direction') in DIRECTIONS
+    }
+    refs: Optional[List[Tuple[str, str]]] = None
+    if checkpoint.get('history_id'):
+        try:
+            refs, history_id = list_history_changes(service, str(checkpoint['history_id']))
+            mode = 'history'
+        except HttpError as exc:
+            if getattr(exc.resp, 'status', None) != 404:
+                raise
+            print(f"[Gmail Sync] History checkpoint for {user_identifier} expired, falling back to a windowed sync")
+
+    retry_refs = [(message_id, entry['direction']) for message_id, entry in retry.items()]
+    if refs is None:
+        mode = 'window'
+        history_id = str(service.users().getProfile(userId='me').execute()['historyId'])
+        now = datetime.utcnow()
+        since_dt = _as_naive_utc(checkpoint.get('updated_at')) or now - timedelta(days=INITIAL_SYNC_DAYS)
+        since_dt = max(since_dt, now - timedelta(days=MAX_CATCH_UP_DAYS))
+        max_catch_up_results = min(MAX_CATCH_UP_RESULTS, max(max_catch_up_results, int(checkpoint.get('catch_up_results') or 0)))
+        if retry_refs:
+            for _, direction in retry_refs:
+                processor.stats[direction]['found'] += 1
+            processor.process_many(retry_refs)
+        processor.run([
+            processor.window_source(direction, base_params, max_catch_up_results)
+            for direction, base_params in window_queries(since_dt, max_catch_up_results)
+        ])
+    else:
+        listed = {message_id for message_id, _ in refs}
+        refs += [ref for ref in retry_refs if ref[0] not in listed]
+        for _, direction in refs:
+            processor.stats[direction]['found'] += 1
+        processor.process_many(refs)
+
+    window_capped = processor.truncated and max_catch_up_results < MAX_CATCH_UP_RESULTS
+    advanced = processor.recoverable and len(processor.failed_refs) <= MAX_RETRY_MESSAGES and not window_capped
+    if advanced:
+        # Everything that failed is retried by ID from now on
+        next_retry = _next_retry_entries(processor.failed_refs, retry)
+        tokens_ref.set({
+            HISTORY_CHECKPOINT_FIELD: {
+                'history_id': history_id,
+                'updated_at': datetime.utcnow(),
+                'catch_up_results': 0,
+                'retry': next_retry,
+            },
+        }, merge=True)
+        if processor.truncated:
+            print(f"[Gmail Sync] Window for {user_identifier} still truncated at {MAX_CATCH_UP_RESULTS} messages; "
+                  "advancing without its oldest messages")
+    else:
+        # The same changes are listed again, so only the old retry entries need carrying over
+        next_retry = _next_retry_entries({k: v for k, v in processor.failed_refs.items() if k in retry}, retry)
+        next_retry += [entry for message_id, entry in retry.items() if message_id not in processor.failed_refs]
+        reason = 'window truncated' if window_capped else 'messages failed'
+        print(f"[Gmail Sync] Keeping checkpoint for {user_identifier} ({reason}); the next run lists the same changes")
+        update: Dict[str, Any] = {}
+        if next_retry != list(retry.values()):
+            update['retry'] = next_retry
+        if window_capped:
+            update['catch_up_results'] = min(2 * max_catch_up_results, MAX_CATCH_UP_RESULTS)
+        if update:
+            tokens_ref.set({HISTORY_CHECKPOINT_FIELD: update}, merge=True)
+    return processor.result(
+        mode=mode,
+        history_id=history_id,
+        truncated=processor.truncated,
+        checkpoint_advanced=advanced,
+        retry_pending=len(next_retry),
+    )
+
+
+def _next_retry_entries(failed_refs: Dict[str, str], retry: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Retry entries for messages that failed this run; ones out of attempts are given up."""
+    entries = []
+    for message_id, direction in failed_refs.items():
+        attempts = int((retry.get(message_id) or {}).get('attempts') or 0) + 1
+        if attempts >= MAX_MESSAGE_ATTEMPTS:
+            print(f"[Gmail Sync] Giving up on message {message_id} after {attempts} failed attempts")
+            continue
+        entries.append({'id': message_id, 'direction': direction, 'attempts': attempts})
+    return entries
+
+
+def _as_naive_utc(value: Any) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -0,0 +1,159 @@
+"""
+Grid Carbon-Intensity Module
+Hourly grid carbon intensity (gCO₂/kWh) per region, held as one dense
+(region × hour-of-year) NumPy array. Emissions are scaled by
+``intensity / reference_intensity``, where the reference is the grid mix the
+flat coefficients in utils.emissions assume, so a flat table changes nothing.
+
+Hours are indexed on a leap-year calendar (8784 hours) by month, day and
+hour, so the same calendar hour maps to the same row in every year.
+
+The table is loaded from ``GRID_INTENSITY_PATH`` (CSV or Parquet with
+``region``, ``hour_of_year`` and ``intensity`` columns) at import. Without
+one every factor is 1.0.
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+HOURS_PER_YEAR = 8784  # leap-year calendar
+# Emission factor of the flat coefficients, in gCO₂/kWh (roughly the global average grid mix)
+DEFAULT_REFERENCE_INTENSITY = float(os.getenv('GRID_REFERENCE_INTENSITY', '475'))
+DEFAULT_GRID_REGION = os.getenv('GRID_DEFAULT_REGION') or None
+UNKNOWN_REGION_CODE = -1  # rows with this code get a factor of 1.0
+
+# First day of each month (1-based index) in a leap year
+_MONTH_DAY_OFFSETS = (0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335)
+
+
+def hour_of_year(timestamp: datetime) -> int:
+    """Row of ``timestamp`` (naive values are UTC) on the leap-year hour calendar."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return (_MONTH_DAY_OFFSETS[timestamp.month] + timestamp.day - 1) * 24 + timestamp.hour
+
+
+class GridIntensityTable:
+    """Dense per-region hourly intensity table with O(1) factor lookups."""
+
+    __slots__ = ('regions', 'version', 'reference_intensity', '_codes', '_factors')
+
+    def __init__(self, regions: Sequence[str], intensities: np.ndarray, *,
+                 reference_intensity: float = DEFAULT_REFERENCE_INTENSITY, version: str = 'custom'):
+        intensities = np.asarray(intensities, dtype=np.float64)
+        if intensities.shape != (len(regions), HOURS_PER_YEAR):
+            raise ValueError(f"Intensity array has shape {intensities.shape}, expected ({len(regions)}, {HOURS_PER_YEAR})")
+        if reference_intensity <= 0:
+            raise ValueError('reference_intensity must be positive')
+        if np.isnan(intensities).any() or (intensities < 0).any():
+            raise ValueError('Intensities must be non-negative numbers')
+        self.regions: Tuple[str, ...] = tuple(regions)
+        self.version = version
+        self.reference_intensity = float(reference_intensity)
+        self._codes: Dict[str, int] = {region: code for code, region in enumerate(self.regions)}
+        self._factors = np.ascontiguousarray(intensities / self.reference_intensity)
+        self._factors.setflags(write=False)
+
+    def region_code(self, region: Optional[str]) -> int:
+        return self._codes.get(_normalize_region(region), UNKNOWN_REGION_CODE) if region else UNKNOWN_REGION_CODE
+
+    def intensity(self, region: Optional[str], timestamp: datetime) -> Optional[float]:
+        """Grid intensity in gCO₂/kWh, or None for an unknown region."""
+        code = self.region_code(region)
+        if code == UNKNOWN_REGION_CODE:
+            return None
+        return self._factors.item(code, hour_of_year(timestamp)) * self.reference_intensity
+
+    def factor(self, region: Optional[str], timestamp: datetime) -> float:
+        """Emission multiplier for one activity (1.0 for unknown regions)."""
+        code = self.region_code(region)
+        if code == UNKNOWN_REGION_CODE:
+            return 1.0
+        return self._factors.item(code, hour_of_year(timestamp))
+
+    def factors(self, region_codes: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """Vectorized ``factor`` over region codes (see ``region_code``) and hour-of-year rows."""
+        region_codes = np.asarray(region_codes, dtype=np.int32)
+        hours = np.asarray(hours, dtype=np.int32)
+        known = region_codes != UNKNOWN_REGION_CODE
+        return np.where(known, self._factors[np.where(known, region_codes, 0), hours], 1.0)
+
+
+def load_grid_table(path: str, reference_intensity: float = DEFAULT_REFERENCE_INTENSITY) -> GridIntensityTable:
+    """Load a table from CSV or Parquet.
+
+    Args:
+        path: File with ``region``, ``hour_of_year`` (0-8783) and ``intensity`` (gCO₂/kWh) columns
+        reference_intensity: Intensity the flat emission coefficients correspond to
+
+    Returns:
+        GridIntensityTable: Hours missing for a region take that region's mean
+    """
+    if path.lower().endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError('Loading a Parquet grid intensity table requires pyarrow') from exc
+        columns = pq.read_table(path, columns=['region', 'hour_of_year', 'intensity']).to_pydict()
+        rows: Iterable[Tuple[Any, Any, Any]] = zip(columns['region'], columns['hour_of_year'], columns['intensity'])
+    else:
+        with open(path, newline='', encoding='utf-8') as handle:
+            rows = [(row['region'], row['hour_of_year'], row['intensity']) for row in csv.DictReader(handle)]
+
+    by_region: Dict[str, Dict[int, float]] = {}
+    for region, hour, intensity in rows:
+        hour = int(hour)
+        if not 0 <= hour < HOURS_PER_YEAR:
+            raise ValueError(f"hour_of_year out of range for {region}: {hour}")
+        by_region.setdefault(_normalize_region(region), {})[hour] = float(intensity)
+
+    regions = sorted(by_region)
+    intensities = np.empty((len(regions), HOURS_PER_YEAR))
+    for code, region in enumerate(regions):
+        hours = by_region[region]
+        intensities[code].fill(sum(hours.values()) / len(hours))
+        intensities[code, list(hours)] = list(hours.values())
+
+    with open(path, 'rb') as handle:
+        version = hashlib.sha1(handle.read()).hexdigest()[:10]
+    return GridIntensityTable(regions, intensities, reference_intensity=reference_intensity, version=version)
+
+
+_table: Optional[GridIntensityTable] = None
+
+
+def get_grid_table() -> Optional[GridIntensityTable]:
+    return _table
+
+
+def set_grid_table(table: Optional[GridIntensityTable]) -> None:
+    """Install (or with None, remove) the table used by the emission calculators."""
+    global _table
+    _table = table
+
+
+def grid_factor(region: Optional[str], timestamp: Optional[datetime]) -> float:
+    """Emission multiplier for an activity; 1.0 without a table, region or timestamp."""
+    table = _table
+    if table is None or timestamp is None:
+        return 1.0
+    return table.factor(region, timestamp)
+
+
+def _normalize_region(region: Any) -> str:
+    return str(region).strip().upper()
+
+
+if os.getenv('GRID_INTENSITY_PATH'):
+    try:
+        set_grid_table(load_grid_table(os.environ['GRID_INTENSITY_PATH']))
+        print(f"[Grid Intensity] Loaded {len(_table.regions)} region(s) from {os.environ['GRID_INTENSITY_PATH']}")
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[Grid Intensity] Could not load grid intensity table (factors stay 1.0): {exc}")
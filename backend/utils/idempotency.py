@@ -0,0 +1,108 @@
+"""
+Idempotency helpers for activity ingestion.
+Maps client idempotency keys (or a fingerprint of the normalized payload) to
+deterministic activity document IDs, and keeps a small in-process LRU of
+recent responses so retried requests short-circuit without a Firestore read.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Optional
+
+from utils.activity_validator import ActivityValidationError, NormalizedActivity
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with a fixed number of entries."""
+
+    def __init__(self, max_entries: int = 10000):
+        self._max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def normalize_idempotency_key(value: Any) -> Optional[str]:
+    """Return a cleaned client key, None when absent. Raises on unusable keys."""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ActivityValidationError('Idempotency key must be a string')
+    value = value.strip()
+    if not value:
+        return None
+    if len(value) > MAX_KEY_LENGTH:
+        raise ActivityValidationError(f'Idempotency key must be at most {MAX_KEY_LENGTH} characters')
+    return value
+
+
+def payload_fingerprint(activity: NormalizedActivity) -> str:
+    """Stable hash of the normalized activity content.
+
+    Only retries that resend the same timestamp collapse; payloads without a
+    timestamp get a server-side one and therefore need an explicit key.
+    """
+    content = {
+        'activity_type': activity.activity_type,
+        'provider': activity.provider,
+        'timestamp': activity.timestamp,
+        'user_id': activity.user_id,
+        'user_email': (activity.user_email or '').lower() or None,
+        'payload': activity.payload,
+        'metadata': activity.metadata,
+    }
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return 'fp:' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def activity_document_id(activity: NormalizedActivity, key: str) -> str:
+    """Deterministic activity document ID, scoped to the user so keys can't collide across users."""
+    owner = (activity.user_id or activity.user_email or '').strip().lower()
+    digest = hashlib.sha256(f'{owner}\n{key}'.encode('utf-8')).hexdigest()
+    return f'idem_{digest[:40]}'
+
+
+def sync_document_id(provider: str, external_id: str, owner: Optional[str] = None) -> str:
+    """Deterministic document ID of an activity pulled from a provider API.
+
+    Scoped to the account owner because shared items (calendar events) carry
+    the same provider ID in every attendee's account.
+    """
+    owner_key = (owner or '').strip().lower()
+    digest = hashlib.sha256(f'{owner_key}\n{external_id}'.encode('utf-8')).hexdigest()
+    return f'{provider}_{digest[:40]}'
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,182 @@
+"""
+Write-behind ingest queue.
+Buffers validated activity documents in memory and flushes them to Firestore
+in batches from background worker threads.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+QueuedActivity = Tuple[str, Dict[str, Any]]
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue cannot accept more activities."""
+
+
+class IngestQueue:
+    """Bounded in-process queue drained by background flush workers.
+
+    ``flush_fn`` receives a list of ``(activity_id, activity_doc)`` tuples and
+    must persist them (raising on failure). Failed batches are retried with a
+    short backoff and dropped, with a log line, once ``max_attempts`` is hit;
+    ``on_drop`` then receives the dropped batch so callers can forget what
+    they acknowledged for it.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[QueuedActivity]], None],
+        *,
+        max_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        workers: int = 2,
+        max_attempts: int = 3,
+        on_drop: Optional[Callable[[List[QueuedActivity]], None]] = None,
+    ):
+        self._flush_fn = flush_fn
+        self._on_drop = on_drop
+        self._queue: "queue.Queue[QueuedActivity]" = queue.Queue(maxsize=max_size)
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._worker_count = max(1, workers)
+        self._max_attempts = max(1, max_attempts)
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'enqueued': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'flush_count': 0,
+            'flush_errors': 0,
+            'flush_ms_total': 0.0,
+            'flush_ms_max': 0.0,
+            'last_flush_ms': None,
+            'last_flush_at': None,
+        }
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop_event.clear()
+            for index in range(self._worker_count):
+                thread = threading.Thread(target=self._run, name=f'ingest-flush-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"[Ingest Queue] Started {self._worker_count} flush workers (max_size={self._max_size}, batch_size={self._batch_size})")
+
+    def submit(self, activity_id: str, activity_doc: Dict[str, Any]) -> None:
+        """Enqueue an activity without blocking. Raises IngestQueueFull when at capacity."""
+        if self._stop_event.is_set():
+            raise IngestQueueFull('Ingest queue is shutting down')
+        try:
+            self._queue.put_nowait((activity_id, activity_doc))
+        except queue.Full as exc:
+            with self._metrics_lock:
+                self._metrics['rejected'] += 1
+            raise IngestQueueFull('Ingest queue is full') from exc
+        with self._metrics_lock:
+            self._metrics['enqueued'] += 1
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Stop accepting work and flush everything still queued."""
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Anything left (e.g. workers never started) is flushed inline
+        while True:
+            batch = self._drain_nowait()
+            if not batch:
+                break
+            self._flush(batch)
+        self._threads = []
+        print("[Ingest Queue] Stopped and flushed")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        flush_count = snapshot['flush_count']
+        snapshot['avg_flush_ms'] = round(snapshot['flush_ms_total'] / flush_count, 3) if flush_count else None
+        snapshot['flush_ms_max'] = round(snapshot['flush_ms_max'], 3)
+        snapshot.pop('flush_ms_total')
+        snapshot['queue_depth'] = self._queue.qsize()
+        snapshot['max_size'] = self._max_size
+        snapshot['workers'] = len(self._threads)
+        return snapshot
+
+    def _run(self) -> None:
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+    def _collect_batch(self) -> List[QueuedActivity]:
+        try:
+            first = self._queue.get(timeout=self._flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                batch.extend(self._drain_nowait(self._batch_size - len(batch)))
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain_nowait(self, limit: Optional[int] = None) -> List[QueuedActivity]:
+        limit = self._batch_size if limit is None else limit
+        items: List[QueuedActivity] = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _flush(self, batch: List[QueuedActivity]) -> None:
+        for attempt in range(1, self._max_attempts + 1):
+            started = time.perf_counter()
+            try:
+                self._flush_fn(batch)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[Ingest Queue] Flush of {len(batch)} activities failed (attempt {attempt}/{self._max_attempts}): {exc}")
+                with self._metrics_lock:
+                    self._metrics['flush_errors'] += 1
+                if attempt < self._max_attempts:
+                    time.sleep(0.5 * attempt)
+                continue
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._metrics_lock:
+                self._metrics['flushed'] += len(batch)
+                self._metrics['flush_count'] += 1
+                self._metrics['flush_ms_total'] += elapsed_ms
+                self._metrics['flush_ms_max'] = max(self._metrics['flush_ms_max'], elapsed_ms)
+                self._metrics['last_flush_ms'] = round(elapsed_ms, 3)
+                self._metrics['last_flush_at'] = time.time()
+            return
+
+        print(f"[Ingest Queue] ERROR: dropping {len(batch)} activities after {self._max_attempts} failed flushes: {[activity_id for activity_id, _ in batch]}")
+        with self._metrics_lock:
+            self._metrics['dropped'] += len(batch)
+        if self._on_drop is not None:
+            try:
+                self._on_drop(batch)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[Ingest Queue] on_drop callback failed: {exc}")
@@ -0,0 +1,98 @@
+"""
+Insight Cache Module
+Materializes generated insights in ``insights/{user}_{period}`` so repeated
+dashboard loads cost one document read plus the user's rollup version.
+Each entry records the rollup version it was built from (see
+``rollups.read_rollup_version``); a changed version is a miss, so ingest
+never has to write to the cache. Entries also expire after a TTL.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.firebase_config import get_collection, get_db
+
+INSIGHTS_COLLECTION = 'insights'
+INSIGHT_PERIODS = ('daily', 'weekly', 'monthly')
+INSIGHT_CACHE_TTL_SECONDS = max(0, int(os.getenv('INSIGHTS_CACHE_TTL_SECONDS', 900)))
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+
+def insight_cache_doc_id(user_key: str, period: str) -> str:
+    return f'{user_key}_{period}'
+
+
+def read_cached_insights(user_key: str, period: str) -> Optional[Dict[str, Any]]:
+    """Return the cached entry for (user, period) if it has not expired, else None.
+
+    The caller still has to check the entry's ``rollups_version``.
+    """
+    if INSIGHT_CACHE_TTL_SECONDS <= 0:
+        return None
+    snapshot = get_collection(INSIGHTS_COLLECTION).document(insight_cache_doc_id(user_key, period)).get()
+    if not snapshot.exists:
+        return None
+    data = snapshot.to_dict() or {}
+    expires_at = data.get('expires_at')
+    if not isinstance(expires_at, datetime):
+        return None
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at <= datetime.now(timezone.utc):
+        return None
+    return data
+
+
+def store_insights(
+    user_key: str,
+    period: str,
+    insights: List[Dict[str, Any]],
+    inputs: Dict[str, Any],
+    team_avg: Optional[Dict[str, Any]] = None,
+    team_percentiles: Optional[Dict[str, Any]] = None,
+    rollups_version: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cache the insights generated for (user, period), with the team context they were compared against
+    and the rollup version they were built from, and return the entry. Write errors are logged,
+    not raised."""
+    now = datetime.utcnow()
+    entry = {
+        'user_key': user_key,
+        'period': period,
+        'insights': insights,
+        'inputs': inputs,
+        'team_avg': team_avg,
+        'team_percentiles': team_percentiles,
+        'rollups_version': rollups_version,
+        'generated_at': now,
+        'expires_at': now + timedelta(seconds=INSIGHT_CACHE_TTL_SECONDS),
+    }
+    if INSIGHT_CACHE_TTL_SECONDS > 0:
+        try:
+            get_collection(INSIGHTS_COLLECTION).document(insight_cache_doc_id(user_key, period)).set(entry)
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[Insight Cache] Failed to store insights (non-fatal): {exc}")
+    return entry
+
+
+def invalidate_insights(user_keys: Iterable[str]) -> None:
+    """Drop every cached period for the given users (deleting a missing document is a no-op).
+
+    Rebuilds use it to drop entries outright; ingest relies on the version check instead.
+    """
+    refs = []
+    insights_ref = get_collection(INSIGHTS_COLLECTION)
+    for user_key in sorted({key for key in user_keys if key}):
+        for period in INSIGHT_PERIODS:
+            refs.append(insights_ref.document(insight_cache_doc_id(user_key, period)))
+    if not refs:
+        return
+    db = get_db()
+    for start in range(0, len(refs), FIRESTORE_MAX_BATCH_WRITES):
+        batch = db.batch()
+        for ref in refs[start:start + FIRESTORE_MAX_BATCH_WRITES]:
+            batch.delete(ref)
+        batch.commit()
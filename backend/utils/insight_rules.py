@@ -0,0 +1,292 @@
+"""
+Insight Rule Engine
+Declarative table of insight rules (metric expression, comparator,
+threshold, message template). The table is compiled once at import into
+code objects over a flat namespace of period metrics, so evaluating a user
+is one namespace build plus one cheap check per rule, and every triggered
+rule is returned.
+"""
+
+from __future__ import annotations
+
+import ast
+import operator
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# Names rule expressions may reference; build_rule_namespace fills all of them
+NAMESPACE_KEYS = (
+    'email_count',
+    'avg_attachment_size',
+    'team_avg_email_count',
+    'team_p90_email_count',
+    'email_pct_over_team_avg',
+    'total_meetings',
+    'meeting_hours',
+    'avg_duration',
+    'has_video_count',
+    'video_percentage',
+    'storage_count',
+    'storage_gb',
+    'unused_estimate_gb',
+    'unused_co2_kg',
+    'browsing_count',
+    'idle_tabs',
+    'streaming_hours',
+)
+
+COMPARATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Rules are evaluated in table order; 'when' is an optional guard expression.
+# Templates are str.format strings over the namespace.
+INSIGHT_RULES = [
+    {
+        'id': 'email_team_p90',
+        'category': 'email',
+        'metric': 'email_count',
+        'comparator': '>',
+        'threshold': 'team_p90_email_count',
+        'when': 'team_p90_email_count > 0',
+        'message': (
+            "You sent {email_count} emails this week, more than 90% of your team (typical: {team_p90_email_count:.0f}). "
+            "Try batching updates or using collaboration tools instead."
+        ),
+    },
+    {
+        'id': 'email_team_avg',
+        'category': 'email',
+        'metric': 'email_count',
+        'comparator': '>',
+        'threshold': 'team_avg_email_count * 1.4',
+        'when': 'team_avg_email_count > 0 and not (team_p90_email_count > 0 and email_count > team_p90_email_count)',
+        'message': (
+            "You sent {email_pct_over_team_avg:.0f}% more emails this week than your team average. "
+            "Try batching updates or using collaboration tools instead."
+        ),
+    },
+    {
+        'id': 'email_volume',
+        'category': 'email',
+        'metric': 'email_count',
+        'comparator': '>',
+        'threshold': 100,
+        'when': (
+            'not (team_p90_email_count > 0 and email_count > team_p90_email_count)'
+            ' and not (team_avg_email_count > 0 and email_count > team_avg_email_count * 1.4)'
+        ),
+        'message': (
+            "You sent {email_count} emails this week. "
+            "Consider consolidating multiple updates into fewer, comprehensive emails."
+        ),
+    },
+    {
+        'id': 'email_attachments',
+        'category': 'email',
+        'metric': 'avg_attachment_size',
+        'comparator': '>',
+        'threshold': 5,
+        'message': (
+            "Your average attachment size is {avg_attachment_size:.1f}MB. "
+            "Use cloud storage links (Drive/OneDrive) instead of attachments to reduce emissions."
+        ),
+    },
+    {
+        'id': 'meeting_duration',
+        'category': 'meeting',
+        'metric': 'avg_duration',
+        'comparator': '>',
+        'threshold': 60,
+        'message': (
+            "Your average meeting duration is {avg_duration:.0f} minutes. "
+            "Try keeping meetings under 30 minutes when possible, or split longer sessions."
+        ),
+    },
+    {
+        'id': 'meeting_short_video',
+        'category': 'meeting',
+        'metric': 'video_percentage',
+        'comparator': '>',
+        'threshold': 80,
+        'when': 'total_meetings > 0 and avg_duration < 15',
+        'message': "For short meetings (<15 min), consider audio-only mode to reduce emissions by 75%.",
+    },
+    {
+        'id': 'meeting_hours',
+        'category': 'meeting',
+        'metric': 'meeting_hours',
+        'comparator': '>',
+        'threshold': 20,
+        'message': (
+            "You spent {meeting_hours:.1f} hours in meetings this week. "
+            "Evaluate if all meetings are necessary or if async communication could work."
+        ),
+    },
+    {
+        'id': 'storage_unused',
+        'category': 'storage',
+        'metric': 'unused_estimate_gb',
+        'comparator': '>',
+        'threshold': 1,
+        'when': 'storage_count > 0',
+        'message': (
+            "Deleting {unused_estimate_gb:.1f}GB of unused data could save ~{unused_co2_kg:.1f}kg CO₂ per year. "
+            "Review and clean up old files regularly."
+        ),
+    },
+    {
+        'id': 'storage_usage',
+        'category': 'storage',
+        'metric': 'storage_gb',
+        'comparator': '>',
+        'threshold': 50,
+        'when': 'storage_count > 0',
+        'message': (
+            "You're using {storage_gb:.1f}GB of cloud storage. "
+            "Consider archiving old files or using compression for large documents."
+        ),
+    },
+    {
+        'id': 'browsing_idle_tabs',
+        'category': 'browsing',
+        'metric': 'idle_tabs',
+        'comparator': '>',
+        'threshold': 10,
+        'when': 'browsing_count > 0',
+        'message': (
+            "Detected {idle_tabs} idle browser tabs. "
+            "Close unused tabs to reduce energy consumption and emissions."
+        ),
+    },
+    {
+        'id': 'browsing_streaming',
+        'category': 'browsing',
+        'metric': 'streaming_hours',
+        'comparator': '>',
+        'threshold': 5,
+        'when': 'browsing_count > 0',
+        'message': (
+            "You streamed {streaming_hours:.1f} hours this week. "
+            "Consider downloading content for offline viewing when possible."
+        ),
+    },
+]
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Gt, ast.GtE, ast.Lt, ast.LtE,
+    ast.Eq, ast.NotEq, ast.Name, ast.Load, ast.Constant,
+)
+_EVAL_GLOBALS = {'__builtins__': {}}
+
+
+class InsightRuleError(ValueError):
+    """Raised when a rule in the table cannot be compiled."""
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    id: str
+    category: str
+    template: str
+    condition: Any  # code object evaluating to bool over the namespace
+
+
+def compile_expression(expression: Any, rule_id: str = '<rule>') -> str:
+    """Validate an expression (number or string) against the namespace and return its source."""
+    source = repr(expression) if isinstance(expression, (int, float)) else str(expression)
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as exc:
+        raise InsightRuleError(f'Rule {rule_id}: invalid expression {source!r}') from exc
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise InsightRuleError(f'Rule {rule_id}: unsupported syntax in {source!r}')
+        if isinstance(node, ast.Name) and node.id not in NAMESPACE_KEYS:
+            raise InsightRuleError(f'Rule {rule_id}: unknown metric {node.id!r}')
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise InsightRuleError(f'Rule {rule_id}: only numeric constants are allowed')
+    return source
+
+
+def compile_rules(rules: List[Dict[str, Any]]) -> List[CompiledRule]:
+    """Compile the rule table into one code object per rule."""
+    compiled = []
+    for rule in rules:
+        rule_id = rule['id']
+        if rule['comparator'] not in COMPARATORS:
+            raise InsightRuleError(f"Rule {rule_id}: unknown comparator {rule['comparator']!r}")
+        condition = (
+            f"({compile_expression(rule['metric'], rule_id)}) {rule['comparator']} "
+            f"({compile_expression(rule['threshold'], rule_id)})"
+        )
+        if rule.get('when'):
+            condition = f"({compile_expression(rule['when'], rule_id)}) and {condition}"
+        compiled.append(CompiledRule(
+            id=rule_id,
+            category=rule['category'],
+            template=rule['message'],
+            condition=compile(condition, f'<insight rule {rule_id}>', 'eval'),
+        ))
+    return compiled
+
+
+COMPILED_RULES = compile_rules(INSIGHT_RULES)
+
+
+def build_rule_namespace(
+    inputs: Dict[str, Any],
+    team_avg: Optional[Dict[str, float]] = None,
+    team_percentiles: Optional[Dict[str, Dict[str, float]]] = None,
+) -> Dict[str, Any]:
+    """Flatten insight inputs (utils.insights.insight_inputs) and team statistics into rule variables."""
+    email = inputs.get('email') or {}
+    meeting = inputs.get('meeting') or {}
+    storage = inputs.get('storage') or {}
+    web = inputs.get('web') or {}
+
+    email_count = email.get('email_count', 0)
+    team_avg_email_count = float((team_avg or {}).get('email_count') or 0)
+    total_meetings = meeting.get('total_meetings', 0)
+    unused_estimate_gb = storage.get('unused_estimate_gb', 0)
+
+    return {
+        'email_count': email_count,
+        'avg_attachment_size': email.get('avg_attachment_size', 0),
+        'team_avg_email_count': team_avg_email_count,
+        'team_p90_email_count': float(((team_percentiles or {}).get('email_count') or {}).get('p90') or 0),
+        'email_pct_over_team_avg': int((email_count - team_avg_email_count) / team_avg_email_count * 100) if team_avg_email_count else 0,
+        'total_meetings': total_meetings,
+        'meeting_hours': meeting.get('meeting_hours', 0),
+        'avg_duration': meeting.get('avg_duration', 0),
+        'has_video_count': meeting.get('has_video_count', 0),
+        'video_percentage': (meeting.get('has_video_count', 0) / total_meetings * 100) if total_meetings else 0,
+        'storage_count': storage.get('count', 0),
+        'storage_gb': storage.get('storage_gb', 0),
+        'unused_estimate_gb': unused_estimate_gb,
+        'unused_co2_kg': unused_estimate_gb * 3.6,  # 3.6kg per GB per year
+        'browsing_count': web.get('count', 0),
+        'idle_tabs': web.get('idle_tabs', 0),
+        'streaming_hours': web.get('streaming_hours', 0),
+    }
+
+
+def evaluate_rules(namespace: Dict[str, Any], category: Optional[str] = None, rules: Optional[List[CompiledRule]] = None) -> List[Dict[str, str]]:
+    """Return every triggered rule (optionally only one category) as ``{rule, category, message}``."""
+    triggered = []
+    for rule in COMPILED_RULES if rules is None else rules:
+        if category and rule.category != category:
+            continue
+        if eval(rule.condition, _EVAL_GLOBALS, namespace):  # pylint: disable=eval-used
+            triggered.append({
+                'rule': rule.id,
+                'category': rule.category,
+                'message': rule.template.format(**namespace),
+            })
+    return triggered
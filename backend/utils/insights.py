@@ -5,8 +5,9 @@ Generates intelligent suggestions based on activity patterns and thresholds
 
 from datetime import datetime, timedelta
 from utils.firebase_config import get_collection
+from utils.insight_rules import build_rule_namespace, evaluate_rules
 
-def generate_email_insight(email_count, avg_attachment_size, team_avg=None):
+def generate_email_insight(email_count, avg_attachment_size, team_avg=None, team_p90=None):
     """
     Generate insight for email activities
     
@@ -14,33 +15,17 @@ def generate_email_insight(email_count, avg_attachment_size, team_avg=None):
         email_count: Number of emails sent
         avg_attachment_size: Average attachment size in MB
         team_avg: Team average email count (optional)
+        team_p90: Team 90th percentile email count (optional)
     
     Returns:
         str: Insight message
     """
-    insights = []
-    
-    # High email volume insight
-    if team_avg and email_count > team_avg * 1.4:
-        percentage = int(((email_count - team_avg) / team_avg) * 100)
-        insights.append(
-            f"You sent {percentage}% more emails this week than your team average. "
-            "Try batching updates or using collaboration tools instead."
-        )
-    elif email_count > 100:
-        insights.append(
-            f"You sent {email_count} emails this week. "
-            "Consider consolidating multiple updates into fewer, comprehensive emails."
-        )
-    
-    # Large attachment insight
-    if avg_attachment_size > 5:
-        insights.append(
-            f"Your average attachment size is {avg_attachment_size:.1f}MB. "
-            "Use cloud storage links (Drive/OneDrive) instead of attachments to reduce emissions."
-        )
-    
-    return insights[0] if insights else None
+    namespace = build_rule_namespace(
+        {'email': {'email_count': email_count, 'avg_attachment_size': avg_attachment_size}},
+        team_avg={'email_count': team_avg},
+        team_percentiles={'email_count': {'p90': team_p90}},
+    )
+    return _first_message(namespace, 'email')
 
 def generate_meeting_insight(meeting_hours, avg_duration, has_video_count, total_meetings):
     """
@@ -55,30 +40,13 @@ def generate_meeting_insight(meeting_hours, avg_duration, has_video_count, total
     Returns:
         str: Insight message
     """
-    insights = []
-    
-    # Long meetings insight
-    if avg_duration > 60:
-        insights.append(
-            f"Your average meeting duration is {avg_duration:.0f} minutes. "
-            "Try keeping meetings under 30 minutes when possible, or split longer sessions."
-        )
-    
-    # Video usage insight
-    video_percentage = (has_video_count / total_meetings * 100) if total_meetings > 0 else 0
-    if video_percentage > 80 and avg_duration < 15:
-        insights.append(
-            "For short meetings (<15 min), consider audio-only mode to reduce emissions by 75%."
-        )
-    
-    # High meeting hours insight
-    if meeting_hours > 20:
-        insights.append(
-            f"You spent {meeting_hours:.1f} hours in meetings this week. "
-            "Evaluate if all meetings are necessary or if async communication could work."
-        )
-    
-    return insights[0] if insights else None
+    namespace = build_rule_namespace({'meeting': {
+        'meeting_hours': meeting_hours,
+        'avg_duration': avg_duration,
+        'has_video_count': has_video_count,
+        'total_meetings': total_meetings,
+    }})
+    return _first_message(namespace, 'meeting')
 
 def generate_storage_insight(storage_gb, unused_estimate_gb):
     """
@@ -91,24 +59,12 @@ def generate_storage_insight(storage_gb, unused_estimate_gb):
     Returns:
         str: Insight message
     """
-    insights = []
-    
-    # Unused storage insight
-    if unused_estimate_gb > 1:
-        co2_saved = unused_estimate_gb * 3.6  # 3.6kg per GB per year
-        insights.append(
-            f"Deleting {unused_estimate_gb:.1f}GB of unused data could save ~{co2_saved:.1f}kg CO₂ per year. "
-            "Review and clean up old files regularly."
-        )
-    
-    # High storage usage insight
-    if storage_gb > 50:
-        insights.append(
-            f"You're using {storage_gb:.1f}GB of cloud storage. "
-            "Consider archiving old files or using compression for large documents."
-        )
-    
-    return insights[0] if insights else None
+    namespace = build_rule_namespace({'storage': {
+        'storage_gb': storage_gb,
+        'unused_estimate_gb': unused_estimate_gb,
+        'count': 1,
+    }})
+    return _first_message(namespace, 'storage')
 
 def generate_web_insight(idle_tabs, streaming_hours):
     """
@@ -121,23 +77,16 @@ def generate_web_insight(idle_tabs, streaming_hours):
     Returns:
         str: Insight message
     """
-    insights = []
-    
-    # Idle tabs insight
-    if idle_tabs > 10:
-        insights.append(
-            f"Detected {idle_tabs} idle browser tabs. "
-            "Close unused tabs to reduce energy consumption and emissions."
-        )
-    
-    # High streaming insight
-    if streaming_hours > 5:
-        insights.append(
-            f"You streamed {streaming_hours:.1f} hours this week. "
-            "Consider downloading content for offline viewing when possible."
-        )
-    
-    return insights[0] if insights else None
+    namespace = build_rule_namespace({'web': {
+        'idle_tabs': idle_tabs,
+        'streaming_hours': streaming_hours,
+        'count': 1,
+    }})
+    return _first_message(namespace, 'browsing')
+
+def _first_message(namespace, category):
+    triggered = evaluate_rules(namespace, category=category)
+    return triggered[0]['message'] if triggered else None
 
 def generate_insight(activity_type, **kwargs):
     """
@@ -154,7 +103,8 @@ def generate_insight(activity_type, **kwargs):
         return generate_email_insight(
             email_count=kwargs.get('email_count', 0),
             avg_attachment_size=kwargs.get('avg_attachment_size', 0),
-            team_avg=kwargs.get('team_avg', None)
+            team_avg=kwargs.get('team_avg', None),
+            team_p90=kwargs.get('team_p90', None)
         )
     
     elif activity_type == 'meeting':
@@ -179,18 +129,128 @@ def generate_insight(activity_type, **kwargs):
     
     return None
 
+PERIOD_DAYS = {
+    'daily': 1,
+    'weekly': 7,
+    'monthly': 30,
+}
+
+def insight_inputs(metrics):
+    """
+    Derive insight inputs from summed per-day metrics
+    (the shape of activity_summary.activity_metrics, e.g. merged daily rollups)
+    
+    Args:
+        metrics: Summed metrics for the period
+    
+    Returns:
+        dict: Inputs for the generate_* functions, per activity type
+    """
+    by_type = metrics.get('by_type') or {}
+    email = metrics.get('email') or {}
+    meeting = metrics.get('meeting') or {}
+    storage = metrics.get('storage') or {}
+    browsing = metrics.get('browsing') or {}
+
+    email_count = (by_type.get('email') or {}).get('count', 0)
+    meeting_count = (by_type.get('meeting') or {}).get('count', 0)
+    meeting_minutes = meeting.get('minutes', 0)
+
+    return {
+        'email': {
+            'email_count': email_count,
+            'avg_attachment_size': (email.get('attachment_bytes', 0) / email_count / 1_000_000) if email_count else 0,
+        },
+        'meeting': {
+            'meeting_hours': meeting_minutes / 60,
+            'avg_duration': meeting_minutes / meeting_count if meeting_count else 0,
+            'has_video_count': meeting.get('video_count', 0),
+            'total_meetings': meeting_count,
+        },
+        'storage': {
+            'storage_gb': storage.get('total_storage_gb', 0),
+            # Estimate unused storage (simplified - 20% of total)
+            'unused_estimate_gb': storage.get('total_storage_gb', 0) * 0.2,
+            'count': (by_type.get('storage') or {}).get('count', 0),
+        },
+        'web': {
+            'idle_tabs': 0,
+            'streaming_hours': browsing.get('minutes', 0) / 60,  # Simplified
+            'count': (by_type.get('browsing') or {}).get('count', 0),
+        },
+    }
+
+def generate_insights(inputs, created_at=None, team_avg=None, team_percentiles=None):
+    """
+    Generate every triggered insight for the period in one pass over the rule table
+    
+    Args:
+        inputs: Output of insight_inputs()
+        created_at: Timestamp stamped on each insight (defaults to now)
+        team_avg: Team averages per user (see utils.thresholds), optional
+        team_percentiles: Team p50/p90 per metric (see utils.team_sketches), optional
+    
+    Returns:
+        list: Insight dicts with id, category, rule, message and created_at
+    """
+    created_at = (created_at or datetime.utcnow()).isoformat()
+    namespace = build_rule_namespace(inputs, team_avg=team_avg, team_percentiles=team_percentiles)
+    return [
+        {
+            'id': f"{insight['category']}_{index}",
+            'category': insight['category'],
+            'rule': insight['rule'],
+            'message': insight['message'],
+            'created_at': created_at,
+        }
+        for index, insight in enumerate(evaluate_rules(namespace))
+    ]
+
 def check_thresholds(user_id, period='weekly'):
     """
     Check if user activities exceed thresholds and generate insights
     
+    Reads the user's daily rollups for the period; the team average and
+    percentiles come from the user's last fleet-wide evaluation
+    (python -m jobs.check_thresholds).
+    
     Args:
-        user_id: User ID
+        user_id: User ID (or email)
         period: Time period ('daily', 'weekly', 'monthly')
     
     Returns:
         list: List of insight messages
     """
-    # This will be implemented when we have activity data
-    # For now, returns empty list
-    return []
+    from utils.activity_summary import merge_metrics
+    from utils.rollups import iter_rollup_days, rollup_user_key, rollups_query
+
+    if period not in PERIOD_DAYS:
+        period = 'weekly'
+    is_email = '@' in str(user_id or '')
+    user_email = user_id if is_email else None
+    plain_user_id = None if is_email else user_id
+
+    start_day = (datetime.utcnow() - timedelta(days=PERIOD_DAYS[period])).date()
+    totals = {}
+    for _, _, metrics in iter_rollup_days(rollups_query(user_email=user_email, user_id=plain_user_id, since=start_day)):
+        merge_metrics(totals, metrics)
+
+    team_avg, team_percentiles = read_team_context(rollup_user_key(user_email, plain_user_id), period)
+    insights = generate_insights(insight_inputs(totals), team_avg=team_avg, team_percentiles=team_percentiles)
+    return [insight['message'] for insight in insights]
+
 
+def read_team_context(user_key, period):
+    """
+    Team averages and percentiles stored with the user's last alert evaluation
+
+    Args:
+        user_key: rollup_user_key() of the user
+        period: Insight period (daily, weekly, monthly)
+
+    Returns:
+        tuple: (team_avg, team_percentiles), each None when not evaluated yet
+    """
+    evaluation = get_collection('alerts').document(f'{user_key}_{period}').get()
+    stored = (evaluation.to_dict() or {}) if evaluation.exists else {}
+    return stored.get('team_avg'), stored.get('team_percentiles')
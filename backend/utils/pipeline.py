@@ -0,0 +1,97 @@
+"""
+Staged Pipeline
+Runs producers and a chain of worker stages connected by bounded queues.
+A full queue blocks the stage feeding it, so a slow stage throttles
+everything upstream and the number of items in flight never exceeds the
+queue sizes plus one per worker, however long the input is.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Any, Callable, List, Sequence, Tuple
+
+_DONE = object()
+
+# A source calls emit(item) for each item it produces
+Source = Callable[[Callable[[Any], None]], None]
+# A stage is (worker factory, number of workers). Each worker thread calls the
+# factory once, so workers can own non-thread-safe clients, and then calls the
+# returned function per item; its result (unless None) goes to the next stage.
+Stage = Tuple[Callable[[], Callable[[Any], Any]], int]
+
+
+def run_pipeline(sources: Sequence[Source], stages: Sequence[Stage], queue_size: int = 4, name: str = 'Pipeline') -> int:
+    """Run every source concurrently and push their items through ``stages``.
+
+    A failing item is logged and dropped, and counted in the return value:
+    the number of items that didn't make it through (including items
+    drained by a worker that couldn't start). Callers must check it before
+    committing progress. Source errors stop nothing else; the first one is
+    re-raised once the pipeline has drained.
+    """
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+    errors: List[BaseException] = []
+    failed = [0]
+    failed_lock = threading.Lock()
+
+    def count_failure() -> None:
+        with failed_lock:
+            failed[0] += 1
+
+    def run_source(source: Source) -> None:
+        try:
+            source(queues[0].put)
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+
+    def run_worker(index: int, make_worker: Callable[[], Callable[[Any], Any]]) -> None:
+        in_queue = queues[index]
+        out_queue = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            work = make_worker()
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[{name}] Stage {index} worker failed to start: {exc}")
+            work = None
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                return
+            if work is None:
+                # Keep draining so upstream never blocks on this stage
+                count_failure()
+                continue
+            try:
+                result = work(item)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[{name}] Stage {index} error: {exc}")
+                count_failure()
+                continue
+            if out_queue is not None and result is not None:
+                out_queue.put(result)
+
+    source_threads = [_start(run_source, source) for source in sources]
+    stage_threads = [
+        [_start(run_worker, index, make_worker) for _ in range(max(1, workers))]
+        for index, (make_worker, workers) in enumerate(stages)
+    ]
+
+    for thread in source_threads:
+        thread.join()
+    # Stop each stage once everything upstream has finished
+    for index, threads in enumerate(stage_threads):
+        for _ in threads:
+            queues[index].put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return failed[0]
+
+
+def _start(target, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
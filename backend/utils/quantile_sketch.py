@@ -0,0 +1,133 @@
+"""
+KLL Quantile Sketch
+Mergeable streaming quantile sketch (Karnin, Lang, Liberty 2016) in pure
+Python. Memory is O(k) regardless of stream length, two sketches merge into
+one that summarizes both streams, and ``to_bytes``/``from_bytes`` give a
+compact binary form that fits in a Firestore bytes field.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import struct
+from typing import Iterable, List, Optional
+
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BHdQB')  # version, k, c, n, levels
+_LEVEL = struct.Struct('<I')
+
+
+class KLLSketch:
+    """Approximate quantiles with rank error roughly 1.65 / k."""
+
+    def __init__(self, k: int = 128, c: float = 2.0 / 3.0, seed: Optional[int] = None):
+        if k < 8:
+            raise ValueError('k must be at least 8')
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors: List[List[float]] = [[]]
+        self._size = 0
+        self._max_size = 0
+        self._rng = random.Random(seed)
+        self._update_max_size()
+
+    def update(self, value: float) -> None:
+        self.compactors[0].append(float(value))
+        self._size += 1
+        self.n += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def update_many(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Fold ``other`` into this sketch in place and return self."""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        self._update_max_size()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self._size = sum(len(items) for items in self.compactors)
+        while self._size >= self._max_size:
+            self._compress()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate value at quantile ``q`` in [0, 1]; None for an empty sketch."""
+        weighted = self._weighted_items()
+        if not weighted:
+            return None
+        target = min(max(q, 0.0), 1.0) * sum(weight for _, weight in weighted)
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def rank(self, value: float) -> float:
+        """Approximate fraction of the stream that is <= ``value``."""
+        weighted = self._weighted_items()
+        total = sum(weight for _, weight in weighted)
+        if not total:
+            return 0.0
+        return sum(weight for item, weight in weighted if item <= value) / total
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_FORMAT_VERSION, self.k, self.c, self.n, len(self.compactors))]
+        for items in self.compactors:
+            parts.append(_LEVEL.pack(len(items)))
+            parts.append(struct.pack(f'<{len(items)}d', *items))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'KLLSketch':
+        version, k, c, n, levels = _HEADER.unpack_from(data, 0)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f'Unsupported sketch format version: {version}')
+        sketch = cls(k=k, c=c)
+        sketch.n = n
+        sketch.compactors = []
+        offset = _HEADER.size
+        for _ in range(levels):
+            (count,) = _LEVEL.unpack_from(data, offset)
+            offset += _LEVEL.size
+            sketch.compactors.append(list(struct.unpack_from(f'<{count}d', data, offset)))
+            offset += 8 * count
+        if not sketch.compactors:
+            sketch.compactors = [[]]
+        sketch._size = sum(len(items) for items in sketch.compactors)
+        sketch._update_max_size()
+        return sketch
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (self.c ** depth))) + 1
+
+    def _update_max_size(self) -> None:
+        self._max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self) -> None:
+        for level in range(len(self.compactors)):
+            if len(self.compactors[level]) >= self._capacity(level):
+                if level + 1 >= len(self.compactors):
+                    self.compactors.append([])
+                    self._update_max_size()
+                items = sorted(self.compactors[level])
+                # An odd item out stays behind; every other item is promoted with double weight
+                kept = [items.pop()] if len(items) % 2 else []
+                self.compactors[level + 1].extend(items[self._rng.randint(0, 1)::2])
+                self.compactors[level] = kept
+                self._size = sum(len(items) for items in self.compactors)
+                if self._size < self._max_size:
+                    break
+
+    def _weighted_items(self):
+        weighted = [(value, 1 << level) for level, items in enumerate(self.compactors) for value in items]
+        weighted.sort(key=lambda item: item[0])
+        return weighted
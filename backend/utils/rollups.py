@@ -0,0 +1,306 @@
+"""
+Daily Rollups Module
+Maintains ``daily_rollups/{user}_{yyyy-mm-dd}`` documents with summed emission,
+counts and per-type metrics (the shape of ``activity_summary.activity_metrics``).
+Rollups are updated with atomic increments on every ingest path, so summary
+and insight reads cost O(days in range) instead of O(activities).
+
+The day's latest activity time is kept as epoch seconds in
+``last_activity_ts`` with a Maximum transform, so out-of-order ingests never
+move it backwards; read it back with ``rollup_last_activity``.
+
+Every rollup write also increments ``rollup_versions/{user}.version`` in
+the same batch, so readers caching anything derived from a user's rollups
+(insights) can check freshness with one document read.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from google.cloud import firestore
+
+from utils.activity_summary import activity_day, activity_metrics, emission_delta_metrics, merge_metrics
+from utils.firebase_config import get_collection, get_db
+from utils.insight_cache import invalidate_insights
+
+ROLLUPS_COLLECTION = 'daily_rollups'
+ROLLUP_VERSIONS_COLLECTION = 'rollup_versions'
+METRIC_KEYS = ('emission_kg', 'count', 'by_type', 'by_provider', 'email', 'meeting', 'storage', 'browsing')
+FIRESTORE_MAX_BATCH_WRITES = 500
+LAST_ACTIVITY_FIELD = 'last_activity_ts'
+
+
+def rollup_user_key(user_email: Optional[str] = None, user_id: Optional[str] = None) -> Optional[str]:
+    """Rollups are keyed by lowercased email when known, else by user ID."""
+    if user_email and str(user_email).strip():
+        return str(user_email).strip().lower()
+    if user_id and str(user_id).strip():
+        return str(user_id).strip()
+    return None
+
+
+def rollup_doc_id(user_key: str, day: date) -> str:
+    return f'{user_key}_{day.isoformat()}'
+
+
+def fold_rollups(activity_docs: Iterable[Dict[str, Any]], *, count_activities: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Group activity metrics by rollup document ID.
+
+    With ``count_activities=False`` the docs are emission corrections for
+    activities already rolled up (``emission_kg`` holds the delta), so only
+    the emission metrics change.
+    """
+    folded: Dict[str, Dict[str, Any]] = {}
+    for activity_doc in activity_docs:
+        user_key = rollup_user_key(activity_doc.get('user_email'), activity_doc.get('user_id'))
+        timestamp = activity_doc.get('timestamp')
+        day = activity_day(timestamp)
+        if not user_key or day is None:
+            continue
+        entry = folded.setdefault(rollup_doc_id(user_key, day), {
+            'user_key': user_key,
+            'user_email': None,
+            'user_id': None,
+            'day': day,
+            'metrics': {},
+            'last_activity_at': None,
+        })
+        entry['user_email'] = entry['user_email'] or (activity_doc.get('user_email') or None)
+        entry['user_id'] = entry['user_id'] or activity_doc.get('user_id')
+        if not count_activities:
+            merge_metrics(entry['metrics'], emission_delta_metrics(activity_doc))
+            continue
+        merge_metrics(entry['metrics'], activity_metrics(activity_doc))
+        if isinstance(timestamp, datetime) and (entry['last_activity_at'] is None or timestamp > entry['last_activity_at']):
+            entry['last_activity_at'] = timestamp
+    return folded
+
+
+def apply_rollups(folded: Dict[str, Dict[str, Any]], *, increment: bool = True, batch: Optional[firestore.WriteBatch] = None) -> None:
+    """Write folded rollups.
+
+    With ``increment`` (the ingest path) metrics are added with atomic
+    increments; without it (rebuilds) the documents are overwritten.
+    Each affected user's rollup version is incremented alongside (one
+    write per insight cache key). When ``batch`` is given the writes are
+    added to it and the caller commits; otherwise they are committed in
+    chunks of at most 500 writes.
+    """
+    if not folded:
+        return
+    rollups_ref = get_collection(ROLLUPS_COLLECTION)
+    versions_ref = get_collection(ROLLUP_VERSIONS_COLLECTION)
+    db = get_db()
+    now = datetime.utcnow()
+
+    target = batch if batch is not None else db.batch()
+    writes = 0
+    chunk_keys: set = set()
+
+    def bump_versions():
+        # Committed with the rollups they cover, so a version never lags its data
+        for user_key in sorted(chunk_keys):
+            target.set(versions_ref.document(user_key), {'version': firestore.Increment(1), 'updated_at': now}, merge=True)
+
+    for doc_id, entry in folded.items():
+        entry_keys = insight_cache_keys({doc_id: entry}) - chunk_keys
+        if batch is None and writes and writes + len(chunk_keys) + 1 + len(entry_keys) > FIRESTORE_MAX_BATCH_WRITES:
+            bump_versions()
+            target.commit()
+            target = db.batch()
+            writes = 0
+            chunk_keys = set()
+            entry_keys = insight_cache_keys({doc_id: entry})
+        chunk_keys |= entry_keys
+        writes += 1
+
+        data: Dict[str, Any] = {
+            'user_key': entry['user_key'],
+            'date': datetime.combine(entry['day'], time.min),
+            'updated_at': now,
+        }
+        if entry.get('user_email'):
+            data['user_email'] = entry['user_email']
+        if entry.get('user_id'):
+            data['user_id'] = entry['user_id']
+        last_activity_ts = _epoch_seconds(entry['last_activity_at']) if entry.get('last_activity_at') else None
+        if increment:
+            data.update(_as_increments(entry['metrics']))
+            if last_activity_ts is not None:
+                data[LAST_ACTIVITY_FIELD] = firestore.Maximum(last_activity_ts)
+            target.set(rollups_ref.document(doc_id), data, merge=True)
+        else:
+            data.update(_rounded(entry['metrics']))
+            if last_activity_ts is not None:
+                data[LAST_ACTIVITY_FIELD] = last_activity_ts
+            target.set(rollups_ref.document(doc_id), data)
+
+    bump_versions()
+    if batch is None:
+        target.commit()
+
+
+def record_rollups(activity_docs: Iterable[Dict[str, Any]]) -> None:
+    """Fold newly stored activities into their daily rollups.
+
+    Cached insights are not touched: the users' rollup versions move with
+    the same commit, which readers check. Errors are logged, never raised.
+    """
+    try:
+        apply_rollups(fold_rollups(activity_docs))
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[Rollups] Error updating daily rollups (non-fatal): {exc}")
+        import traceback
+        traceback.print_exc()
+
+
+def rollups_query(
+    *,
+    user_email: Optional[str] = None,
+    user_id: Optional[str] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+):
+    """Query one user's rollups (or everyone's when no user is given) within a day range."""
+    query = get_collection(ROLLUPS_COLLECTION)
+    user_key = rollup_user_key(user_email)
+    if user_key:
+        query = query.where('user_key', '==', user_key)
+    elif user_id:
+        query = query.where('user_id', '==', user_id)
+    if since:
+        query = query.where('date', '>=', datetime.combine(since, time.min))
+    if until:
+        query = query.where('date', '<=', datetime.combine(until, time.min))
+    return query.order_by('date')
+
+
+def iter_rollup_days(query) -> Iterator[Tuple[Dict[str, Any], date, Dict[str, Any]]]:
+    """Yield ``(rollup_doc, day, metrics)`` for each rollup document of ``query``."""
+    for doc in query.stream():
+        data = doc.to_dict() or {}
+        day = activity_day(data.get('date'))
+        if day is None:
+            continue
+        yield data, day, {key: data[key] for key in METRIC_KEYS if key in data}
+
+
+def read_rollup_version(user_key: str) -> int:
+    """Current rollup version of a user (see ``apply_rollups``); 0 before any rollup write."""
+    snapshot = get_collection(ROLLUP_VERSIONS_COLLECTION).document(user_key).get()
+    if not snapshot.exists:
+        return 0
+    return int((snapshot.to_dict() or {}).get('version') or 0)
+
+
+def rollup_last_activity(rollup: Dict[str, Any]) -> Optional[datetime]:
+    """Latest activity time of a rollup document as a UTC datetime."""
+    candidates = [rollup.get(LAST_ACTIVITY_FIELD)]
+    # Rollups written before last_activity_ts hold a last_activity_at datetime
+    if isinstance(rollup.get('last_activity_at'), datetime):
+        candidates.append(_epoch_seconds(rollup['last_activity_at']))
+    candidates = [value for value in candidates if isinstance(value, (int, float))]
+    return datetime.fromtimestamp(max(candidates), tz=timezone.utc) if candidates else None
+
+
+def rebuild_rollups(
+    *,
+    user_email: Optional[str] = None,
+    user_id: Optional[str] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    page_size: int = 500,
+) -> Dict[str, int]:
+    """Recompute rollups from raw activities and overwrite the stored ones.
+
+    Activities are scanned newest first, so each day is complete once the
+    scan moves past it and can be written and dropped from memory. Stored
+    rollups in the range that no longer have activities are deleted.
+    """
+    from utils.activity_queries import build_activities_query, stream_query_pages
+
+    query = build_activities_query(
+        get_collection('activities'),
+        user_email=user_email,
+        user_id=user_id,
+        since=datetime.combine(since, time.min) if since else None,
+        until=datetime.combine(until, time.max) if until else None,
+    )
+
+    stats = {'activities': 0, 'rollups_written': 0, 'rollups_deleted': 0}
+    written_ids = set()
+    affected_keys = set()
+    current_day: Optional[date] = None
+    pending: List[Dict[str, Any]] = []
+
+    def flush():
+        folded = fold_rollups(pending)
+        apply_rollups(folded, increment=False)
+        written_ids.update(folded)
+        affected_keys.update(insight_cache_keys(folded))
+        stats['rollups_written'] += len(folded)
+        pending.clear()
+
+    for doc in stream_query_pages(query, page_size):
+        activity_doc = doc.to_dict() or {}
+        day = activity_day(activity_doc.get('timestamp'))
+        if day != current_day and pending:
+            flush()
+        current_day = day
+        pending.append(activity_doc)
+        stats['activities'] += 1
+    if pending:
+        flush()
+
+    stale = [
+        doc.reference
+        for doc in rollups_query(user_email=user_email, user_id=user_id, since=since, until=until).select(['date']).stream()
+        if doc.id not in written_ids
+    ]
+    db = get_db()
+    for start in range(0, len(stale), FIRESTORE_MAX_BATCH_WRITES):
+        batch = db.batch()
+        for ref in stale[start:start + FIRESTORE_MAX_BATCH_WRITES]:
+            batch.delete(ref)
+        batch.commit()
+    stats['rollups_deleted'] = len(stale)
+    invalidate_insights(affected_keys)
+    return stats
+
+
+def insight_cache_keys(folded: Dict[str, Dict[str, Any]]) -> set:
+    """Insight cache keys a rollup change affects (readers may ask by email or by user ID)."""
+    keys = set()
+    for entry in folded.values():
+        keys.add(entry['user_key'])
+        if entry.get('user_id'):
+            keys.add(rollup_user_key(user_id=entry['user_id']))
+    return keys
+
+
+def _epoch_seconds(value: datetime) -> float:
+    """Seconds since the epoch; naive datetimes are UTC, as stored by the ingest API."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _as_increments(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            result[key] = _as_increments(value)
+        elif isinstance(value, float):
+            result[key] = firestore.Increment(round(value, 6))
+        else:
+            result[key] = firestore.Increment(value)
+    return result
+
+
+def _rounded(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: _rounded(value) if isinstance(value, dict) else (round(value, 6) if isinstance(value, float) else value)
+        for key, value in metrics.items()
+    }
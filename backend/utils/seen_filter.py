@@ -0,0 +1,220 @@
+"""
+Seen-ID Filters
+Per-(user, provider) Bloom filters over the provider IDs (message, event,
+file) the sync routes have stored. find_stored_ids() only asks Firestore
+about IDs the filter can't rule out, so new items in a listing cost no
+existence reads.
+
+Filters live in ``seen_filters/{provider}_{user}`` as a bytes field and are
+cached in memory for SEEN_FILTER_TTL_SECONDS. The first use seeds a filter
+from the user's stored activities, and a filter is rebuilt the same way,
+twice as large, once it holds more keys than it was sized for or its
+estimated false-positive rate doubles the target.
+
+Saves merge rather than overwrite: in one transaction the stored filter is
+read and its bits ORed into the caller's, so workers syncing the same owner
+keep each other's additions, and the merged filter replaces the cached one.
+When the stored filter has a different size (another worker rebuilt it),
+the larger one is kept and the caller's new IDs are added to it. Rebuilds
+themselves are last-writer-wins: IDs another worker adds while a rebuild
+scans may be dropped from the stored filter.
+
+A filter that misses an addition (dropped as above, or stored by another
+worker after this one loaded the filter) only costs efficiency for items
+stored under deterministic IDs: the create conflicts and is skipped. Legacy
+random-ID activities get no such protection, and the seed query (an owner
+email match, see activity_queries.email_lookup_candidates) can miss ones
+stored under another casing of the email. The filter therefore only gates
+the deterministic-ID reads; sync_writes checks every ID against the legacy
+metadata query while SYNC_LEGACY_DEDUPE is on.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from google.cloud import firestore
+
+from utils.bloom_filter import BloomFilter
+from utils.firebase_config import get_collection, get_db
+from utils.idempotency import LRUCache
+
+SEEN_FILTERS_COLLECTION = 'seen_filters'
+SEEN_FILTER_CAPACITY = int(os.getenv('SEEN_FILTER_CAPACITY', '20000'))
+SEEN_FILTER_FP_RATE = float(os.getenv('SEEN_FILTER_FP_RATE', '0.01'))
+SEEN_FILTER_TTL_SECONDS = int(os.getenv('SEEN_FILTER_TTL_SECONDS', '300'))
+SEEN_FILTERS_ENABLED = os.getenv('SEEN_FILTERS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+# Firestore caps documents at 1 MiB; leave room for the other fields
+MAX_FILTER_BYTES = 900_000
+
+_cache = LRUCache(max_entries=2048)
+_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, int]] = {}
+
+
+def seen_filter_doc_id(provider: str, owner: str) -> str:
+    return f'{provider}_{owner.strip().lower()}'
+
+
+def get_seen_filter(provider: str, owner: Optional[str], id_field: Optional[str]) -> Optional[BloomFilter]:
+    """Cached filter of ``owner``'s stored ``provider`` IDs, loading or seeding it as needed.
+
+    Returns None when filters are disabled, the owner is unknown or the
+    filter can't be loaded; callers then check every ID in Firestore.
+    """
+    if not SEEN_FILTERS_ENABLED or not owner or not id_field:
+        return None
+    key = (provider, owner.strip().lower())
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[1] < SEEN_FILTER_TTL_SECONDS:
+        return cached[0]
+    try:
+        bloom = _load_filter(provider, owner)
+        if bloom is None or _saturated(bloom):
+            bloom = rebuild_seen_filter(provider, owner, id_field, previous=bloom)
+    except Exception as exc:
+        print(f"[Seen Filter] Unavailable for {provider}/{owner}: {exc}")
+        return None
+    _cache.put(key, (bloom, time.monotonic()))
+    return bloom
+
+
+def remember_seen(provider: str, owner: Optional[str], id_field: Optional[str], external_ids: Iterable[str]) -> None:
+    """Add stored IDs to the owner's filter and persist it. Never raises."""
+    ids = [external_id for external_id in external_ids if external_id]
+    if not ids:
+        return
+    bloom = get_seen_filter(provider, owner, id_field)
+    if bloom is None:
+        return
+    with _lock:
+        for external_id in ids:
+            bloom.add(external_id)
+        saturated = _saturated(bloom)
+    try:
+        if saturated:
+            bloom = rebuild_seen_filter(provider, owner, id_field, previous=bloom)
+        else:
+            bloom = _save_filter(provider, owner, bloom, added_ids=ids)
+        _cache.put((provider, owner.strip().lower()), (bloom, time.monotonic()))
+    except Exception as exc:
+        print(f"[Seen Filter] Failed to persist {provider}/{owner}: {exc}")
+
+
+def rebuild_seen_filter(provider: str, owner: str, id_field: str, previous: Optional[BloomFilter] = None) -> BloomFilter:
+    """Seed a new filter from every stored activity of ``owner`` for ``provider`` and persist it."""
+    from utils.activity_queries import build_activities_query, stream_query_pages
+
+    query = build_activities_query(get_collection('activities'), user_email=owner, provider=provider, fields=[id_field])
+    path = id_field.split('.')
+    ids = []
+    for doc in stream_query_pages(query, page_size=1000):
+        value: Any = doc.to_dict() or {}
+        for part in path:
+            value = value.get(part) if isinstance(value, dict) else None
+        if value:
+            ids.append(str(value))
+
+    capacity = max(SEEN_FILTER_CAPACITY, 2 * len(ids), 2 * (previous.count if previous else 0))
+    bloom = BloomFilter.for_capacity(capacity, SEEN_FILTER_FP_RATE)
+    if len(bloom.bits) > MAX_FILTER_BYTES:
+        bloom = BloomFilter(MAX_FILTER_BYTES * 8, bloom.num_hashes)
+    bloom.update(ids)
+    _save_filter(provider, owner, bloom, capacity=capacity)
+    with _lock:
+        _stats(provider)['rebuilds'] += 1
+    print(f"[Seen Filter] Built {provider}/{owner}: {len(ids)} IDs, {len(bloom.bits)} bytes, capacity {capacity}")
+    return bloom
+
+
+def record_lookups(provider: str, ruled_out: int, maybe_seen: int, false_positives: int) -> None:
+    """Count one existence check: IDs the filter ruled out, IDs sent to Firestore and those not found there."""
+    with _lock:
+        stats = _stats(provider)
+        stats['lookups'] += ruled_out + maybe_seen
+        stats['ruled_out'] += ruled_out
+        stats['maybe_seen'] += maybe_seen
+        stats['false_positives'] += false_positives
+
+
+def seen_filter_metrics() -> Dict[str, Dict[str, Any]]:
+    """Per-provider lookup counts with the observed false-positive rate and Firestore reads saved."""
+    with _lock:
+        snapshot = {provider: dict(stats) for provider, stats in _metrics.items()}
+    for stats in snapshot.values():
+        negatives = stats['ruled_out'] + stats['false_positives']
+        stats['observed_fp_rate'] = round(stats['false_positives'] / negatives, 6) if negatives else 0.0
+        stats['reads_saved_pct'] = round(stats['ruled_out'] / stats['lookups'] * 100, 2) if stats['lookups'] else 0.0
+    return snapshot
+
+
+def _saturated(bloom: BloomFilter) -> bool:
+    if len(bloom.bits) >= MAX_FILTER_BYTES:
+        # Can't grow further; the false-positive rate (see metrics) rises instead
+        return False
+    # Keys the filter's bit count holds at the target false-positive rate
+    capacity = bloom.num_bits * math.log(2) ** 2 / -math.log(SEEN_FILTER_FP_RATE)
+    return bloom.count > capacity or bloom.estimated_fp_rate > 2 * SEEN_FILTER_FP_RATE
+
+
+def _stats(provider: str) -> Dict[str, int]:
+    """Counters of one provider; call with _lock held."""
+    return _metrics.setdefault(provider, {'lookups': 0, 'ruled_out': 0, 'maybe_seen': 0, 'false_positives': 0, 'rebuilds': 0})
+
+
+def _load_filter(provider: str, owner: str) -> Optional[BloomFilter]:
+    snapshot = get_collection(SEEN_FILTERS_COLLECTION).document(seen_filter_doc_id(provider, owner)).get()
+    if not snapshot.exists:
+        return None
+    data = (snapshot.to_dict() or {}).get('filter')
+    return BloomFilter.from_bytes(bytes(data)) if data else None
+
+
+def _save_filter(
+    provider: str,
+    owner: str,
+    bloom: BloomFilter,
+    added_ids: Iterable[str] = (),
+    capacity: Optional[int] = None,
+) -> BloomFilter:
+    """Merge ``bloom`` with the stored filter and persist the result, which is returned.
+
+    ``added_ids`` are the IDs just added to ``bloom``; they are carried over
+    when a larger stored filter wins. A rebuild passes ``capacity`` and its
+    filter is written even over a larger stored one.
+    """
+    doc_ref = get_collection(SEEN_FILTERS_COLLECTION).document(seen_filter_doc_id(provider, owner))
+    added_ids = list(added_ids)
+
+    @firestore.transactional
+    def merge_and_save(txn: firestore.Transaction) -> BloomFilter:
+        snapshot = doc_ref.get(transaction=txn)
+        data = (snapshot.to_dict() or {}).get('filter') if snapshot.exists else None
+        stored = BloomFilter.from_bytes(bytes(data)) if data else None
+        result = bloom
+        with _lock:
+            if stored is not None and stored.same_shape(bloom):
+                bloom.merge(stored)
+            elif stored is not None and capacity is None and stored.num_bits > bloom.num_bits:
+                stored.update(added_ids)
+                result = stored
+            doc = {
+                'provider': provider,
+                'user_email': owner.strip().lower(),
+                'filter': result.to_bytes(),
+                'count': result.count,
+                'fill_ratio': round(result.fill_ratio, 6),
+                'estimated_fp_rate': round(result.estimated_fp_rate, 8),
+                'updated_at': datetime.utcnow(),
+            }
+        if capacity is not None:
+            doc['capacity'] = capacity
+        txn.set(doc_ref, doc, merge=True)
+        return result
+
+    return merge_and_save(get_db().transaction())
@@ -0,0 +1,174 @@
+"""
+Sync Writes Module
+Deduplicates and stores the activities pulled by the provider sync routes
+(Gmail, Outlook, Google Meet, Teams, Google Drive, OneDrive).
+
+Each item is stored under sync_document_id(provider, external_id, owner),
+so a re-listed item maps to the same document. Existence is checked for a
+whole listing with get_all, and new items are inserted with a BulkWriter
+using create(), so two syncs racing on the same item end with one document:
+the loser's create conflicts and is counted as a skip. A per-user seen-ID
+filter (utils.seen_filter) rules out most new IDs before the get_all read.
+The legacy metadata-ID check (SYNC_LEGACY_DEDUPE) is not filtered: the
+filter is seeded through an owner query that can miss legacy spellings of
+the owner's email, and a missed legacy document would be created again.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.firebase_config import get_collection, get_db
+from utils.idempotency import sync_document_id
+from utils.seen_filter import get_seen_filter, record_lookups, remember_seen
+
+# google.rpc.Code.ALREADY_EXISTS, reported by BulkWriter for create() conflicts
+_ALREADY_EXISTS = 6
+MAX_WRITE_ATTEMPTS = 5
+GET_ALL_CHUNK = 500
+# Firestore limit on values in an 'in' filter
+LEGACY_IN_CHUNK = 30
+# Metadata field holding the provider ID on every sync activity
+SYNC_ID_FIELDS = {
+    'gmail': 'metadata.gmail_message_id',
+    'outlook': 'metadata.outlook_message_id',
+    'google_meet': 'metadata.google_calendar_event_id',
+    'microsoft_teams': 'metadata.microsoft_event_id',
+    'google_drive': 'metadata.google_drive_file_id',
+    'onedrive': 'metadata.onedrive_file_id',
+}
+# Activities stored before sync_document_id() have random IDs; until they are
+# past every sync window they are also matched on their metadata ID field
+LEGACY_DEDUPE = os.getenv('SYNC_LEGACY_DEDUPE', '1').lower() not in ('0', 'false', 'no')
+
+
+def find_stored_ids(provider: str, owner: Optional[str], external_ids: Iterable[str]) -> Set[str]:
+    """External IDs among ``external_ids`` that already have an activity.
+
+    Args:
+        provider: Sync provider, a key of SYNC_ID_FIELDS
+        owner: Account email the items were synced from
+        external_ids: Provider message/event/file IDs
+
+    Returns:
+        set: The external IDs that are already stored
+    """
+    ids = list(dict.fromkeys(external_id for external_id in external_ids if external_id))
+    if not ids:
+        return set()
+
+    id_field = SYNC_ID_FIELDS.get(provider)
+    seen_filter = get_seen_filter(provider, owner, id_field)
+    candidates = ids if seen_filter is None else [external_id for external_id in ids if external_id in seen_filter]
+    stored = _stored_by_document_id(provider, owner, candidates) if candidates else set()
+    if id_field and LEGACY_DEDUPE:
+        # Every ID, not just the filter's candidates: legacy documents may never have reached the filter
+        stored |= _stored_legacy(owner, [external_id for external_id in ids if external_id not in stored], id_field)
+    if seen_filter is not None:
+        false_positives = sum(1 for external_id in candidates if external_id not in stored)
+        record_lookups(provider, len(ids) - len(candidates), len(candidates), false_positives)
+    return stored
+
+
+def _stored_by_document_id(provider: str, owner: Optional[str], ids: List[str]) -> Set[str]:
+    activities_ref = get_collection('activities')
+    by_doc_id = {sync_document_id(provider, external_id, owner): external_id for external_id in ids}
+    doc_ids = list(by_doc_id)
+    stored: Set[str] = set()
+    for start in range(0, len(doc_ids), GET_ALL_CHUNK):
+        refs = [activities_ref.document(doc_id) for doc_id in doc_ids[start:start + GET_ALL_CHUNK]]
+        for snapshot in get_db().get_all(refs, field_paths=['provider']):
+            if snapshot.exists:
+                stored.add(by_doc_id[snapshot.id])
+    return stored
+
+
+def _stored_legacy(owner: Optional[str], ids: List[str], id_field: str) -> Set[str]:
+    """IDs among ``ids`` stored by the owner under a random (pre sync_document_id) document ID."""
+    activities_ref = get_collection('activities')
+    field = id_field.rsplit('.', 1)[-1]
+    # Another user's copy of a shared item (e.g. a calendar event) doesn't count.
+    # Filtered here rather than in the query: legacy emails may differ in case.
+    owner_email = (owner or '').strip().lower()
+    stored: Set[str] = set()
+    for start in range(0, len(ids), LEGACY_IN_CHUNK):
+        query = activities_ref.where(id_field, 'in', ids[start:start + LEGACY_IN_CHUNK]).select([id_field, 'user_email'])
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            if str(data.get('user_email') or '').strip().lower() != owner_email:
+                continue
+            value = (data.get('metadata') or {}).get(field)
+            if value:
+                stored.add(value)
+    return stored
+
+
+def create_sync_activities(
+    provider: str,
+    owner: Optional[str],
+    docs_by_external_id: Dict[str, Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Create new sync activities with a BulkWriter; conflicts are skipped.
+
+    Args:
+        provider: Sync provider, a key of SYNC_ID_FIELDS
+        owner: Account email the items were synced from
+        docs_by_external_id: Activity documents keyed by provider ID
+
+    Returns:
+        list: The activity documents that were created (for rollups)
+    """
+    return write_sync_activities(provider, owner, docs_by_external_id)[0]
+
+
+def write_sync_activities(
+    provider: str,
+    owner: Optional[str],
+    docs_by_external_id: Dict[str, Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Like create_sync_activities(), also reporting writes that failed.
+
+    Returns:
+        tuple: ``(created documents, external IDs whose create failed after
+        retries)``; IDs in neither were already stored
+    """
+    if not docs_by_external_id:
+        return [], []
+
+    activities_ref = get_collection('activities')
+    external_ids = {
+        sync_document_id(provider, external_id, owner): external_id
+        for external_id in docs_by_external_id
+    }
+    created: List[Dict[str, Any]] = []
+    failed: List[str] = []
+    lock = threading.Lock()
+
+    def on_result(reference, _result, _writer):
+        with lock:
+            created.append(docs_by_external_id[external_ids[reference.id]])
+
+    def on_error(failure, _writer) -> bool:
+        if failure.code == _ALREADY_EXISTS:
+            return False
+        if failure.attempts < MAX_WRITE_ATTEMPTS:
+            return True
+        print(f"[Sync Writes] Failed to create {failure.reference.id}: {failure.message}")
+        with lock:
+            failed.append(external_ids[failure.reference.id])
+        return False
+
+    writer = get_db().bulk_writer()
+    writer.on_write_result(on_result)
+    writer.on_write_error(on_error)
+    for doc_id, external_id in external_ids.items():
+        writer.create(activities_ref.document(doc_id), docs_by_external_id[external_id])
+    writer.close()
+    # Conflicting IDs are stored too; failed ones must stay unknown to the filter
+    failed_ids = set(failed)
+    remember_seen(provider, owner, SYNC_ID_FIELDS.get(provider), [
+        external_id for external_id in docs_by_external_id if external_id not in failed_ids
+    ])
+    return created, failed
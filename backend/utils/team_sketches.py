@@ -0,0 +1,90 @@
+"""
+Team Distribution Sketches
+Per-team and per-org KLL sketches of per-user metrics (emails per period,
+meeting hours, average attachment MB). Team sketches are filled while the
+threshold job streams users; org sketches are merged from team sketches, so
+neither needs another scan. Each is stored in ``teams`` as compact bytes
+next to precomputed p50/p90, making comparisons one document read.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Optional
+
+from utils.firebase_config import get_collection
+from utils.quantile_sketch import KLLSketch
+
+SKETCH_METRICS = ('email_count', 'meeting_hours', 'avg_attachment_mb')
+SKETCH_K = 128
+PERCENTILES = {'p50': 0.5, 'p90': 0.9}
+
+
+def org_doc_id(org_id: str) -> str:
+    """Org-level distributions live next to the teams as ``teams/org:{org_id}``."""
+    return f'org:{org_id}'
+
+
+class TeamDistributions:
+    """Accumulates one sketch per (team, metric) and merges them into org sketches."""
+
+    def __init__(self, k: int = SKETCH_K):
+        self.k = k
+        self.teams: Dict[str, Dict[str, KLLSketch]] = {}
+        self.team_orgs: Dict[str, str] = {}
+
+    def add(self, team_id: str, org_id: str, values: Dict[str, float]) -> None:
+        sketches = self.teams.get(team_id)
+        if sketches is None:
+            sketches = self.teams[team_id] = {metric: KLLSketch(k=self.k) for metric in SKETCH_METRICS}
+            self.team_orgs[team_id] = org_id
+        for metric in SKETCH_METRICS:
+            sketches[metric].update(values.get(metric, 0.0))
+
+    def orgs(self) -> Dict[str, Dict[str, KLLSketch]]:
+        merged: Dict[str, Dict[str, KLLSketch]] = {}
+        for team_id, sketches in self.teams.items():
+            target = merged.setdefault(
+                self.team_orgs[team_id], {metric: KLLSketch(k=self.k) for metric in SKETCH_METRICS}
+            )
+            for metric, sketch in sketches.items():
+                target[metric].merge(sketch)
+        return merged
+
+    def team_percentiles(self, team_id: str) -> Dict[str, Dict[str, float]]:
+        return sketch_percentiles(self.teams.get(team_id) or {})
+
+
+def sketch_percentiles(sketches: Dict[str, KLLSketch]) -> Dict[str, Dict[str, float]]:
+    return {
+        metric: {
+            'n': sketch.n,
+            **{name: round(sketch.quantile(q) or 0.0, 6) for name, q in PERCENTILES.items()},
+        }
+        for metric, sketch in sketches.items()
+    }
+
+
+def encode_distributions(sketches: Dict[str, KLLSketch]) -> Dict[str, Dict[str, Any]]:
+    """Firestore form of a metric->sketch map: serialized sketch plus its percentiles."""
+    percentiles = sketch_percentiles(sketches)
+    return {metric: {'sketch': sketch.to_bytes(), **percentiles[metric]} for metric, sketch in sketches.items()}
+
+
+def load_distribution(doc_id: str, period: str, metric: str) -> Optional[KLLSketch]:
+    """Load one stored sketch (team ID or ``org_doc_id(...)``), e.g. to merge several teams ad hoc."""
+    snapshot = get_collection('teams').document(doc_id).get()
+    if not snapshot.exists:
+        return None
+    stored = (((snapshot.to_dict() or {}).get('distributions') or {}).get(period) or {}).get(metric) or {}
+    data = stored.get('sketch')
+    return KLLSketch.from_bytes(bytes(data)) if data else None
+
+
+def merge_distributions(doc_ids: Iterable[str], period: str, metric: str) -> KLLSketch:
+    """Merge the stored sketches of several teams/orgs into one."""
+    merged = KLLSketch(k=SKETCH_K)
+    for doc_id in doc_ids:
+        sketch = load_distribution(doc_id, period, metric)
+        if sketch is not None:
+            merged.merge(sketch)
+    return merged
@@ -0,0 +1,190 @@
+"""
+Threshold Evaluation Module
+Fleet-wide implementation of the insight thresholds: one stream over the
+period's daily rollups, team and org averages accumulated in memory, and all
+alerts written back in chunked batches. No per-user queries, so the job
+scales linearly with the number of active users.
+
+Team membership comes from optional ``team_id``/``org_id`` fields on
+``users`` documents; users without them are grouped by email domain.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.activity_summary import merge_metrics
+from utils.firebase_config import get_collection, get_db
+from utils.insights import PERIOD_DAYS, generate_insights, insight_inputs
+from utils.rollups import iter_rollup_days, rollup_user_key, rollups_query
+from utils.team_sketches import TeamDistributions, encode_distributions, org_doc_id
+
+ALERTS_COLLECTION = 'alerts'
+TEAMS_COLLECTION = 'teams'
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+# Per-user numbers averaged across teams and orgs
+COMPARABLE_METRICS = ('emission_kg', 'email_count', 'avg_attachment_mb', 'meeting_hours', 'storage_gb', 'streaming_hours')
+
+
+def default_group(user_key: str) -> str:
+    """Fallback team/org for users without explicit membership: their email domain."""
+    _, sep, domain = (user_key or '').rpartition('@')
+    return f'domain:{domain}' if sep and domain else 'unassigned'
+
+
+def load_memberships() -> Dict[str, Tuple[str, str]]:
+    """Map every rollup user key to its ``(team_id, org_id)`` with one projected stream of ``users``."""
+    memberships: Dict[str, Tuple[str, str]] = {}
+    users = get_collection('users').select(['email', 'user_id', 'team_id', 'org_id']).stream()
+    for doc in users:
+        data = doc.to_dict() or {}
+        keys = {
+            rollup_user_key(data.get('email')),
+            rollup_user_key(user_id=data.get('user_id')),
+            rollup_user_key(doc.id) if '@' in doc.id else doc.id,
+        }
+        keys.discard(None)
+        fallback = default_group(rollup_user_key(data.get('email')) or (doc.id if '@' in doc.id else ''))
+        org_id = data.get('org_id') or fallback
+        team_id = data.get('team_id') or org_id
+        for key in keys:
+            memberships[key] = (str(team_id), str(org_id))
+    return memberships
+
+
+def comparable_values(metrics: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        'emission_kg': float(metrics.get('emission_kg', 0.0)),
+        'email_count': inputs['email']['email_count'],
+        'avg_attachment_mb': inputs['email']['avg_attachment_size'],
+        'meeting_hours': inputs['meeting']['meeting_hours'],
+        'storage_gb': inputs['storage']['storage_gb'],
+        'streaming_hours': inputs['web']['streaming_hours'],
+    }
+
+
+class _Average:
+    __slots__ = ('members', 'sums')
+
+    def __init__(self):
+        self.members = 0
+        self.sums = dict.fromkeys(COMPARABLE_METRICS, 0.0)
+
+    def add(self, values: Dict[str, float]) -> None:
+        self.members += 1
+        for key in COMPARABLE_METRICS:
+            self.sums[key] += values.get(key, 0.0)
+
+    def result(self) -> Dict[str, float]:
+        return {key: round(total / self.members, 6) if self.members else 0.0 for key, total in self.sums.items()}
+
+
+def run_threshold_job(period: str = 'weekly', *, dry_run: bool = False, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Evaluate every active user's thresholds for ``period`` and write the alerts.
+
+    Alerts go to ``alerts/{user}_{period}`` (overwritten each run, so reruns
+    are idempotent); team averages and distribution sketches are merged into
+    ``teams/{team_id}`` and org ones into ``teams/org:{org_id}``. Averages
+    and distributions cover users with activity in the period.
+    """
+    if period not in PERIOD_DAYS:
+        raise ValueError(f'Unknown period: {period}')
+    now = now or datetime.now(timezone.utc)
+    start_day = (now - timedelta(days=PERIOD_DAYS[period])).date()
+
+    users: Dict[str, Dict[str, Any]] = {}
+    rollup_count = 0
+    for rollup, _, metrics in iter_rollup_days(rollups_query(since=start_day)):
+        rollup_count += 1
+        user_key = rollup.get('user_key')
+        if not user_key:
+            continue
+        entry = users.setdefault(user_key, {'user_email': None, 'user_id': None, 'metrics': {}})
+        entry['user_email'] = entry['user_email'] or rollup.get('user_email')
+        entry['user_id'] = entry['user_id'] or rollup.get('user_id')
+        merge_metrics(entry['metrics'], metrics)
+
+    memberships = load_memberships()
+    teams: Dict[str, _Average] = {}
+    orgs: Dict[str, _Average] = {}
+    distributions = TeamDistributions()
+    team_orgs: Dict[str, str] = {}
+    for user_key, entry in users.items():
+        fallback = default_group(user_key)
+        team_id, org_id = memberships.get(user_key, (fallback, fallback))
+        entry['team_id'], entry['org_id'] = team_id, org_id
+        entry['inputs'] = insight_inputs(entry['metrics'])
+        entry['values'] = comparable_values(entry['metrics'], entry['inputs'])
+        teams.setdefault(team_id, _Average()).add(entry['values'])
+        orgs.setdefault(org_id, _Average()).add(entry['values'])
+        distributions.add(team_id, org_id, entry['values'])
+        team_orgs[team_id] = org_id
+
+    team_averages = {team_id: average.result() for team_id, average in teams.items()}
+    org_averages = {org_id: average.result() for org_id, average in orgs.items()}
+    team_percentiles = {team_id: distributions.team_percentiles(team_id) for team_id in teams}
+
+    stats = {'rollups': rollup_count, 'users': len(users), 'alerts': 0, 'users_alerted': 0, 'teams': len(teams), 'orgs': len(orgs)}
+    writes: List[Tuple[Any, Dict[str, Any], bool]] = []
+    alerts_ref = get_collection(ALERTS_COLLECTION)
+    evaluated_at = datetime.utcnow()
+    for user_key, entry in users.items():
+        team_avg = team_averages[entry['team_id']]
+        percentiles = team_percentiles[entry['team_id']]
+        alerts = generate_insights(entry['inputs'], created_at=evaluated_at, team_avg=team_avg, team_percentiles=percentiles)
+        stats['alerts'] += len(alerts)
+        stats['users_alerted'] += 1 if alerts else 0
+        writes.append((alerts_ref.document(f'{user_key}_{period}'), {
+            'user_key': user_key,
+            'user_email': entry['user_email'],
+            'user_id': entry['user_id'],
+            'team_id': entry['team_id'],
+            'org_id': entry['org_id'],
+            'period': period,
+            'alerts': alerts,
+            'values': entry['values'],
+            'team_avg': team_avg,
+            'team_percentiles': percentiles,
+            'org_avg': org_averages[entry['org_id']],
+            'evaluated_at': evaluated_at,
+        }, False))
+
+    teams_ref = get_collection(TEAMS_COLLECTION)
+    for team_id, average in teams.items():
+        org_id = team_orgs[team_id]
+        writes.append((teams_ref.document(team_id), {
+            'org_id': org_id,
+            'averages': {period: {**team_averages[team_id], 'members': average.members}},
+            'org_averages': {period: {**org_averages[org_id], 'members': orgs[org_id].members}},
+            'distributions': {period: encode_distributions(distributions.teams[team_id])},
+            'updated_at': evaluated_at,
+        }, True))
+    for org_id, sketches in distributions.orgs().items():
+        writes.append((teams_ref.document(org_doc_id(org_id)), {
+            'kind': 'org',
+            'org_id': org_id,
+            'averages': {period: {**org_averages[org_id], 'members': orgs[org_id].members}},
+            'distributions': {period: encode_distributions(sketches)},
+            'updated_at': evaluated_at,
+        }, True))
+
+    if not dry_run:
+        _commit_writes(writes)
+    return stats
+
+
+def _commit_writes(writes: Iterable[Tuple[Any, Dict[str, Any], bool]]) -> None:
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    for ref, data, merge in writes:
+        batch.set(ref, data, merge=merge)
+        pending += 1
+        if pending == FIRESTORE_MAX_BATCH_WRITES:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
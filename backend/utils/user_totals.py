@@ -0,0 +1,215 @@
+"""
+User Totals Module
+Maintains per-user emission totals with atomic increments instead of
+read-modify-write transactions, so bursts from one user never contend.
+
+Heavy users can be spread over N shard documents under
+``users/{id}/totals_shards``; ``read_user_totals`` sums them on read.
+
+The latest activity time is kept as epoch seconds in ``last_activity_ts``
+with a Maximum transform, so a late or backfilled activity never moves it
+backwards; the read takes the newest over the parent and its shards.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from google.cloud import firestore
+
+from utils.firebase_config import get_collection, get_db
+from utils.idempotency import LRUCache
+
+SHARDS_SUBCOLLECTION = 'totals_shards'
+
+# Shard count for every user (1 = write straight to users/{id})
+DEFAULT_SHARD_COUNT = max(1, int(os.getenv('USER_TOTALS_SHARDS', 1)))
+# Comma-separated user IDs/emails that always get HEAVY_USER_SHARD_COUNT shards
+SHARDED_USERS = {
+    entry.strip().lower()
+    for entry in os.getenv('USER_TOTALS_SHARDED_USERS', '').split(',')
+    if entry.strip()
+}
+HEAVY_USER_SHARD_COUNT = max(1, int(os.getenv('USER_TOTALS_HEAVY_SHARDS', 10)))
+
+COUNTER_FIELDS = ('total_emission_kg', 'activity_count')
+BREAKDOWN_FIELDS = ('emission_by_type', 'count_by_type', 'emission_by_provider', 'count_by_provider')
+LAST_ACTIVITY_FIELD = 'last_activity_ts'
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+# Sharded users whose parent doc this process already gave its identity fields
+_identified_parents = LRUCache(max_entries=4096)
+
+
+def user_totals_doc_id(activity_doc: Dict[str, Any]) -> Optional[str]:
+    """Users are keyed by user_id when known, else by email (matches the users collection)."""
+    return activity_doc.get('user_id') or activity_doc.get('user_email')
+
+
+def shard_count_for(doc_id: str) -> int:
+    if doc_id.lower() in SHARDED_USERS:
+        return max(HEAVY_USER_SHARD_COUNT, DEFAULT_SHARD_COUNT)
+    return DEFAULT_SHARD_COUNT
+
+
+def fold_user_totals(activity_docs: Iterable[Dict[str, Any]], *, count_activities: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Sum emission, counts and per-type/per-provider breakdowns per user document ID.
+
+    With ``count_activities=False`` the docs are emission corrections for
+    activities already counted (``emission_kg`` holds the delta), so only
+    the emission fields change.
+    """
+    count = 1 if count_activities else 0
+    folded: Dict[str, Dict[str, Any]] = {}
+    for activity_doc in activity_docs:
+        doc_id = user_totals_doc_id(activity_doc)
+        if not doc_id:
+            print("[User Totals] Skipping user totals update: no user_id or user_email")
+            continue
+
+        entry = folded.setdefault(doc_id, {
+            'user_id': None,
+            'user_email': None,
+            'total_emission_kg': 0.0,
+            'activity_count': 0,
+            'emission_by_type': {},
+            'count_by_type': {},
+            'emission_by_provider': {},
+            'count_by_provider': {},
+            'last_activity_at': None,
+        })
+        emission_kg = float(activity_doc.get('emission_kg', 0.0) or 0.0)
+        activity_type = activity_doc.get('activity_type') or 'unknown'
+        provider = activity_doc.get('provider') or 'unknown'
+
+        entry['user_id'] = entry['user_id'] or activity_doc.get('user_id')
+        entry['user_email'] = entry['user_email'] or activity_doc.get('user_email')
+        entry['total_emission_kg'] += emission_kg
+        entry['activity_count'] += count
+        entry['emission_by_type'][activity_type] = entry['emission_by_type'].get(activity_type, 0.0) + emission_kg
+        entry['count_by_type'][activity_type] = entry['count_by_type'].get(activity_type, 0) + count
+        entry['emission_by_provider'][provider] = entry['emission_by_provider'].get(provider, 0.0) + emission_kg
+        entry['count_by_provider'][provider] = entry['count_by_provider'].get(provider, 0) + count
+        if not count_activities:
+            continue
+
+        timestamp = activity_doc.get('timestamp')
+        if isinstance(timestamp, datetime) and (entry['last_activity_at'] is None or timestamp > entry['last_activity_at']):
+            entry['last_activity_at'] = timestamp
+    return folded
+
+
+def apply_user_totals(folded: Dict[str, Dict[str, Any]], batch: Optional[firestore.WriteBatch] = None) -> None:
+    """Write folded totals as atomic increments.
+
+    When ``batch`` is given the writes are added to it and the caller commits;
+    otherwise they are committed in chunks of at most 500 writes (a sharded
+    user can take two: the parent identity and the shard increment).
+    """
+    if not folded:
+        return
+
+    own_batch = batch is None
+    if own_batch:
+        db = get_db()
+        batch = db.batch()
+    writes = 0
+
+    users_ref = get_collection('users')
+    now = datetime.utcnow()
+    for doc_id, entry in folded.items():
+        update_data = _increment_payload(entry)
+        update_data['updated_at'] = now
+        if entry.get('last_activity_at'):
+            update_data[LAST_ACTIVITY_FIELD] = firestore.Maximum(_epoch_seconds(entry['last_activity_at']))
+        identity = {}
+        if entry.get('user_email'):
+            identity['email'] = entry['user_email']
+        if entry.get('user_id'):
+            identity['user_id'] = entry['user_id']
+
+        user_ref = users_ref.document(doc_id)
+        shards = shard_count_for(doc_id)
+        if own_batch and writes + 2 > FIRESTORE_MAX_BATCH_WRITES:
+            batch.commit()
+            batch = db.batch()
+            writes = 0
+        if shards > 1:
+            # Counters go to one random shard so the parent doc is never hot; the
+            # identity fields stay on the parent, written once per process (and
+            # not for emission corrections, whose batches have no room to spare)
+            identity_key = (doc_id, tuple(sorted(identity.items())))
+            if identity and entry['activity_count'] and _identified_parents.get(identity_key) is None:
+                batch.set(user_ref, identity, merge=True)
+                writes += 1
+                _identified_parents.put(identity_key, True)
+            user_ref = user_ref.collection(SHARDS_SUBCOLLECTION).document(str(random.randrange(shards)))
+        else:
+            update_data.update(identity)
+        batch.set(user_ref, update_data, merge=True)
+        writes += 1
+
+    if own_batch:
+        batch.commit()
+
+
+def read_user_totals(doc_id: str) -> Dict[str, Any]:
+    """Return a user's totals, summing the base document and any counter shards."""
+    user_ref = get_collection('users').document(doc_id)
+    snapshot = user_ref.get()
+    base = snapshot.to_dict() if snapshot.exists else {}
+    base = base or {}
+
+    totals: Dict[str, Any] = {
+        'total_emission_kg': float(base.get('total_emission_kg', 0.0) or 0.0),
+        'activity_count': int(base.get('activity_count', 0) or 0),
+        'shards': 0,
+    }
+    # Documents written before last_activity_ts hold a last_activity_at datetime
+    last_activity = [_epoch_seconds(value) for value in (base.get('last_activity_at'),) if isinstance(value, datetime)]
+    last_activity.append(base.get(LAST_ACTIVITY_FIELD))
+    for field in BREAKDOWN_FIELDS:
+        totals[field] = dict(base.get(field) or {})
+
+    for shard in user_ref.collection(SHARDS_SUBCOLLECTION).stream():
+        data = shard.to_dict() or {}
+        totals['shards'] += 1
+        totals['total_emission_kg'] += float(data.get('total_emission_kg', 0.0) or 0.0)
+        totals['activity_count'] += int(data.get('activity_count', 0) or 0)
+        for field in BREAKDOWN_FIELDS:
+            for key, value in (data.get(field) or {}).items():
+                totals[field][key] = totals[field].get(key, 0) + (value or 0)
+        if isinstance(data.get('last_activity_at'), datetime):
+            last_activity.append(_epoch_seconds(data['last_activity_at']))
+        last_activity.append(data.get(LAST_ACTIVITY_FIELD))
+
+    last_activity = [value for value in last_activity if isinstance(value, (int, float))]
+    totals['last_activity_at'] = datetime.fromtimestamp(max(last_activity), tz=timezone.utc) if last_activity else None
+    totals['total_emission_kg'] = round(totals['total_emission_kg'], 6)
+    for field in ('emission_by_type', 'emission_by_provider'):
+        totals[field] = {key: round(value, 6) for key, value in totals[field].items()}
+    return totals
+
+
+def _epoch_seconds(value: datetime) -> float:
+    """Seconds since the epoch; naive datetimes are UTC, as stored by the ingest API."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _increment_payload(entry: Dict[str, Any]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        'total_emission_kg': firestore.Increment(round(entry['total_emission_kg'], 6)),
+        'activity_count': firestore.Increment(entry['activity_count']),
+    }
+    for field in BREAKDOWN_FIELDS:
+        values = entry.get(field) or {}
+        if field.startswith('emission_'):
+            payload[field] = {key: firestore.Increment(round(value, 6)) for key, value in values.items()}
+        else:
+            payload[field] = {key: firestore.Increment(value) for key, value in values.items()}
+    return payload
@@ -1,7 +1,7 @@
 import React, { createContext, useCallback, useEffect, useMemo, useState } from 'react';
 import dayjs from 'dayjs';
-import { fetchActivities } from '../services/api';
-import { buildAggregations } from '../utils/aggregations';
+import { fetchActivities, fetchActivitySummary, fetchAllActivities } from '../services/api';
+import { buildAggregations, summaryFromServer } from '../utils/aggregations';
 import { getStoredProfile, setStoredProfile } from '../utils/storage';
 
 export const DataContext = createContext({});
@@ -49,6 +49,8 @@ export function DataProvider({ children }) {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [range, setRange] = useState(DEFAULT_RANGE);
+  const [serverSummary, setServerSummary] = useState(null);
+  const [needsAllActivities, setNeedsAllActivities] = useState(false);
 
   const setAuthenticatedUser = useCallback((user) => {
     setAuthenticatedUserState(user);
@@ -63,14 +65,14 @@ export function DataProvider({ children }) {
   }, []);
 
   const loadActivities = useCallback(
-    async ({ email, start, end, allTime = false } = {}) => {
+    async ({ email, start, end, allTime = false, allRows = false } = {}) => {
       setLoading(true);
       setError(null);
       try {
         // If allTime is true, don't pass date filters - get ALL historical data
         const fetchParams = {
           userEmail: email || undefined,
-          limit: allTime ? 2000 : 500,  // Higher limit for all time
+          limit: 500,
         };
         
         // Only add date filters if NOT all time
@@ -81,20 +83,28 @@ export function DataProvider({ children }) {
           fetchParams.end = end;
         }
         
-        console.log('[DataContext] Loading activities for email:', email, 'allTime:', allTime, 'range:', { start, end });
-        const response = await fetchActivities(fetchParams);
+        console.log('[DataContext] Loading activities for email:', email, 'allTime:', allTime, 'allRows:', allRows, 'range:', { start, end });
+        // Totals and charts come from the server-side summary; raw rows are only
+        // paged through in full for views that browse individual activities
+        const [summaryResponse, response] = await Promise.all([
+          fetchActivitySummary(fetchParams),
+          allRows ? fetchAllActivities(fetchParams) : fetchActivities(fetchParams),
+        ]);
         console.log('[DataContext] Received response:', {
           success: response.success,
           count: response.count,
           activitiesCount: response.activities?.length || 0,
+          summaryCount: summaryResponse.totals?.count || 0,
         });
         const activitiesList = response.activities || [];
         console.log('[DataContext] Setting activities:', activitiesList.length, 'items');
         setActivities(activitiesList);
+        setServerSummary(summaryResponse);
       } catch (err) {
         console.error('[DataContext] Failed to fetch activities', err);
         setError(err.message || 'Failed to load activities');
         setActivities([]);
+        setServerSummary(null);
       } finally {
         setLoading(false);
       }
@@ -102,6 +112,11 @@ export function DataProvider({ children }) {
     []
   );
 
+  // Per-type dashboards call this on mount; they filter raw rows by week/month
+  const requireAllActivities = useCallback(() => {
+    setNeedsAllActivities(true);
+  }, []);
+
   useEffect(() => {
     setStoredProfile({ gmailEmail, outlookEmail });
     const { start, end, preset } = range;
@@ -113,10 +128,11 @@ export function DataProvider({ children }) {
         email: emailToUse, 
         start: isAllTime ? undefined : start, 
         end: isAllTime ? undefined : end,
-        allTime: isAllTime
+        allTime: isAllTime,
+        allRows: needsAllActivities,
       });
     }
-  }, [authenticatedUser, gmailEmail, outlookEmail, range, loadActivities]);
+  }, [authenticatedUser, gmailEmail, outlookEmail, range, needsAllActivities, loadActivities]);
 
   const setPresetRange = useCallback((preset) => {
     if (preset === TIME_PRESETS.ALL_TIME) {
@@ -152,8 +168,13 @@ export function DataProvider({ children }) {
   }, []);
 
   const aggregations = useMemo(() => {
-    return buildAggregations({ activities, range });
-  }, [activities, range]);
+    // Per-type insights still come from raw rows; summary and charts from the server
+    const aggregated = buildAggregations({ activities, range });
+    if (!serverSummary) {
+      return aggregated;
+    }
+    return { ...aggregated, ...summaryFromServer(serverSummary) };
+  }, [activities, range, serverSummary]);
 
   return (
     <DataContext.Provider
@@ -165,12 +186,13 @@ export function DataProvider({ children }) {
         loading,
         error,
         activities,
+        requireAllActivities,
         range,
         setPresetRange,
         setCustomRange,
         refresh: () => {
           const emailToUse = authenticatedUser?.email || gmailEmail || outlookEmail;
-          loadActivities({ email: emailToUse, start: range.start, end: range.end });
+          loadActivities({ email: emailToUse, start: range.start, end: range.end, allRows: needsAllActivities });
         },
         aggregations,
         gmailEmail,
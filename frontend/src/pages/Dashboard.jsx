@@ -6,13 +6,11 @@ import PieBreakdownChart from '../components/common/PieBreakdownChart';
 import ActivityTable from '../components/common/ActivityTable';
 import InsightsPanel from '../components/common/InsightsPanel';
 import SyncSection from '../components/SyncSection';
-import { buildAggregations } from '../utils/aggregations';
 import { fetchInsights } from '../services/api';
 import dayjs from 'dayjs';
 
 function Dashboard() {
   const { aggregations, activities, setPresetRange, setCustomRange, range, loading, error, userEmail, authenticatedUser } = useContext(DataContext);
-  const { summary, charts } = aggregations;
   const [insights, setInsights] = useState([]);
   const [insightsLoading, setInsightsLoading] = useState(false);
   const syncIdentifier = authenticatedUser?.id || authenticatedUser?.email || '';
@@ -58,12 +56,8 @@ function Dashboard() {
     });
   }, [activities, range]);
 
-  // Recalculate aggregations for filtered activities
-  const filteredAggregations = React.useMemo(() => {
-    return buildAggregations({ activities: filteredActivities, range });
-  }, [filteredActivities, range]);
-
-  const { summary: filteredSummary, charts: filteredCharts } = filteredAggregations;
+  // Totals and charts are built server-side for the selected range
+  const { summary: filteredSummary, charts: filteredCharts } = aggregations;
 
   return (
     <div>
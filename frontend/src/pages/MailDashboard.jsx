@@ -1,4 +1,4 @@
-import React, { useContext, useMemo, useState } from 'react';
+import React, { useContext, useEffect, useMemo, useState } from 'react';
 import dayjs from 'dayjs';
 import {
   Bar,
@@ -21,7 +21,13 @@ function formatEmissionDisplay(emissionKg) {
 }
 
 function MailDashboard() {
-  const { activities, aggregations } = useContext(DataContext);
+  const { activities, aggregations, requireAllActivities } = useContext(DataContext);
+
+  // Week/month browsing filters raw rows, so this view needs the full history
+  useEffect(() => {
+    requireAllActivities();
+  }, [requireAllActivities]);
+
   const [viewMode, setViewMode] = useState('week'); // 'week' or 'month'
   const [weekOffset, setWeekOffset] = useState(0);
   const [selectedMonth, setSelectedMonth] = useState(dayjs().format('YYYY-MM'));
@@ -1,4 +1,4 @@
-import React, { useContext, useMemo, useState } from 'react';
+import React, { useContext, useEffect, useMemo, useState } from 'react';
 import dayjs from 'dayjs';
 import ActivityTable from '../components/common/ActivityTable';
 import {
@@ -14,7 +14,13 @@ import { DataContext } from '../context/DataContext';
 import MetricCard from '../components/common/MetricCard';
 
 function MeetingDashboard() {
-  const { activities } = useContext(DataContext);
+  const { activities, requireAllActivities } = useContext(DataContext);
+
+  // Week/month browsing filters raw rows, so this view needs the full history
+  useEffect(() => {
+    requireAllActivities();
+  }, [requireAllActivities]);
+
   const [viewMode, setViewMode] = useState('week');
   const [weekOffset, setWeekOffset] = useState(0);
   const [selectedMonth, setSelectedMonth] = useState(dayjs().format('YYYY-MM'));
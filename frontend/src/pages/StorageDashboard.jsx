@@ -1,11 +1,17 @@
-import React, { useContext, useMemo, useState } from 'react';
+import React, { useContext, useEffect, useMemo, useState } from 'react';
 import dayjs from 'dayjs';
 import { DataContext } from '../context/DataContext';
 import MetricCard from '../components/common/MetricCard';
 import ActivityTable from '../components/common/ActivityTable';
 
 function StorageDashboard() {
-  const { activities, aggregations } = useContext(DataContext);
+  const { activities, aggregations, requireAllActivities } = useContext(DataContext);
+
+  // Week/month browsing filters raw rows, so this view needs the full history
+  useEffect(() => {
+    requireAllActivities();
+  }, [requireAllActivities]);
+
   const [viewMode, setViewMode] = useState('week');
   const [weekOffset, setWeekOffset] = useState(0);
   const [selectedMonth, setSelectedMonth] = useState(dayjs().format('YYYY-MM'));
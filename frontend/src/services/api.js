@@ -10,13 +10,18 @@ function buildQuery(params = {}) {
   return query.toString() ? `?${query.toString()}` : '';
 }
 
-export async function fetchActivities({ userEmail, userId, start, end, limit = 200 }) {
+export async function fetchActivities({ userEmail, userId, start, end, limit = 200, pageToken, activityType, provider, fields }) {
   const query = buildQuery({
     userEmail,
     userId,
     since: start,
     until: end,
     limit,
+    pageToken,
+    activityType,
+    provider,
+    // fields: array or comma-separated list of field paths to project
+    fields: Array.isArray(fields) ? fields.join(',') : fields,
   });
   const url = API_BASE ? `${API_BASE}/api/activities${query}` : `/api/activities${query}`;
   console.log('[API] Fetching activities from:', url);
@@ -37,6 +42,35 @@ export async function fetchActivities({ userEmail, userId, start, end, limit = 2
   return data;
 }
 
+// Follows nextPageToken until the backend reports no more pages
+export async function fetchAllActivities({ pageSize = 500, ...params }) {
+  const activities = [];
+  let pageToken;
+  do {
+    const page = await fetchActivities({ ...params, limit: pageSize, pageToken });
+    activities.push(...(page.activities || []));
+    pageToken = page.nextPageToken;
+  } while (pageToken);
+  return { success: true, count: activities.length, activities };
+}
+
+// Server-side day/week/month buckets and per-type stats (replaces buildAggregations for large ranges)
+export async function fetchActivitySummary({ userEmail, userId, start, end }) {
+  const query = buildQuery({
+    userEmail,
+    userId,
+    since: start,
+    until: end,
+  });
+  const url = API_BASE ? `${API_BASE}/api/activities/summary${query}` : `/api/activities/summary${query}`;
+  const response = await fetch(url);
+  if (!response.ok) {
+    const message = await response.text();
+    throw new Error(message || 'Failed to fetch activity summary');
+  }
+  return response.json();
+}
+
 export async function fetchInsights({ userEmail, userId, period = 'weekly' }) {
   const query = buildQuery({
     userEmail,
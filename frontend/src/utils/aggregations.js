@@ -22,6 +22,45 @@ export function buildAggregations({ activities = [], range }) {
   };
 }
 
+// Maps a GET /api/activities/summary response onto the summary/charts shape of buildAggregations
+export function summaryFromServer(serverSummary) {
+  const totals = serverSummary?.totals || {};
+  const byType = {};
+  Object.entries(totals.byType || {}).forEach(([type, value]) => {
+    byType[type] = { count: value.count || 0, emissionKg: value.emissionKg || 0 };
+  });
+
+  const summary = {
+    totalEmissionKg: round(totals.emissionKg),
+    totalActivities: totals.count || 0,
+    lastActivityAt: serverSummary?.lastActivityAt ? dayjs(serverSummary.lastActivityAt) : null,
+    byType,
+    averageEmailEmissionKg: round(serverSummary?.stats?.email?.avgEmissionKg),
+  };
+
+  const dailySeries = (serverSummary?.buckets?.day || [])
+    .map((bucket) => ({
+      date: bucket.period,
+      emissionKg: round(bucket.emissionKg),
+      count: bucket.count || 0,
+    }))
+    .sort((a, b) => (a.date > b.date ? 1 : -1));
+
+  const typeSeries = Object.entries(byType).map(([type, value]) => ({
+    name: typeLabel(type),
+    emissionKg: round(value.emissionKg),
+    count: value.count,
+  }));
+
+  return {
+    summary,
+    charts: {
+      dailySeries,
+      typeSeries,
+    },
+  };
+}
+
 function buildSummary(activities) {
   if (!activities.length) {
     return {